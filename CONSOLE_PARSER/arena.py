@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import tempfile
+import threading
+from array import array
+
+from blocks import ANSI_ESCAPE_MARK, ANSI_ESCAPE_BYTES_RE, decode_line
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+try:
+    OFFSET_TYPECODE = 'Q'
+    array(OFFSET_TYPECODE)
+except ValueError:
+    # Python 2 has no 'Q', unsigned long is 64 bit on the supported platforms
+    OFFSET_TYPECODE = 'L'
+
+
+class LineArena:
+    """
+    Storage of the buffered console lines: every line is kept once as a
+    (start, end) offsets pair into a single buffer. The buffer is either an
+    external one (e.g. the memory mapped log file) or an own bytearray the
+    lines are copied to.
+    """
+    def __init__(self, data=None):
+        self.owned = data is None
+        self.data = bytearray() if self.owned else data
+        self.starts = array(OFFSET_TYPECODE)
+        self.ends = array(OFFSET_TYPECODE)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, line):
+        """
+        Copy the line to the own buffer and return its index
+        """
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        start = len(self.data)
+        self.data += line
+        return self.add_span(start, len(self.data))
+
+    def add_span(self, start, end):
+        """
+        Register the line located at data[start:end] and return its index
+        """
+        self.starts.append(start)
+        self.ends.append(end)
+        return len(self.starts) - 1
+
+    def add_range(self, start, end):
+        """
+        Register every line of data[start:end] and return their [first, last)
+        index range
+        """
+        first = len(self.starts)
+        data = self.data
+        while start < end:
+            line_end = data.find(b'\n', start, end)
+            line_end = end if line_end < 0 else line_end + 1
+            self.starts.append(start)
+            self.ends.append(line_end)
+            start = line_end
+        return first, len(self.starts)
+
+    def raw_line(self, index):
+        """
+        Return the line as bytes without ANSI escape codes and line endings
+        """
+        raw_line = self.data[self.starts[index]:self.ends[index]]
+        if self.owned:
+            raw_line = bytes(raw_line)
+        if ANSI_ESCAPE_MARK in raw_line:
+            raw_line = ANSI_ESCAPE_BYTES_RE.sub(b'', raw_line)
+        return raw_line.rstrip(b'\r\n')
+
+    def line(self, index):
+        return decode_line(self.raw_line(index))
+
+    def empty(self):
+        """
+        Return a new empty arena over the same external buffer
+        """
+        return LineArena(None if self.owned else self.data)
+
+    def compact(self, views):
+        """
+        Copy the lines of the given views to a new arena and move the views
+        there. The arena itself isn't changed, so the views still referring
+        to it (e.g. blocks being processed) stay valid.
+        """
+        arena = self.empty()
+        for view in views:
+            segments = []
+            for first, last in view.segments:
+                new_first = len(arena)
+                for index in range(first, last):
+                    if self.owned:
+                        arena.add(bytes(self.data[self.starts[index]:self.ends[index]]))
+                    else:
+                        arena.add_span(self.starts[index], self.ends[index])
+                segments.append([new_first, len(arena)])
+            view.arena = arena
+            view.segments = segments
+        return arena
+
+    def nbytes(self):
+        """
+        Memory used by the arena itself (the external buffer isn't counted)
+        """
+        offsets_size = (len(self.starts) + len(self.ends)) * self.starts.itemsize
+        if self.owned:
+            return len(self.data) + offsets_size
+        return offsets_size
+
+
+class BlockView:
+    """
+    Lines of a debug log block: a list of [first, last) line index ranges of
+    the arena, lines are decoded lazily while iterating. A spilled block
+    keeps its lines in a temporary file instead and streams them from there.
+    """
+    def __init__(self, arena):
+        self.arena = arena
+        self.segments = []
+        self.spill_file = None
+        self.line_count = 0
+        self.nbytes = 0
+
+    def append(self, index):
+        if self.segments and self.segments[-1][1] == index:
+            self.segments[-1][1] = index + 1
+        else:
+            self.segments.append([index, index + 1])
+
+    def add(self, line, span=None):
+        """
+        Buffer the (already cleaned) line, span is its location in the
+        external arena buffer if the line isn't to be copied
+        """
+        if self.spill_file is not None:
+            self.spill_file.seek(0, 2)
+            self.spill_file.write(line + b'\n')
+        elif span is not None:
+            self.append(self.arena.add_span(*span))
+        else:
+            self.append(self.arena.add(line))
+        self.line_count += 1
+        self.nbytes += len(line)
+
+    def add_range(self, start, end):
+        """
+        Buffer all lines of the byte range of the external arena buffer
+        """
+        first, last = self.arena.add_range(start, end)
+        if first == last:
+            return
+        if self.segments and self.segments[-1][1] == first:
+            self.segments[-1][1] = last
+        else:
+            self.segments.append([first, last])
+        self.line_count += last - first
+        self.nbytes += end - start
+
+    def spill(self):
+        """
+        Move the buffered lines to a temporary file
+        """
+        spill_file = tempfile.TemporaryFile()
+        for line in self.raw_lines():
+            spill_file.write(line + b'\n')
+        self.spill_file = spill_file
+        self.segments = []
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.segments = []
+
+    def __len__(self):
+        return self.line_count
+
+    def __iter__(self):
+        for line in self.raw_lines():
+            yield decode_line(line)
+
+    def raw_lines(self):
+        """
+        Iterate undecoded lines for processors matching them with bytes
+        regexps and decoding only the captured groups
+        """
+        if self.spill_file is not None:
+            self.spill_file.flush()
+            self.spill_file.seek(0)
+            for line in self.spill_file:
+                yield line[:-1]
+            return
+        raw_line = self.arena.raw_line
+        for first, last in self.segments:
+            for index in range(first, last):
+                yield raw_line(index)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class BlockBuffers:
+    """
+    Buffers of the open debug log blocks with memory limits (in bytes, None
+    for unlimited): a block over block_limit, or the largest one when the
+    open blocks grow over total_limit, is spilled to a temporary file. Limits apply
+    to the arenas owning their data only, lines of the external buffer cost
+    just their offsets. The blocks are added and removed under the lock, so
+    other threads can take a snapshot of them.
+    """
+    def __init__(self, arena, block_limit=None, total_limit=None):
+        self.arena = arena
+        self.block_limit = block_limit
+        self.total_limit = total_limit
+        self.blocks = {}
+        self.spilled_blocks = 0
+        self.lock = threading.Lock()
+
+    def __getitem__(self, block_name):
+        block = self.blocks.get(block_name)
+        if block is None:
+            return BlockView(self.arena)
+        return block
+
+    def __contains__(self, block_name):
+        return block_name in self.blocks
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def add(self, block_name, line, span=None):
+        block = self.blocks.get(block_name)
+        if block is None:
+            block = BlockView(self.arena)
+            with self.lock:
+                self.blocks[block_name] = block
+        block.add(line, span)
+        if not self.arena.owned:
+            return
+        if self.block_limit and block.spill_file is None and block.nbytes > self.block_limit:
+            self.spill(block)
+        if self.total_limit and self.arena.nbytes() > self.total_limit:
+            # Drop the lines of the released blocks first, spill only if the
+            # open blocks keep the arena over the half of the limit (so it
+            # isn't compacted again on the next line)
+            in_memory = self.in_memory()
+            self.arena = self.arena.compact(in_memory)
+            if in_memory and self.arena.nbytes() > self.total_limit // 2:
+                self.spill(max(in_memory, key=lambda b: b.nbytes))
+
+    def restore(self, block_name, lines):
+        """
+        Buffer the lines of an open block read before (e.g. by the parser
+        of a checkpoint). The external buffer doesn't have them, so over
+        one the block is spilled and gets its next lines in the spill file.
+        """
+        block = BlockView(self.arena)
+        with self.lock:
+            self.blocks[block_name] = block
+        if not self.arena.owned:
+            block.spill()
+            self.spilled_blocks += 1
+        for line in lines:
+            block.add(line)
+        return block
+
+    def snapshot(self):
+        """
+        Return sorted (block name, lines, bytes) of the open blocks
+        """
+        with self.lock:
+            return sorted((block_name, len(block), block.nbytes)
+                          for block_name, block in self.blocks.items())
+
+    def in_memory(self):
+        return [b for b in self.blocks.values() if b.spill_file is None]
+
+    def spill(self, block):
+        block.spill()
+        self.spilled_blocks += 1
+        self.arena = self.arena.compact(self.in_memory())
+
+    def detach(self, block_name):
+        """
+        Take the buffer of the ended block out: the next block with the same
+        name starts with an empty buffer, while the detached one stays valid
+        until it's closed. The arena is renewed once no block uses it.
+        """
+        with self.lock:
+            block = self.blocks.pop(block_name, None)
+        if block is None:
+            block = BlockView(self.arena)
+        if not self.in_memory():
+            self.arena = self.arena.empty()
+        return block
+
+    def release(self, block_name):
+        """
+        Free the buffer of the processed block
+        """
+        self.detach(block_name).close()
+
+    def close(self):
+        """
+        Drop the buffers of the blocks which will never end
+        """
+        with self.lock:
+            blocks, self.blocks = self.blocks, {}
+        for block in blocks.values():
+            block.close()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
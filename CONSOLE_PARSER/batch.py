@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import copy
+import glob
+import json
+import time
+import fnmatch
+import logging
+import argparse
+import traceback
+import multiprocessing
+
+from bdsm import BDSM, OPTIONS, CONF_FILE
+from msel import MemorySubsytemEventsLogger
+from registry import load_mission_plugins, mission_options
+
+from benchmark.conf import Conf
+
+logger = logging.getLogger()
+
+CLIENT_DESCRIPTION = """Parse a directory of console logs with a pool of processes"""
+HELPS = {
+    'source': 'directory (searched recursively) or glob of the console logs',
+    'config': 'configuration file',
+    'pattern': 'file name pattern of the logs in the source directory',
+    'workers': 'number of worker processes (all cores by default)',
+    'output': 'JSON lines results file (stdout by default)',
+    'baseboard': 'baseboard of the nodes',
+    'verbose': 'print the parser log (to stderr)'
+}
+
+# Worker state: loaded once per process, not per log
+WORKER_CONF = None
+WORKER_RAM_INFO = None
+
+
+def argument_parsing():
+    """
+    Parse and return command line arguments
+    """
+    parser = argparse.ArgumentParser(description=CLIENT_DESCRIPTION)
+    parser.add_argument('source', help=HELPS['source'])
+    parser.add_argument('-c', '--config', help=HELPS['config'],
+                        default=CONF_FILE)
+    parser.add_argument('-p', '--pattern', help=HELPS['pattern'],
+                        default='*.log')
+    parser.add_argument('-w', '--workers', help=HELPS['workers'], type=int,
+                        default=0)
+    parser.add_argument('-o', '--output', help=HELPS['output'])
+    parser.add_argument('-b', '--baseboard', help=HELPS['baseboard'],
+                        default='MY81-EX0-Y3N')
+    parser.add_argument('-v', '--verbose', help=HELPS['verbose'],
+                        action='store_true')
+    return parser.parse_args()
+
+
+def find_logs(source, pattern):
+    if os.path.isdir(source):
+        logs = []
+        for root, dirs, files in os.walk(source):
+            logs.extend(os.path.join(root, name) for name in fnmatch.filter(files, pattern))
+        return sorted(logs)
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+
+def log_to_stderr(level):
+    # The parser logs to stdout, which is taken by the results here
+    for handler in logger.handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.stream = sys.stderr
+    logger.setLevel(level)
+
+
+def init_worker(config, baseboard, verbose):
+    global WORKER_CONF, WORKER_RAM_INFO
+    log_to_stderr(logging.INFO if verbose else logging.WARNING)
+    # Block processors print their findings, they aren't the results
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+    load_mission_plugins()
+    WORKER_CONF = Conf(mission_options(OPTIONS), config, log=False)
+    WORKER_RAM_INFO = MemorySubsytemEventsLogger(baseboard)
+
+
+def parse_log(path):
+    """
+    Parse one log, failures of the log don't affect the others
+    """
+    started = time.time()
+    result = {'log': path}
+    try:
+        if not os.path.getsize(path):
+            result['status'] = 'empty'
+        else:
+            # Processors fill the node info, every log gets its own copy
+            parser = BDSM(path, WORKER_CONF, copy.deepcopy(WORKER_RAM_INFO))
+            try:
+                result['sessions'] = parser.parse_cached(parser.parse_sessions, 1)
+                result['cached'] = parser.results_cached
+                result['status'] = 'ok'
+            finally:
+                # Don't keep the log mapped until the garbage collector runs
+                parser.dbg_log_data.close()
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = round(time.time() - started, 3)
+    return result
+
+
+def summarize(results, seconds):
+    summary = {
+        'logs': len(results),
+        'seconds': round(seconds, 3),
+        'status': {},
+        'sessions': 0,
+        'cached': 0,
+        'goals_not_reached': 0,
+        'failed_logs': []
+    }
+    for result in results:
+        summary['status'][result['status']] = summary['status'].get(result['status'], 0) + 1
+        if result['status'] == 'error':
+            summary['failed_logs'].append(result['log'])
+        if result.get('cached'):
+            summary['cached'] += 1
+        for session in result.get('sessions', ()):
+            summary['sessions'] += 1
+            summary['goals_not_reached'] += len(session['missing_inputs'])
+    summary['failed_logs'].sort()
+    return summary
+
+
+def run_batch(logs, config, workers=0, baseboard='MY81-EX0-Y3N', verbose=False, output=sys.stdout):
+    """
+    Parse the logs in a pool of processes, write a JSON line per log (in
+    the order they are finished) and the summary line, return the summary
+    """
+    workers = min(workers or multiprocessing.cpu_count(), max(len(logs), 1))
+    logger.info("Parsing {0} logs in {1} processes...".format(len(logs), workers))
+    started = time.time()
+    results = []
+    pool = multiprocessing.Pool(workers, init_worker, (config, baseboard, verbose))
+    try:
+        for result in pool.imap_unordered(parse_log, logs):
+            # Keep only what the summary needs
+            results.append({'log': result['log'], 'status': result['status'],
+                            'cached': result.get('cached', False),
+                            'sessions': result.get('sessions', ())})
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+            if result['status'] == 'error':
+                logger.error(result['log'] + ": " + result['error'])
+    finally:
+        pool.close()
+        pool.join()
+    summary = summarize(results, time.time() - started)
+    output.write(json.dumps({'summary': summary}, sort_keys=True) + '\n')
+    output.flush()
+    return summary
+
+
+if __name__ == '__main__':
+    args = argument_parsing()
+    log_to_stderr(logging.INFO if args.verbose else logging.WARNING)
+    logs = find_logs(args.source, args.pattern)
+    if not logs:
+        logger.error("No logs found in " + args.source)
+        sys.exit(1)
+    if args.output:
+        with open(args.output, 'w') as output:
+            summary = run_batch(logs, args.config, args.workers, args.baseboard, args.verbose, output)
+    else:
+        summary = run_batch(logs, args.config, args.workers, args.baseboard, args.verbose)
+    print("Parsed {0} logs in {1}s: {2}".format(
+        summary['logs'], summary['seconds'], summary['status']), file=sys.stderr)
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
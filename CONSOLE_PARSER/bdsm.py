@@ -4,8 +4,8 @@ from __future__ import print_function
 
 import os
 import sys
+import copy
 import signal
-import fcntl
 
 import argparse
 import logging
@@ -13,30 +13,41 @@ import logging
 import time
 import stat
 import re
-import select
+import itertools
+import multiprocessing
 from collections import defaultdict
-from collections import Counter
+from collections import OrderedDict
+from functools import partial
 
 #from operator import itemgetter
-import yaml
 import json
+import hashlib
 
-# TODO move to separate class
-import serial
-import tty
-import termios
-
+# Importing the missions registers them. Modules of the live sources, the
+# metrics and the profilers are imported when they are used, file mode
+# doesn't pay for them on start.
 from rmt import RMT
 from step import STEP
-from sol import SOL
 from msel import MemorySubsytemEventsLogger
+from logfile import MmapLogfile
+from compressed import CompressedLogfile, detect_compression
+from cache import ResultCache, conf_digest, sources_digest
+from memo import BlockMemo, memoized_block
+from checkpoint import Checkpointer, RawArchive, load_checkpoint
+from grammar import load_grammar
+from blockindex import BlockIndex
+from arena import LineArena, BlockView, BlockBuffers
+from pipeline import BlockPipeline
+from chunkscan import scan_log, stitch_blocks
+from scheduler import TestplanScheduler
+from registry import MISSIONS, ProcessorRegistry, load_mission_plugins, mission_options
+from blocks import LinePrefilter, decode_line
+from blocks import ANSI_ESCAPE_MARK, ANSI_ESCAPE_BYTES_RE, MRC_FATAL_ERROR_BYTES_RE
+from indication import ident_dimm
+from tracering import TraceRing, trace_level, install_dump_handlers, TRACE_BLOCKS, TRACE_LINES
 
-from benchmark.test_result import BasicTestResult
-from benchmark.common import yank_api
 from benchmark.conf import Conf, parse_list, parse_bool
 
-sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
-
 logging.basicConfig(
     level=logging.DEBUG,
     format='[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s',
@@ -50,32 +61,8 @@ environment = {}
 CONF_FILE = 'MRC_parser.ini'
 parser_version = '0.23'
 
-# Intel MRC base blocks
-MRC_BBLOCK_START_RE = re.compile(r'START_([0-9A-Z_]+)')
-MRC_BBLOCK_END_RE = re.compile(r'STOP_([0-9A-Z_]+)')
-
-# Intel MRC iMC blocks functions
-MRC_iMC_BLOCK_START_RE = re.compile(r'(^[A-Z@].*) -- Started')
-MRC_iMC_BLOCK_END_RE = re.compile(r'(^[A-Z@].*) [-]?[=]? ([0-9]+)[ ]?ms')
-
-# Intel SMM handlers sample code
-MRC_SMM_BLOCK_START_RE = re.compile(r'(.*) Hander start!')
-MRC_SMM_BLOCK_END_RE = re.compile(r'(.*) Hander end!')
-
-# UEFI ACPI functions
-#MRC_ACPI_START_RE = re.compile(r'^(.*): Class ID:  [0-9][0-9]')
-MRC_ACPI_START_RE = re.compile(r'^(.*): Class ID:.*')
-MRC_ACPI_END_RE = re.compile(r'^(.*) Exiting...')
-
-# MRC Fatal Error
-MRC_FATAL_ERROR_RE = re.compile(r'Major Code = [0-9]+, Minor Code = [0-9]+')
-
-# Checkpoint regexp (POST codes):
-#Checkpoint Code: Socket 0, 0xBF, 0x00, 0x0000
-POST_CHECKPOINT_RE = re.compile(r'Checkpoint Code: Socket [01], (0x[0-9A-F]+), (0x[0-9A-F]+), (0x[0-9A-F]+)')
-
-SERVER_POWER_ON_RE = re.compile(r'Status Code Available')
-SERVER_POWER_OFF_RE = re.compile(r'SecSMI. S5 Trap')
+# Consoles read as they are written
+LIVE_SOURCES = ('sol', 'das', 'follow')
 
 # OS booted
 RUNTIME_BLOCK_START_MARK = 'OSBootEvent = Success'
@@ -90,8 +77,15 @@ HELPS = {
     'tags': 'append tags to test result',
     'config': 'config file path (default machinegun.ini)',
     'mission': 'a list of activities to reach the goal',
-    'verbose': 'enable verbose output',
+    'verbose': 'log the parser events and the lines of every ended block (trace level blocks)',
     'disable_sending': 'disable API calls and e-mail sending',
+    'index': 'use (and create) the block offset index next to the log file',
+    'only': 'comma separated block processors to run, e.g. process_dimm_info,rmt.process_rmt_results (implies --index)',
+    'resume': 'resume the live session from the checkpoint file',
+    'follow': 'follow the log file written by a console server (like tail -F)',
+    'profile': 'print the time and memory of the block processors and of the line scanning (runs everything in a single thread, without the result cache). The memory is the allocation peak with python 3.9+, before that the growth of the process RSS high-water mark',
+    'profile_dump': 'profile mode writing the cProfile stats (pstats format) to the file too',
+    'boot_profile': 'profiler mode: write the boot phases timing to PREFIX.folded (flame graph stacks) and PREFIX.tsv instead of parsing',
 }
 
 NO_COMPONENT = """Component {model} not found in the benchmark database.
@@ -100,7 +94,59 @@ Please, create component with alias {model} in benchmark manually."""
 
 OPTIONS = { 
     'base' : {
-        'timeout' : (int, 600)
+        'timeout' : (int, 600),
+        # buffered block size limits, bigger blocks are spilled to disk
+        'block_buffer_limit_mb' : (int, 64),
+        'buffers_limit_mb' : (int, 256),
+        # received SOL console output waiting to be split into lines, the
+        # oldest lines are dropped over it
+        'sol_buffer_limit_mb' : (int, 16),
+        # block processors worker threads and the max number of blocks
+        # waiting for processing. With 1 worker the processors and the
+        # supplementary functions they unlock run in it in the block order,
+        # 0 runs them inline, -1 is 1 for the live sources and 0 for the
+        # files. More workers overlap the processors, only safe for the
+        # processors not sharing any state
+        'processor_workers' : (int, -1),
+        'processor_queue' : (int, 16),
+        # processes parsing the boot sessions of a log file, 0 for all cores
+        'session_workers' : (int, 0),
+        # processes scanning chunks of a single log file, 0 for all cores
+        # and 1 to parse boot sessions in parallel instead
+        'scan_workers' : (int, 1),
+        # threads decompressing independent frames of compressed logs, 0
+        # for all cores
+        'decompress_workers' : (int, 0),
+        # results of the parsed logs cache, empty directory disables it
+        'result_cache_dir' : (str, ''),
+        'result_cache_mb' : (int, 512),
+        'result_cache_entries' : (int, 0),
+        # parsed blocks memo (entries in memory), on-disk copy directory
+        # and its size, empty directory keeps it in memory only
+        'block_memo_entries' : (int, 256),
+        'block_memo_dir' : (str, ''),
+        'block_memo_mb' : (int, 64),
+        # parser state snapshots of the live sessions (empty to disable),
+        # min seconds between them and max share of the parsing time
+        'checkpoint_file' : (str, ''),
+        'checkpoint_interval' : (int, 30),
+        'checkpoint_overhead' : (float, 0.01),
+        # append only copy of the live console, resuming replays it
+        'raw_archive' : (str, ''),
+        # console grammar of the BIOS: block markers and records
+        'grammar' : (str, 'Purley_BIOS_grammar.yaml'),
+        # parsing progress metrics: Prometheus endpoint on the local port
+        # (0 disables) or the unix socket, node_exporter textfile collector
+        # file and its refresh interval
+        'metrics_port' : (int, 0),
+        'metrics_socket' : (str, ''),
+        'metrics_textfile' : (str, ''),
+        'metrics_interval' : (int, 15),
+        # parser events kept in memory and dumped on the processor failures,
+        # crashes and SIGUSR1, the ones of the trace level (off, events,
+        # blocks or lines) are logged too
+        'trace_level' : (str, 'off'),
+        'trace_ring_size' : (int, 4096)
     },
     'report': {
         # notification options
@@ -137,6 +183,22 @@ OPTIONS = {
 def tree():
     return defaultdict(tree)
 
+def unbuffered_stdout():
+    """
+    Write the parser output out as soon as it's printed, live consoles are
+    watched while they are parsed
+    """
+    stdout = sys.stdout
+    stdout.flush()
+    try:
+        sys.stdout = os.fdopen(stdout.fileno(), 'w', 0)
+    except ValueError:
+        # Python 3 text streams can't be unbuffered
+        sys.stdout = os.fdopen(stdout.fileno(), 'w', 1)
+    for handler in logger.handlers:
+        if getattr(handler, 'stream', None) is stdout:
+            handler.stream = sys.stdout
+
 def argument_parsing():
     """
     Parse and return command line arguments
@@ -150,13 +212,27 @@ def argument_parsing():
                         action='store_true')
     parser.add_argument('--disable-sending', help=HELPS['disable_sending'],
                         action='store_true', default=False)
+    parser.add_argument('--index', help=HELPS['index'],
+                        action='store_true', default=False)
+    parser.add_argument('--only', help=HELPS['only'], type=parse_list)
+    parser.add_argument('--resume', help=HELPS['resume'],
+                        action='store_true', default=False)
+    parser.add_argument('-f', '--follow', help=HELPS['follow'],
+                        action='store_true', default=False)
+    parser.add_argument('--boot-profile', help=HELPS['boot_profile'],
+                        metavar='PREFIX')
+    parser.add_argument('--profile', help=HELPS['profile'],
+                        action='store_true', default=False)
+    parser.add_argument('--profile-dump', help=HELPS['profile_dump'],
+                        metavar='FILE')
     return parser.parse_args()
 
 class BDSM():
     """
     BIOS Debug Serial Monitor
     """
-    def __init__(self, data_source, conf, ram_info):
+    def __init__(self, data_source, conf, ram_info, follow=False):
+        self.conf = conf
         self.mission = conf['mission']
         self.source = data_source
         self.ram_info = ram_info
@@ -164,24 +240,68 @@ class BDSM():
 
         self.data_source = None
         self.dbg_log_data = []
-        self.processed_funcs = []
         self.mrc_fatal_error_catched = False
         self.first_run_flag = True
-
-        if self.dbg_log_src_is_logfile():
-            self.dbg_log_data = open(self.source)
+        self.block_buffer_limit = conf['base']['block_buffer_limit_mb'] << 20
+        self.buffers_limit = conf['base']['buffers_limit_mb'] << 20
+        self.processor_workers = conf['base']['processor_workers']
+        self.processor_queue = conf['base']['processor_queue']
+        self.session_workers = conf['base']['session_workers']
+        self.decompress_workers = conf['base']['decompress_workers']
+        self.results_cached = False
+        # ProcessorProfiler of the profile mode
+        self.profiler = None
+        self.trace = TraceRing(conf['base']['trace_ring_size'],
+                               trace_level(conf['base']['trace_level']))
+        self.lines_scanned = 0
+        # Parsing state read by the metrics exporter
+        self.metrics = None
+        self.open_blocks = []
+        self.block_buffer = None
+        self.block_pipeline = None
+        self.sol_session = None
+        self.resume_state = None
+        self.grammar = load_grammar(conf['base']['grammar'])
+        # Outlives the boot sessions: the node info blocks rarely change
+        # across reboots
+        block_memo_store = None
+        block_memo_salt = parser_version
+        if conf['base']['block_memo_dir']:
+            block_memo_store = ResultCache(conf['base']['block_memo_dir'],
+                                           conf['base']['block_memo_mb'] << 20)
+            # Stored data of the other parser code must not be reused
+            block_memo_salt = sources_digest([os.path.splitext(os.path.abspath(__file__))[0] + '.py',
+                                              self.grammar.path])
+        self.block_memo = BlockMemo(conf['base']['block_memo_entries'], block_memo_store,
+                                    block_memo_salt)
+
+        if follow:
+            from follow import FollowLogfile
+            # Live source: the file may not even exist yet
+            self.data_source = 'follow'
+            self.dbg_log_data = FollowLogfile(self.source)
+        elif self.dbg_log_src_is_logfile():
+            compression = detect_compression(self.source)
+            if compression:
+                # Streamed, there is no decompressed copy to map
+                self.dbg_log_data = CompressedLogfile(self.source, compression,
+                                                      self.decompress_workers)
+            else:
+                self.dbg_log_data = MmapLogfile(self.source)
         elif self.dbg_log_src_is_console():
             self.data_source = 'das'
             logger.debug('Waiting for data from direct attached serial console' + self.source + '...')
             # TODO: Make do not fumble the console
-            self.dbg_log_data = dasc_data(self.source, 115200)
+            self.dbg_log_data = self.dasc_data(self.source, 115200)
         elif self.dbg_log_src_is_sol():
             # TODO: Rewrite with context manager concept im mind
             self.data_source = 'sol'
     #        sol_output = list()
             try:
+                from sol import SOL
                 logger.info('Trying initialize IPMI SOL session with ' + self.source + '...')
-                sol_session = SOL(self.source)
+                sol_session = SOL(self.source, conf['base']['sol_buffer_limit_mb'] << 20)
+                self.sol_session = sol_session
                 logger.info("SOL initiated!")
                 try:
                     def sigterm_handler(sig, frame):
@@ -191,7 +311,7 @@ class BDSM():
                     if signal.signal(signal.SIGINT, sigterm_handler):
                         logger.info("Signal SIGINT registered to carefully close SOL session")
                     logger.info('Waiting for data from SOL console ' + self.source + '...')
-                    dbg_log_data = sol_session.get_data()
+                    self.dbg_log_data = sol_session.get_data()
                 except Exception as e:
                     print(e)
                     logger.error("Something goes wrong...")
@@ -199,8 +319,11 @@ class BDSM():
             except Exception as e:
                 print(e)
                 logger.error("Can't get SOL data from " + self.source + " source.")
+        if self.processor_workers < 0:
+            # Reading a live console mustn't wait for the processors
+            self.processor_workers = 1 if self.data_source in LIVE_SOURCES else 0
 
-        self.dbg_block_processing_rules = {
+        self.base_processing_rules = {
                 'InitFruStrings' : 'process_chassis_info',
                 'DIMMINFO_TABLE' : 'process_dimm_info',
                 'SOCKET_0_TABLE' : 'process_socket_info',
@@ -213,33 +336,63 @@ class BDSM():
 
         # Goal testplan and processors dependencies rules
         # Base part:
-        self.testplan = {
+        self.base_testplan = {
             'ram_conf_validator' : [ 'process_socket_info', 'process_dimm_info' ],
             'process_chassis_info' : [ 'console_data_dummy' ],
             'process_socket_info' : [ 'console_data_dummy' ],
             'process_dimm_info' : [ 'console_data_dummy' ]
         }
-        for submission in self.mission.keys():
-            if self.mission[submission]:
-                submission = submission.lower()
-                if submission == 'rmt':
-                    self.rmt_guidelines = yaml.load(open(conf['RMT']['guidelines']), Loader=yaml.SafeLoader)
-                    self.rmt = RMT(ram_info, self.rmt_guidelines)
-                    submission_instance = self.rmt
-                    self.dbg_block_processing_rules.update(self.rmt.dbg_block_processing_rules)
-                elif submission == 'step':
-                    self.step = STEP(ram_info)
-                    submission_instance = self.step
-                    self.dbg_block_processing_rules.update(self.step.dbg_block_processing_rules)
-                self.testplan.update({'{0}.result_completeness'.format(submission): ['process_dimm_info']})
-                self.testplan.update(submission_instance.testplan)
-        self.testplan_set = dict((k, set(self.testplan[k])) for k in self.testplan)
+        self.block_ranges = None
+        # Results of the finished boot sessions
+        self.session_results = []
+        self.init_session(0)
 #        print(self.testplan)
 #        sys.exit(0)
 
         #self.dbg_block_processing_rules.update(test_instance.processing_rules)
 
 
+    def init_session(self, session_id):
+        """
+        Start a boot session with its own missions state and testplan
+        """
+        self.session_id = session_id
+        self.trace('session', session_id)
+        registry = ProcessorRegistry()
+        registry.add(self, self.base_processing_rules, self.base_testplan)
+        self.missions = {}
+        for section, enabled in self.mission.items():
+            if not enabled:
+                continue
+            if section not in MISSIONS:
+                logger.error("Unknown mission " + section)
+                continue
+            # Mission instance is available as self.<mission> (e.g. self.rmt)
+            submission_instance = MISSIONS[section].from_conf(self.conf, self.ram_info)
+            setattr(self, section.lower(), submission_instance)
+            self.missions[section.lower()] = submission_instance
+            registry.add_mission(section, submission_instance, ['process_dimm_info'])
+        self.processors = registry.resolve().processors
+        self.dbg_block_processing_rules = registry.dbg_block_processing_rules
+        self.testplan = registry.testplan
+        self.scheduler = TestplanScheduler(self.testplan, self.dbg_block_processing_rules.values())
+
+    def session_result(self):
+        """
+        Outcome of the current boot session as plain data
+        """
+        result = {
+            'session': self.session_id,
+            'completed': sorted(self.scheduler.completed),
+            'missing_inputs': self.scheduler.missing_inputs(),
+            'missions': {}
+        }
+        for prefix, submission_instance in self.missions.items():
+            if hasattr(submission_instance, 'session_result'):
+                result['missions'][prefix] = submission_instance.session_result()
+        # Missions keep their results in defaultdict trees
+        return json.loads(json.dumps(result, default=str))
+
     def dbg_log_src_is_console(self):
         try:
             if stat.S_ISCHR(os.stat(self.source).st_mode):
@@ -262,11 +415,29 @@ class BDSM():
 
     def dbg_log_src_is_logfile(self):
         if os.path.isfile(self.source) and os.path.getsize(self.source) > 0:
-            logger.debug("Source of debug data is plain text file")
+            logger.debug("Source of debug data is log file")
             return True
 
+    def use_block_index(self, processors=None):
+        """
+        Read only the blocks handled by the given processors (all known ones
+        by default) using the block offset index of the log file
+        """
+        if not isinstance(self.dbg_log_data, MmapLogfile):
+            logger.warning("Block index is supported for uncompressed log files only")
+            return False
+        block_names = [name for name, func_name in self.dbg_block_processing_rules.items()
+                       if processors is None or func_name in processors]
+        block_index = BlockIndex(self.source, self.grammar.markers,
+                                 self.grammar.end_marks).load_or_build()
+        self.block_ranges = block_index.ranges(block_names)
+        logger.info("Block index: {0} ranges of {1} blocks".format(
+            len(self.block_ranges), ', '.join(sorted(block_names))))
+        return True
+
     def dasc_data(self, port, baudrate):
         """ Direct attached serial console """
+        import serial
         debug_console = serial.Serial(
             port=port,\
             baudrate=baudrate,\
@@ -275,43 +446,39 @@ class BDSM():
             bytesize=serial.EIGHTBITS,\
             timeout=0)
         while True:
-            yield debug_console.readline()
+            line = debug_console.readline()
+            if line:
+                yield line
         debug_console.close()
 
     def console_data_dummy(self, dbg_log_block, dbg_block_name, socket_id):
         return False
 
+    @memoized_block
+    def parse_chassis_info(self, dbg_log_block, socket_id):
+        """
+        Return the chassis environment values found in the FRU strings
+        """
+        chassis_info = {}
+        for record in self.grammar.records('chassis_info', dbg_log_block):
+            chassis_info[record.record] = record.value
+        return chassis_info
+
     def process_chassis_info(self, dbg_log_block, dbg_block_name, socket_id):
         logger.info("Processing chassis info...")
-        sys_vendor_re = re.compile(r'SystemManufacturer: UpdateStr: (.*)')
-        product_name_re = re.compile(r' SystemProductName: UpdateStr: (.*)')
-        inventory_re = re.compile(r'SystemSerialNumber: UpdateStr: ([0-9]*)')
-        baseboard_vendor_re = re.compile(r'BaseBoardManufacturer: UpdateStr: (.*)')
-        baseboard_model_re = re.compile(r'BaseBoardProductName: UpdateStr: (.*)')
-        environment_regs = {
-            'sys_vendor' : sys_vendor_re,
-            'product_name' : product_name_re,
-            'inventory' : inventory_re,
-            'baseboard_vendor' : baseboard_vendor_re,
-            'baseboard_model' : baseboard_model_re
-            }
-
-        for line in dbg_log_block:
-            for k in environment_regs.keys():
-                match = re.search(environment_regs[k], line)
-                if match is not None:
-                    environment[k] = match.group(1)
-                    break
+        environment.update(self.parse_chassis_info(dbg_log_block, socket_id))
 
-        if environment['inventory'] and environment['baseboard_model']:
+        if environment.get('inventory') and environment.get('baseboard_model'):
             logger.debug(environment)
             logger.info("...success")
-            if test_instance:
-                test_instance.result.environment = environment
             return True
 
-    def process_socket_info(self, dbg_log_block, dbg_block_name, socket_id):
-        logger.info("Processing Socket info table...")
+    @memoized_block
+    def parse_socket_info(self, dbg_log_block, socket_id):
+        """
+        Return socket -> channel -> DIMM -> parameters of the socket table,
+        printed by the processor
+        """
 	dimms_info = tree()
         dimm_params = ['vendor', 'dram_vendor', 'rcd', 'organisation', 'form_factor', 'freq', 'prod_week', 'pn', 'sn']
         header = ''
@@ -344,16 +511,25 @@ class BDSM():
                                 dimms_info[socket_id][channel_id][dimm_id]['timings'] = speed_value_composed[-1]
                                 value = speed_value_composed[0]
 
-			#print(json.dumps(self.ram_info.memory_subsytem_events, indent=2))
-			#print(self.ram_info.memory_subsytem_events)
                         dimms_info[socket_id][channel_id][dimm_id][dimm_params[param_id]] = value
                     else:
                         continue
             param_id += 1
+        return dimms_info
+
+    def process_socket_info(self, dbg_log_block, dbg_block_name, socket_id):
+        logger.info("Processing Socket info table...")
+        dimms_info = self.parse_socket_info(dbg_log_block, socket_id)
         print(json.dumps(dimms_info, indent=2))
 
-    def process_dimm_info(self, dbg_log_block, dbg_block_name, socket_id):
-        logger.info("Processing DIMM info table...")
+    @memoized_block
+    def parse_dimm_info(self, dbg_log_block, socket_id):
+        """
+        Return [path, value] of the RAM info values in the DIMM info table,
+        path is [socket, channel, param] or [socket, key]. Memoized, so it
+        neither logs nor prints: the processor reports what it found.
+        """
+        ram_info_values = OrderedDict()
         ram_info_buffer = []
         for line in dbg_log_block:
             if line.startswith('=' * 10):
@@ -362,18 +538,15 @@ class BDSM():
 
             if line.startswith(' ' * 10):
                 header = line_splitted
-                logger.debug("DIMM info header:" + str(header))
                 continue
 
             ram_info_buffer.append(line_splitted)
             for index, socket in enumerate(header[1:]):
-                print(index)
-                print(socket)
-                if len(socket.split()) > 2:
-                    socket_id = socket.split()[-1]
-                logger.info("Socket:" + str(index) + ' ' + str(socket))
+                if not socket:
+                    continue
+                # Socket N or System column
+                socket_id = socket
                 for line in ram_info_buffer[:-1]:
-                    logger.info("Socket:" + str(index) + ' ' + str(socket_id))
                     if len(line) >= index + 2:
                          value = line[index+1].strip()
                          if not value or value == 'N/A':
@@ -382,23 +555,38 @@ class BDSM():
                              channel_dict = {}
                              channel_raw, param = line[0].split()
                              channel_id = re.sub(r'Ch([0-5])', r"\1", channel_raw)
-                             self.ram_info[socket_id][channel_id][param] = value
+                             ram_info_values[(socket_id, channel_id, param)] = value
                          else:
                             # TODO: laste_session
                              key = line[0]
-                             self.ram_info[socket_id][key] = value
-        return self.ram_info['System']['DDR Freq'].isdigit()
+                             ram_info_values[(socket_id, key)] = value
+        return [[list(path), value] for path, value in ram_info_values.items()]
+
+    def process_dimm_info(self, dbg_log_block, dbg_block_name, socket_id):
+        logger.info("Processing DIMM info table...")
+        ram_info_values = self.parse_dimm_info(dbg_log_block, socket_id)
+        for socket in sorted(set(path[0] for path, value in ram_info_values)):
+            logger.info("Found DIMM info of " + str(socket))
+        logger.debug("DIMM info values: " + str(ram_info_values))
+        for path, value in ram_info_values:
+            node = self.ram_info
+            for step in path[:-1]:
+                node = node[step]
+            node[path[-1]] = value
+        return self.ram_info['System'].get('DDR Freq', '').lstrip('DDR4-').isdigit()
 
     def ram_conf_validator(self):
         logger.debug('Checking RAM info completeness...')
-        node_configuration = conf['node_configuration']
+        node_configuration = self.conf['node_configuration']
+        dimm_labels = self.ram_info.sys_conf['poppulation']
         ram_config_status = {}
-        ec = None
+        components_counter = dict.fromkeys(['sockets_count', 'channels_count', 'dimms_count'], 0)
+        components = []
 
     #    logger.debug("RAM_INFO")
     #    logger.debug(json.dumps(ram_info, indent=2))
         # TODO: rewrite to list comprehension?
-        for s, sconf in ram_info.items():
+        for s, sconf in self.ram_info.items():
             if s.startswith('Socket'):
                 components_counter['sockets_count'] += 1
                 for c, chconf in sconf.items():
@@ -410,8 +598,8 @@ class BDSM():
                                 size, organisation = re.sub(r'([0-9]+)GB\((.*)\)', r"\1,\2", rdimm['Organisation']).split(",")
                                 prod_week_norm = re.sub(r'ww([0-9][0-8]) 20([0-3][0-9])', r"\2\1", rdimm['Prod. week'])
                                 model = '{}_{}'.format(rdimm['PN'], rdimm['RCD vendor'].upper())
-                                slot = dimm_labels[str('{}.{}.{}'.format(s.split()[-1],c.split()[-1],d.split()[-1]))]
-                                ram_info[s][c][d] = {
+                                slot = dimm_labels[s.split()[-1]][c.split()[-1]][d.split()[-1]]
+                                self.ram_info[s][c][d] = {
                                     'type': 'RAM',
                                     'pn': rdimm['PN'],
                                     'model': model,
@@ -426,26 +614,27 @@ class BDSM():
                                     'timings': rdimm['Timings'],
                                     'slot': slot
                                 }
+                                components.append(self.ram_info[s][c][d])
 
         #logger.debug(json.dumps(components_counter, indent=2))
 
-        if conf['checks']['check_homogenity']:
+        if self.conf['checks']['check_homogenity']:
             # Check that all RDIMMs are same
             ram_config_status['homogeneity'] = all(components[0]['model'] == dimm['model'] for dimm in components[1:])
             if not ram_config_status['homogeneity']:
                 ram_rdimm_pns_set = set(dimm['model'] for dimm in components)
                 logger.error("Wrong RAM config: RDIMMs are not the same! Founded: " + ' '.join(ram_rdimm_pns_set))
 
-        if conf['checks']['check_poppulation']:
+        if self.conf['checks']['check_poppulation']:
             # Check DIMM poppulation
             # TODO: add function to validate poppulation if DIMM less than 24 pcs
             ram_config_status['poppulation'] = all(components_counter[x] == node_configuration[x] for x in components_counter.keys())
             if not ram_config_status['poppulation']:
                 logger.error("DIMM poppulation is wrong:\n" + json.dumps(components_counter, indent=2) + "\n, instead POR:\n" + json.dumps(node_configuration, indent=2))
 
-        if conf['checks']['check_frequency']:
+        if self.conf['checks']['check_frequency']:
             # Check frequency
-            ddr_freq = int(ram_info['System']['DDR Freq'].lstrip('DDR4-'))
+            ddr_freq = int(self.ram_info['System']['DDR Freq'].lstrip('DDR4-'))
             if ddr_freq == node_configuration['por_ram_freq']:
                 ram_config_status['ddr_frequency'] = True
             else:
@@ -456,33 +645,15 @@ class BDSM():
             #logger.info('Founded ' + components.values['vendor'] + ' ' + components.values['model'])
             pass
         else:
-            sys.exit(ec)
-
-        if test_instance:
-            test_instance.result.component = components
+            # The goal isn't reached, the errors are logged above
+            return False
 
         return ram_config_status
 
     def parse_memtest_failed(self, data_buffer):
-        LOCATION_KEYS = {
-            'socket': '(?P<socket>[01])',
-            'channel': '(?P<channel>\d|FF)',
-            'dimm': '(?P<dimm>\d|FF)',
-        }
-
-        ERR_MSG = (r'N{socket}\.C{channel}\.D{dimm}(\.R\d)?(\.S\d\d)?:\s*'
-                   '(ERROR:|FAULTY_PARTS_TRACKING:)?\s+(?P<message>[^:!]+?)\s*!*$')
-        ERR_MSG_RE = re.compile(ERR_MSG.format(**LOCATION_KEYS))
-        for line in data_buffer:
-            #rank, line.split(':')
-            #match = ERR_MSG_RE.search(line)
-            failed_rank_match = re.match(r'^N([0-9]).C([0-6]).D([0-3]).R[0-9]: MemTest Failure!', line)
-            #if match:
-            if failed_rank_match:
-                fields = match.groupdict()
-                location = LOC_TMPL.format(**fields)
-                msg = fields['message'].strip()
-                self.err_message[location] = (msg, self.stage)
+        for record in self.grammar.records('memtest', data_buffer):
+            location = 'N{0.socket}.C{0.channel}.D{0.dimm}'.format(record)
+            self.err_message[location] = (record.message.strip(), self.stage)
 
     #    def process_checkpoint(self, line):
     #        checkpoint_match = CHECKPOINT_RE.search(line)
@@ -547,7 +718,7 @@ class BDSM():
     def process_mbist(self, dbg_log_block, dbg_block_name, socket_id):
         logger.info('Processing MemTest...')
 
-        self.dimm_labels = ram_info.sys_conf['poppulation']
+        self.dimm_labels = self.ram_info.sys_conf['poppulation']
         #print(dbg_log_block)
         dbg_log_block_text = "\n".join(dbg_log_block)
         mbist_block = re.compile("(?<!^)\s+(?=.*: MemTest Failure!)(?!.\s)").split(dbg_log_block_text)
@@ -555,7 +726,10 @@ class BDSM():
         timestamp = time.time()
         if mbist_block:
             for memfail in mbist_block:
-                mbist_part, warn_part = memfail.split('\n\n')
+                if '\n\n' not in memfail:
+                    # No enhanced warning after the failure
+                    continue
+                mbist_part, warn_part = memfail.split('\n\n', 1)
                 self.parse_enhanced_warning(warn_part, timestamp)
         elif enchanced_warning:
             parse_enhanced_warning(warn_part)
@@ -563,79 +737,168 @@ class BDSM():
             logger.info("Memory test passed without any issues")
 
     def process_training_info(self, dbg_log_block, dbg_block_name, socket_id):
-        for line in dbg_log_block:
-            failed_rank_match = re.match(r'.*(N[0-9].C[0-6].D[0-3].R[0-9]).S[01][0-9]: Failed RdDqDqs', line)
-            if failed_rank_match:
-                failed_device = failed_rank_match.group(1)
-                print('Founded training error ' + failed_device)
-                ident_dimm(failed_device,'critical')
+        for record in self.grammar.records('training_info', dbg_log_block):
+            print('Founded training error ' + record.device)
+            ident_dimm(record.device,'critical')
 
     def process_smm_ce_handler(self, dbg_log_block, dbg_block_name, socket_id):
         logger.info("Processing Runtime SMM handlers output...")
     #    print(dbg_log_block)
-        for line in dbg_log_block:
-            failed_rank_match = re.match(r'Last Err Info Node=([0-9]) ddrch=([0-9]] dimm=([0]) rank=([1])', line)
-            if failed_rank_match:
-                failed_device = failed_rank_match.group(1)
-                print('Founded training error ' + failed_device)
-                ident_dimm(failed_device,'critical')
+        for record in self.grammar.records('smm_ce_handler', dbg_log_block):
+            failed_device = 'N{0.node}.C{0.channel}.D{0.dimm}.R{0.rank}'.format(record)
+            print('Founded training error ' + failed_device)
+            ident_dimm(failed_device,'critical')
 
     def resolve_dependecies(self):
-        #import pdb; pdb.set_trace()
-        print("TESTPLAN_GEN_DICT: " + str(self.testplan_set))
-        logger.debug("Current processed func: " + str(set(self.processed_funcs)))
-        # values not in keys (items without dep)
-        funcs_wo_deps=set(i for v in self.testplan_set.values() for i in v)-set(self.testplan_set.keys())
-
-        for p in self.processed_funcs:
-            for k in self.testplan_set.keys():
-                if k == p:
-                    logger.debug("Processed func set:" + str(self.testplan_set[k]))
-                    self.testplan_set.pop(k, None)
-
-
-#        print("ITEMS_WO_DEPS_VALUES: " + str(funcs_wo_deps) + " TYPE: " + str(type(funcs_wo_deps)))
-        # and keys without value (items without dep)
-        funcs_wo_deps.update(k for k, v in self.testplan_set.items() if not v)
-#        print("ITEMS_WO_DEPS_KEYS: " + str(funcs_wo_deps))
-#        print("ITEMS_TO_DO: " + str(funcs_wo_deps))
-#        print("PROCESSED_FUNCS: " + str(self.processed_funcs))
-#        print("ITEMS_TO_DO(STILL): " + str(funcs_wo_deps) + "; LENGHT: " + str(len(funcs_wo_deps)))
-        self.testplan_set=dict(((k, set(v)-set(self.processed_funcs)) for k, v in self.testplan_set.items() if v))
-#        print("TESTPLAN_GEN_DICT_CLEANED: " + str(testplan_set))
-        if len(funcs_wo_deps) != 0 and next(iter(funcs_wo_deps)) is not None:
-            for supplementary_func in funcs_wo_deps:
-                print("SUPPLEMENTARY_FUNC:" + supplementary_func)
-                if self.exec_func_by_name(supplementary_func, None, None, None ):
-                    logger.debug(str(supplementary_func) + " just passed")
-                    self.processed_funcs.append(supplementary_func)
+        """
+        Run the supplementary functions whose dependencies are completed
+        """
+        self.scheduler.run_ready(self.exec_supplementary_func)
+
+    def exec_supplementary_func(self, func_name):
+        self.trace('supplementary', func_name)
+        try:
+            passed = self.exec_func_by_name(func_name, None, None, None)
+        except Exception:
+            # Failed like returning False, it's retried on the new data
+            logger.exception("Supplementary function {0} failed".format(func_name))
+            return False
+        if passed:
+            logger.debug(str(func_name) + " just passed")
+            return True
+        return False
 
     def exec_func_by_name(self, func_name, block_buffer, block_name, socket_id):
-        print("FUNC NAME:")
-        print(func_name)
-        print(type(func_name))
-        if len(func_name.split('.')) == 2:
-            class_name, func_name = func_name.split('.')
-            klass = eval('self.' + class_name)
-        else:
-            klass = self
-        func = getattr(klass, func_name, None)
-        if func:
-            return func(self.block_buffer[block_name], block_name, socket_id)
-        else:
+        func = self.processors.get(func_name)
+        if func is None:
             return False
-        
+        if block_buffer is None:
+            block_buffer = self.block_buffer[block_name]
+        try:
+            if self.profiler is not None:
+                return self.profiler.call(func_name, func, block_buffer, block_name, socket_id)
+            return func(block_buffer, block_name, socket_id)
+        except Exception as e:
+            self.trace('failed', func_name, e)
+            self.trace.dump("{0} failed on block {1}".format(func_name, block_name))
+            raise
+
+    def complete_block(self, func_name, result):
+        """
+        Completion of a processed block, the block pipeline runs it in the
+        thread of the processors: the functions depending on the processor
+        get their chance
+        """
+        self.scheduler.complete(func_name)
+        # Check for possibility to run supplimentary functions and execute them if possible
+        if self.testplan.keys():
+            self.resolve_dependecies()
+
+    def deliver_processed_blocks(self, wait=False):
+        """
+        Collect the processed and completed blocks in the block order.
+        Returns False when there is no testplan and parsing has to stop.
+        """
+        for func_name, block, block_name, result, failed in self.block_pipeline.completed(wait):
+            # The block is processed, its lines aren't needed anymore
+            block.close()
+            if failed:
+                # The functions depending on it wait for its next block
+                continue
+            if not self.testplan.keys():
+                return False
+        return True
+
+    def dispatch_block(self, block_name, block):
+        """
+        Hand the ended block to its processor. Returns False when parsing has
+        to stop.
+        """
+        func_name = self.dbg_block_processing_rules[block_name]
+        self.trace('block_end', block_name, len(block))
+        self.trace('processor', func_name, block_name)
+        self.trace.block(block_name, block)
+        socket_id = re.sub(r'\D', "", block_name)
+        if not socket_id:
+            socket_id = None
+        #try:
+        # Processing goes on in the background, reading doesn't wait for it
+        self.block_pipeline.submit(partial(self.exec_func_by_name, func_name),
+                                   block, block_name, socket_id, func_name, self.complete_block)
+#        except Exception, e:
+#            #logger.info("Failed to process " + str(current_processing_block_name) + " with func.: " + str(func) + ":" )
+#            logger.info("Failed to process {} with func {}, raised: {}".format(current_processing_block_name, func_name, e))
+#            pass
+        return self.deliver_processed_blocks()
+
+    def server_powered_on(self):
+        """
+        Returns True if the power on started a new boot session
+        """
+        if self.first_run_flag:
+            self.first_run_flag = False
+            logger.info("Server just powered on. Initialized new job session.")
+            return False
+        logger.info("Server just restarted. Boot session {0} is started.".format(
+            self.session_id + 1))
+        # TODO 1. Check reason of restart
+        self.finish_session()
+        self.block_buffer.close()
+        self.block_buffer = BlockBuffers(self.block_buffer.arena.empty(),
+                                         self.block_buffer_limit, self.buffers_limit)
+        self.init_session(self.session_id + 1)
+        return True
+
+    def server_powered_off(self):
+        logger.info("Server just powered off. Job session finished.")
+        # TODO flush buffers and may be send the job result
+
+    def parse_debug_log_chunked(self, workers=None):
+        """
+        Parse a log file scanning its chunks in parallel processes: the
+        workers classify the candidate lines, the blocks are stitched from
+        them in order and processed the same way parse_debug_log does
+        """
+        if not isinstance(self.dbg_log_data, MmapLogfile):
+            logger.warning("Chunked scanning is supported for uncompressed log files only")
+            return self.parse_debug_log()
+        workers = workers or multiprocessing.cpu_count()
+        line_prefilter = LinePrefilter(self.dbg_block_processing_rules.keys(), self.grammar.markers)
+        self.line_arena = LineArena(self.dbg_log_data.data)
+        self.block_buffer = BlockBuffers(self.line_arena, self.block_buffer_limit,
+                                         self.buffers_limit)
+        self.block_pipeline = BlockPipeline(self.processor_workers, self.processor_queue)
+
+        events = scan_log(self.source, line_prefilter.literals, workers, self.block_ranges,
+                          self.grammar.markers)
+        for action in stitch_blocks(events, self.dbg_block_processing_rules):
+            if action[0] == 'power_on':
+                self.server_powered_on()
+            elif action[0] == 'power_off':
+                self.server_powered_off()
+            else:
+                block_name, ranges = action[1:]
+                block = BlockView(self.block_buffer.arena)
+                for start, end in ranges:
+                    block.add_range(start, end)
+                if not self.dispatch_block(block_name, block):
+                    break
+
+        self.finish_session()
+        self.block_pipeline.close()
+        return self.session_results
 
     def parse_debug_log(self):
         """
         Parse Serial Debug Log for RDIMM/DRAM errors and call specific handlers 
         """
         func_counter = defaultdict(int)
-        self.block_buffer = defaultdict(list)
-        block_processing_queue = []
+        block_processing_queue = self.open_blocks = []
         mrc_block_name = ''
         current_processing_block_name = ''
         current_processing_block_ended = False
+        # Checked for every line, the trace level is fixed while parsing
+        trace_lines = self.trace.level >= TRACE_LINES
 
         def wait_data(timeout):
             if self.data_source in ('sol', 'das'):
@@ -643,9 +906,58 @@ class BDSM():
                 print('.')
                 time.sleep(1)
 
+        line_prefilter = LinePrefilter(self.dbg_block_processing_rules.keys(), self.grammar.markers)
+
+        if isinstance(self.dbg_log_data, MmapLogfile):
+            mmap_source = self.dbg_log_data
+            dbg_log_lines = mmap_source.lines(line_prefilter.literals, block_processing_queue,
+                                              self.block_ranges)
+            # Buffered lines are kept as offsets into the mapped file
+            self.line_arena = LineArena(mmap_source.data)
+        else:
+            mmap_source = None
+            dbg_log_lines = self.dbg_log_data
+            self.line_arena = LineArena()
+        self.block_buffer = BlockBuffers(self.line_arena, self.block_buffer_limit,
+                                         self.buffers_limit)
+
+        def buffer_line(block_name, line):
+            span = mmap_source.line_span if mmap_source else None
+            self.block_buffer.add(block_name, line, span)
+
+        self.block_pipeline = BlockPipeline(self.processor_workers, self.processor_queue)
+
+        # Live sessions can't be read again, their progress is kept
+        checkpointer = None
+        raw_archive = None
+        if self.data_source in LIVE_SOURCES:
+            # A followed file is an archive by itself
+            if self.conf['base']['raw_archive'] and self.data_source != 'follow':
+                raw_archive = RawArchive(self.conf['base']['raw_archive'])
+                dbg_log_lines = raw_archive.tee(dbg_log_lines)
+            if self.conf['base']['checkpoint_file']:
+                checkpointer = Checkpointer(self.conf['base']['checkpoint_file'],
+                                            self.conf['base']['checkpoint_interval'],
+                                            self.conf['base']['checkpoint_overhead'])
+        if self.resume_state is not None:
+            for block_name, block_end_re in self.resume_state['open_blocks']:
+                block_processing_queue.append({block_name: block_end_re})
+            for block_name, lines in self.resume_state['buffers']:
+                self.block_buffer.restore(block_name, lines)
+            archive_offset = self.resume_state['archive_offset']
+            if raw_archive is not None and archive_offset is not None:
+                # Received after the checkpoint, but not parsed
+                dbg_log_lines = itertools.chain(raw_archive.replay(archive_offset), dbg_log_lines)
+            self.resume_state = None
+
+        if self.metrics is not None:
+            dbg_log_lines = self.metrics.meter(dbg_log_lines, self.source)
+
         logger.info('Parsing data from source ' + self.source + '...')
 
-        for line in self.dbg_log_data:
+        for line in dbg_log_lines:
+            if checkpointer is not None and checkpointer.due():
+                self.save_checkpoint(checkpointer, block_processing_queue, raw_archive)
     #        if not dbg_log_data:
     #            if wait_data(conf['base']['timeout']):
     #                continue
@@ -668,46 +980,40 @@ class BDSM():
     #            print(dbg_log_data)
     #            time.sleep(3)
     #            continue
-            ansi_escape = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
-            line = ansi_escape.sub('', line).rstrip('\r\n')
+            # Lines stay raw bytes, only block names and the lines read by
+            # the block processors get decoded
+            if ANSI_ESCAPE_MARK in line:
+                line = ANSI_ESCAPE_BYTES_RE.sub(b'', line)
+            line = line.rstrip(b'\r\n')
+
+            # Fast path: the line can't start, stop or break any block
+            if not line_prefilter.is_candidate(line):
+                if block_processing_queue:
+                    current_processing_block_name = ''.join(block_processing_queue[-1].keys())
+                    if trace_lines:
+                        logger.debug("TRACE Line of block " + current_processing_block_name)
+                    buffer_line(current_processing_block_name, line)
+                continue
 
             dbg_block_name = ''
-            if SERVER_POWER_ON_RE.match(line):
-                if self.first_run_flag:
-                    first_run_flag = False
-                    logger.info("Server just powered on. Initialized new job session.")
-                else:
-                    logger.info("Server just restarted. #TODO: Check reason:")
-                    # TODO 1. Check reason of restart
-
-            if SERVER_POWER_OFF_RE.match(line):
-                logger.info("Server just powered off. Job session finished.")
-                # TODO flush buffers and may be send the job result
-
-            if MRC_ACPI_START_RE.match(line):
-                dbg_block_name = MRC_ACPI_START_RE.match(line).group(1)
-                logger.debug("Founded ACPI BIOS block: " + dbg_block_name)
-                dbg_block_end_re = MRC_ACPI_END_RE
-
-            if MRC_BBLOCK_START_RE.match(line):
-                dbg_block_name = MRC_BBLOCK_START_RE.match(line).group(1)
-                logger.debug("Founded AMI BIOS base block: " + dbg_block_name)
-                dbg_block_end_re = MRC_BBLOCK_END_RE
-
-            if MRC_iMC_BLOCK_START_RE.match(line):
-                dbg_block_name = MRC_iMC_BLOCK_START_RE.match(line).group(1)
-                logger.debug("Founded MRC block: " + dbg_block_name)
-                dbg_block_end_re = MRC_iMC_BLOCK_END_RE
-
-            if MRC_SMM_BLOCK_START_RE.match(line):
-                dbg_block_name = MRC_SMM_BLOCK_START_RE.match(line).group(1)
-                logger.debug("Founded AMI BIOS SMM block: " + dbg_block_name)
-                dbg_block_end_re = MRC_SMM_BLOCK_END_RE
+            boundary = self.grammar.matcher.classify(line)
+            kind = boundary.kind if boundary else None
+            if kind == 'power_on':
+                if self.server_powered_on():
+                    # Blocks left open by the previous boot will never end
+                    del block_processing_queue[:]
+            elif kind == 'power_off':
+                self.server_powered_off()
+            elif kind and boundary.name:
+                dbg_block_name = boundary.name
+                logger.debug("Founded " + boundary.description + ": " + dbg_block_name)
+                dbg_block_end_re = boundary.end_re
 
             if dbg_block_name:
                 try:
                     block_processor_name = self.dbg_block_processing_rules[dbg_block_name]
                     block_processing_queue.append({dbg_block_name:dbg_block_end_re})
+                    self.trace('block_start', dbg_block_name)
     #                print("ADDED BLOCK: " + str(block_processing_queue))
                 except KeyError as e:
                     pass
@@ -715,63 +1021,386 @@ class BDSM():
             else:
                 if block_processing_queue:
                     current_processing_block_ended = False
-                    if MRC_FATAL_ERROR_RE.match(line):
-                        mrc_fatal_error_catched = True
                     current_processing_block_name = ''.join(block_processing_queue[-1].keys())
-                    print("CURRENT_PROC_BLOCK_NAME: " + str(current_processing_block_name))
+                    if MRC_FATAL_ERROR_BYTES_RE.match(line):
+                        mrc_fatal_error_catched = True
+                        self.trace('fatal_error', current_processing_block_name)
+                    if trace_lines:
+                        logger.debug("TRACE Line of block " + current_processing_block_name)
                     current_processing_block_end_re = block_processing_queue[-1][current_processing_block_name]
     #                print(current_processing_block_end_re.pattern)
                     founded_stop_block_mark = current_processing_block_end_re.match(line)
                     if founded_stop_block_mark:
-                        if founded_stop_block_mark.group(1) == current_processing_block_name:
+                        if decode_line(founded_stop_block_mark.group(1)) == current_processing_block_name:
                             current_processing_block_ended = True
                     if self.mrc_fatal_error_catched or current_processing_block_ended:
                         if self.dbg_block_processing_rules[current_processing_block_name]:
-                            func_name = self.dbg_block_processing_rules[current_processing_block_name]
-                            print("CURRENT_FUNC_NAME: " + str(func_name))
-                            socket_id = re.sub(r'\D', "", current_processing_block_name)
-                            if not socket_id:
-                                socket_id = None
-                            #try:
-                            print("BUFFER:")
-                            print(self.block_buffer[current_processing_block_name])
-                            self.exec_func_by_name(func_name, self.block_buffer[current_processing_block_name], current_processing_block_name, socket_id)
-                            self.processed_funcs.append(func_name)
+                            block = self.block_buffer.detach(current_processing_block_name)
 #                           print("BEFORE: " + str(block_processing_queue[-1].keys()))
                             block_processing_queue.pop()
                             mrc_fatal_error_catched = False
-#                            except Exception, e:
-#                                #logger.info("Failed to process " + str(current_processing_block_name) + " with func.: " + str(func) + ":" )
-#                                logger.info("Failed to process {} with func {}, raised: {}".format(current_processing_block_name, func_name, e))
-#                                pass
-                            # Check for possibility to run supplimentary functions and execute them if possible
-                            if self.testplan.keys():
-                                self.resolve_dependecies()
-                            else:
+                            if not self.dispatch_block(current_processing_block_name, block):
                                 break
                     else:
-                        self.block_buffer[current_processing_block_name].append(line)
-
-        n = 0
-        if self.testplan_set:
-            logger.debug("Last chance to reach the goal: " + str(self.testplan_set))
-            self.testplan_set.pop('console_data_dummy', None)
-            while self.testplan_set:
-                self.resolve_dependecies()
-                n += 1
-                if n > 10:
-                    logger.error("Failed! Not enough data for accomplish the goals!")
-                    logger.error(self.testplan_set.keys())
-                    break
+                        buffer_line(current_processing_block_name, line)
+
+        self.finish_session()
+        self.block_pipeline.close()
+        self.block_buffer.close()
+        if checkpointer is not None:
+            checkpointer.discard()
+        if raw_archive is not None:
+            raw_archive.close()
+
+        if isinstance(self.dbg_log_data, MmapLogfile):
+            line_prefilter.lines_seen += self.dbg_log_data.lines_skipped
+            line_prefilter.lines_rejected += self.dbg_log_data.lines_skipped
+            logger.info("Skipped {0} bytes of {1} without decoding".format(
+                self.dbg_log_data.bytes_skipped, self.dbg_log_data.size))
+        elif isinstance(self.dbg_log_data, CompressedLogfile):
+            logger.info("Decompressed {0} bytes of {1} log".format(
+                self.dbg_log_data.bytes_decompressed, self.dbg_log_data.compression))
+        logger.info("Prefilter rejected {0:.1%} of {1} lines".format(
+            line_prefilter.rejected_ratio(), line_prefilter.lines_seen))
+        self.lines_scanned += line_prefilter.lines_seen
+        if self.block_buffer.spilled_blocks:
+            logger.info("{0} block buffers were spilled to disk".format(
+                self.block_buffer.spilled_blocks))
+
+    def save_checkpoint(self, checkpointer, block_processing_queue, raw_archive=None):
+        """
+        Snapshot the parser state before the next line. The dispatched
+        blocks are delivered first, so no work is in flight.
+        """
+        self.deliver_processed_blocks(wait=True)
+        open_blocks = [(block_name, block_end_re)
+                       for open_block in block_processing_queue
+                       for block_name, block_end_re in open_block.items()]
+        state = {
+            'version': parser_version,
+            'source': self.source,
+            'session_id': self.session_id,
+            'first_run_flag': self.first_run_flag,
+            'mrc_fatal_error_catched': self.mrc_fatal_error_catched,
+            'session_results': self.session_results,
+            'scheduler': self.scheduler,
+            'missions': dict((prefix, submission_instance.checkpoint_state())
+                             for prefix, submission_instance in self.missions.items()
+                             if hasattr(submission_instance, 'checkpoint_state')),
+            'ram_info': self.ram_info,
+            'environment': environment,
+            'open_blocks': open_blocks,
+            'buffers': [(block_name, list(self.block_buffer[block_name].raw_lines()))
+                        for block_name in set(block_name for block_name, block_end_re in open_blocks)],
+            'archive_offset': raw_archive.line_start if raw_archive is not None else None,
+            'follow_position': (self.dbg_log_data.position()
+                                if self.data_source == 'follow' else None)
+        }
+        checkpointer.save(state)
+
+    def resume(self, path):
+        """
+        Restore the parser state of the checkpoint, parsing continues from
+        it (and from the raw archive tail, if there is one)
+        """
+        state = load_checkpoint(path)
+        if state['version'] != parser_version or state['source'] != self.source:
+            logger.warning("Checkpoint {0} of {1} (parser {2}) doesn't match, starting over".format(
+                path, state['source'], state['version']))
+            return False
+        self.ram_info = state['ram_info']
+        environment.clear()
+        environment.update(state['environment'])
+        self.init_session(state['session_id'])
+        self.scheduler = state['scheduler']
+        for prefix, mission_state in state['missions'].items():
+            if prefix in self.missions:
+                self.missions[prefix].restore_state(mission_state)
+        self.first_run_flag = state['first_run_flag']
+        self.mrc_fatal_error_catched = state['mrc_fatal_error_catched']
+        self.session_results = state['session_results']
+        if state['follow_position'] is not None and self.data_source == 'follow':
+            self.dbg_log_data.start_at(*state['follow_position'])
+        self.resume_state = state
+        logger.info("Resumed boot session {0} with {1} open blocks from {2}".format(
+            state['session_id'], len(state['open_blocks']), path))
+        return True
+
+    def finish_session(self):
+        """
+        Complete the processing of the boot session and keep its result
+        """
+        self.deliver_processed_blocks(wait=True)
+        if self.scheduler.unfinished():
+            logger.debug("Last chance to reach the goal: " + str(self.scheduler.unfinished()))
+            self.scheduler.finish(self.exec_supplementary_func)
+            missing_inputs = self.scheduler.missing_inputs()
+            if missing_inputs:
+                logger.error("Failed! Not enough data for accomplish the goals!")
+                for goal, inputs in sorted(missing_inputs.items()):
+                    logger.error(goal + " is missing: " + ', '.join(inputs))
+        self.session_results.append(self.session_result())
+
+    def profile_boot(self, prefix):
+        """
+        Build the boot phases timelines of the log (MRC steps, POST
+        checkpoints and START_/STOP_ blocks) and write them out
+        """
+        from bootprof import BootProfiler, BOOT_PROFILE_RECORDS
+        profiler = BootProfiler(self.grammar.record_sets[BOOT_PROFILE_RECORDS])
+        boot_phases = profiler.profile(self.dbg_log_data)
+        profiler.write(prefix)
+        return boot_phases
+
+    def start_metrics(self):
+        """
+        Export the parsing metrics if any of their endpoints is configured,
+        returns the MetricsExporter to close or None
+        """
+        base = self.conf['base']
+        if not (base['metrics_port'] or base['metrics_socket'] or base['metrics_textfile']):
+            return None
+        from metrics import ParserMetrics, MetricsExporter
+        self.metrics = ParserMetrics(self)
+        return MetricsExporter(self.metrics, base['metrics_port'], base['metrics_socket'],
+                               base['metrics_textfile'], base['metrics_interval'])
+
+    def session_ranges(self):
+        """
+        Split the log file into the boot sessions byte ranges, every session
+        but the first one starts with the power on line
+        """
+        power_on_mark = self.grammar.marker_literal('power_on')
+        log = MmapLogfile(self.source)
+        session_starts = []
+        for line in log.lines([power_on_mark.encode('utf-8')], ()):
+            if ANSI_ESCAPE_MARK in line:
+                line = ANSI_ESCAPE_BYTES_RE.sub(b'', line)
+            boundary = self.grammar.matcher.classify(line.rstrip(b'\r\n'))
+            if boundary and boundary.kind == 'power_on':
+                session_starts.append(log.line_span[0])
+        log.close()
+        bounds = [0] + session_starts[1:] + [self.dbg_log_data.size]
+        block_ranges = self.block_ranges
+        if block_ranges is None:
+            block_ranges = [(0, self.dbg_log_data.size)]
+        sessions = []
+        for session_start, session_end in zip(bounds[:-1], bounds[1:]):
+            sessions.append([(max(start, session_start), min(end, session_end))
+                             for start, end in block_ranges
+                             if start < session_end and end > session_start])
+        return sessions
+
+    def parse_sessions(self, workers=None):
+        """
+        Parse the boot sessions of the log file in parallel processes (one
+        per core if workers isn't given) and return the session results
+        in the boot order. Other sources are parsed sequentially.
+        """
+        if not isinstance(self.dbg_log_data, MmapLogfile):
+            self.parse_debug_log()
+            return self.session_results
+        sessions = self.session_ranges()
+        workers = min(workers or multiprocessing.cpu_count(), len(sessions))
+        if workers < 2:
+            self.parse_debug_log()
+            return self.session_results
+
+        logger.info("Parsing {0} boot sessions in {1} processes...".format(len(sessions), workers))
+        # State of the node before the sessions, each worker starts from it
+        ram_info_before = copy.deepcopy(vars(self.ram_info))
+        environment_before = copy.deepcopy(environment)
+        global SESSION_PARSER, SESSION_STATE
+        SESSION_PARSER = self
+        SESSION_STATE = (ram_info_before, environment_before)
+        # Workers get the parser by forking, so it's never pickled
+        if hasattr(multiprocessing, 'get_context'):
+            pool = multiprocessing.get_context('fork').Pool(workers)
+        else:
+            pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(parse_session, list(enumerate(sessions)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            SESSION_PARSER = None
+            SESSION_STATE = None
+        # The processors filled the node info in the workers: merge it the
+        # way the sessions would have updated it one after another, the
+        # missions and the scheduler are the ones of the last session
+        for session_state in results:
+            merge_state(vars(self.ram_info), ram_info_before, session_state['ram_info'])
+            merge_state(environment, environment_before, session_state['environment'])
+        last_state = results[-1]
+        self.first_run_flag = last_state['first_run_flag']
+        self.init_session(len(sessions) - 1)
+        self.scheduler = last_state['scheduler']
+        for prefix, mission_state in last_state['missions'].items():
+            if prefix in self.missions:
+                self.missions[prefix].restore_state(mission_state)
+        self.session_results = [result for session_state in results
+                                for result in session_state['session_results']]
+        return self.session_results
+
+
+    def result_cache_key(self, cache):
+        """
+        Digest of everything the results depend on: the log contents, the
+        parser code and version, the effective configuration with the YAML
+        files it names, the platform spec, the grammar and the blocks read
+        """
+        parser_dir = os.path.dirname(os.path.abspath(__file__))
+        sources = [os.path.join(parser_dir, name) for name in os.listdir(parser_dir)
+                   if name.endswith('.py')]
+        for klass in MISSIONS.values():
+            module_file = getattr(sys.modules.get(klass.__module__), '__file__', None)
+            if module_file:
+                sources.append(os.path.splitext(module_file)[0] + '.py')
+        sources = [source for source in sources if os.path.isfile(source)]
+        spec_file = 'spec_{0}.yaml'.format(getattr(self.ram_info, 'baseboard', None))
+        parts = [
+            cache.log_digest(self.source),
+            parser_version,
+            sources_digest(sources),
+            conf_digest(self.conf, ['mission', 'checks', 'node_configuration'] + list(MISSIONS)),
+            sources_digest([spec_file] if os.path.isfile(spec_file) else []),
+            sources_digest([self.grammar.path]),
+            self.block_ranges
+        ]
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def parse_cached(self, parse, *args):
+        """
+        Return the session results of the log file from the result cache,
+        or parse it with parse(*args) and cache the session results, the
+        node info and the chassis environment. Other sources are never cached.
+        """
+        cache = ResultCache.from_conf(self.conf)
+        if cache is None or not isinstance(self.dbg_log_data, (MmapLogfile, CompressedLogfile)):
+            return parse(*args)
+        key = self.result_cache_key(cache)
+        cached = cache.get(key)
+        # Entries without the environment are of the parsers losing the
+        # node state of the session workers
+        if cached is not None and 'environment' in cached:
+            logger.info("Results of {0} are taken from the result cache".format(self.source))
+            self.ram_info.restore(cached['ram_info'])
+            environment.clear()
+            environment.update(cached['environment'])
+            self.session_results = cached['session_results']
+            self.results_cached = True
+            return self.session_results
+        session_results = parse(*args)
+        # The node state is the one of this parser, the session workers
+        # hand theirs back to it (parse_sessions)
+        cache.put(key, {
+            'session_results': session_results,
+            'ram_info': vars(self.ram_info),
+            'environment': environment
+        })
+        return session_results
+
+
+def merge_state(target, before, update):
+    """
+    Merge the update of the before state (a plain data tree) into target in
+    place: mappings are merged key by key, lists get the items appended to
+    the before ones and the other values are replaced
+    """
+    for key, value in update.items():
+        current = target.get(key)
+        previous = before.get(key) if isinstance(before, dict) else None
+        if isinstance(value, dict) and isinstance(current, dict):
+            merge_state(current, previous if isinstance(previous, dict) else {}, value)
+        elif isinstance(value, list) and isinstance(current, list):
+            current.extend(value[len(previous) if isinstance(previous, list) else 0:])
+        else:
+            target[key] = value
+
+
+# Parser forked to the session workers and its node info and environment
+# before the sessions
+SESSION_PARSER = None
+SESSION_STATE = None
+
+def parse_session(session):
+    """
+    Session worker: parse the (session id, byte ranges) boot session and
+    return its results with the state the processors left: the node info,
+    the chassis environment, the missions and the scheduler
+    """
+    session_id, ranges = session
+    parser = SESSION_PARSER
+    # Workers are reused, start from the state of the forked parser
+    ram_info_before, environment_before = SESSION_STATE
+    vars(parser.ram_info).clear()
+    vars(parser.ram_info).update(copy.deepcopy(ram_info_before))
+    environment.clear()
+    environment.update(copy.deepcopy(environment_before))
+    parser.dbg_log_data = MmapLogfile(parser.source)
+    parser.first_run_flag = True
+    parser.session_results = []
+    parser.block_ranges = ranges
+    parser.init_session(session_id)
+    parser.parse_debug_log()
+    parser.dbg_log_data.close()
+    return {
+        'session_results': parser.session_results,
+        'ram_info': vars(parser.ram_info),
+        'environment': environment,
+        'first_run_flag': parser.first_run_flag,
+        'scheduler': parser.scheduler,
+        'missions': dict((prefix, submission_instance.checkpoint_state())
+                         for prefix, submission_instance in parser.missions.items()
+                         if hasattr(submission_instance, 'checkpoint_state')),
+    }
 
 if __name__ == '__main__':
     args = argument_parsing()
-    conf = Conf(OPTIONS, args.config, log=False)
+    load_mission_plugins()
+    conf = Conf(mission_options(OPTIONS), args.config, log=False)
 
     ram_info = MemorySubsytemEventsLogger('MY81-EX0-Y3N')
     data_source = args.source
-
-    MRC_parser = BDSM(data_source, conf, ram_info)
-    MRC_parser.parse_debug_log()
+    profiling = args.profile or args.profile_dump
+    if profiling:
+        from procprof import ProcessorProfiler, PROFILE_OPTIONS
+        conf['base'].update(PROFILE_OPTIONS)
+
+    MRC_parser = BDSM(data_source, conf, ram_info, args.follow)
+    if MRC_parser.data_source in LIVE_SOURCES:
+        unbuffered_stdout()
+    if args.verbose:
+        MRC_parser.trace.level = max(MRC_parser.trace.level, TRACE_BLOCKS)
+    install_dump_handlers(MRC_parser.trace)
+    if profiling:
+        MRC_parser.profiler = ProcessorProfiler()
+    if args.boot_profile:
+        MRC_parser.profile_boot(args.boot_profile)
+        sys.exit(0)
+    if args.resume and os.path.exists(conf['base']['checkpoint_file']):
+        MRC_parser.resume(conf['base']['checkpoint_file'])
+    if args.index or args.only:
+        MRC_parser.use_block_index(args.only)
+    if conf['base']['scan_workers'] != 1:
+        parse = (MRC_parser.parse_debug_log_chunked, conf['base']['scan_workers'])
+    else:
+        parse = (MRC_parser.parse_sessions, conf['base']['session_workers'])
+    metrics_exporter = MRC_parser.start_metrics()
+    try:
+        if profiling:
+            try:
+                session_results = MRC_parser.profiler.run(args.profile_dump, MRC_parser.parse_cached, *parse)
+            finally:
+                MRC_parser.profiler.report(MRC_parser.lines_scanned)
+        else:
+            session_results = MRC_parser.parse_cached(*parse)
+    finally:
+        if metrics_exporter is not None:
+            metrics_exporter.close()
+    for session_result in session_results:
+        logger.info("Boot session {0}: {1} functions completed, {2} goals not reached".format(
+            session_result['session'], len(session_result['completed']),
+            len(session_result['missing_inputs'])))
 
 # vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import re
+import json
+import logging
+from collections import defaultdict
+
+from blocks import BlockMatcher, BLOCK_MARKERS, bytes_re, decode_line
+from blocks import ANSI_ESCAPE_MARK, ANSI_ESCAPE_BYTES_RE
+from logfile import MmapLogfile
+
+logger = logging.getLogger()
+
+INDEX_SUFFIX = '.bdsmidx'
+INDEX_VERSION = 1
+
+# Literal parts of the end markers, an end marker line contains all of the
+# parts of its kind (the first one is the prefilter of the log scan)
+BLOCK_END_MARKS = {
+    'smm': (b' Hander end!',),
+    'imc': (b'ms', b' - '),
+    'bblock': (b'STOP_',),
+    'acpi': (b' Exiting',),
+}
+
+# Record fields of the index
+FIELDS = ('kind', 'name', 'socket', 'start', 'end', 'first_line', 'last_line')
+
+
+def block_socket(block_name):
+    """
+    Socket id the same way the parser derives it from the block name
+    """
+    return re.sub(r'\D', '', block_name) or None
+
+
+class BlockIndex:
+    """
+    Byte offsets and line numbers of all debug log blocks of a console log
+    file, kept in a sidecar file next to the log
+    """
+    def __init__(self, log_path, markers=BLOCK_MARKERS, end_marks=BLOCK_END_MARKS):
+        self.log_path = log_path
+        self.markers = markers
+        self.end_marks = end_marks
+        self.index_path = log_path + INDEX_SUFFIX
+        # [kind, name, socket, start, end, first_line, last_line], end and
+        # last_line are None for the blocks which were never closed
+        self.blocks = []
+
+    def log_signature(self):
+        log_stat = os.stat(self.log_path)
+        return log_stat.st_size, log_stat.st_mtime
+
+    def load(self):
+        """
+        Load the sidecar, return False if it's missing or stale
+        """
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            return False
+        log_size, log_mtime = self.log_signature()
+        if index.get('version') != INDEX_VERSION or index.get('fields') != list(FIELDS) \
+                or index.get('log_size') != log_size or index.get('log_mtime') != log_mtime \
+                or index.get('markers') != self.markers_signature():
+            logger.debug("Block index " + self.index_path + " is stale")
+            return False
+        self.blocks = index['blocks']
+        return True
+
+    def markers_signature(self):
+        """
+        Patterns the index was built with, another grammar needs another index
+        """
+        return [[kind, start_re.pattern, end_re.pattern if end_re else None]
+                for kind, start_re, end_re, literal, description in self.markers]
+
+    def save(self):
+        log_size, log_mtime = self.log_signature()
+        index = {
+            'version': INDEX_VERSION,
+            'markers': self.markers_signature(),
+            'log_size': log_size,
+            'log_mtime': log_mtime,
+            'fields': FIELDS,
+            'blocks': self.blocks
+        }
+        try:
+            with open(self.index_path, 'w') as index_file:
+                json.dump(index, index_file, separators=(',', ':'))
+        except (IOError, OSError) as e:
+            logger.warning("Can't save block index " + self.index_path + ": " + str(e))
+            return False
+        return True
+
+    def build(self):
+        """
+        Scan the log for all block start and end markers
+        """
+        log = MmapLogfile(self.log_path)
+        matcher = BlockMatcher(self.markers)
+        end_markers = [(kind, self.end_marks[kind], bytes_re(end_re))
+                       for kind, start_re, end_re, literal, description in self.markers
+                       if kind in self.end_marks]
+        literals = [marker[3].encode('utf-8') for marker in self.markers]
+        literals.extend(marks[0] for kind, marks, end_re in end_markers)
+
+        self.blocks = []
+        # (kind, name) -> stack of open block records
+        open_blocks = defaultdict(list)
+        lines_yielded = 0
+        for line in log.lines(literals, ()):
+            lines_yielded += 1
+            line_no = log.lines_skipped + lines_yielded
+            start, end = log.line_span
+            if ANSI_ESCAPE_MARK in line:
+                line = ANSI_ESCAPE_BYTES_RE.sub(b'', line)
+            line = line.rstrip(b'\r\n')
+
+            boundary = matcher.classify(line)
+            if boundary and boundary.end_re and boundary.name:
+                record = [boundary.kind, boundary.name, block_socket(boundary.name),
+                          start, None, line_no, None]
+                self.blocks.append(record)
+                open_blocks[(boundary.kind, boundary.name)].append(record)
+                continue
+
+            for kind, marks, end_re in end_markers:
+                if not all(mark in line for mark in marks):
+                    continue
+                end_match = end_re.match(line)
+                if not end_match:
+                    continue
+                name = decode_line(end_match.group(1))
+                if open_blocks.get((kind, name)):
+                    record = open_blocks[(kind, name)].pop()
+                    record[4] = end
+                    record[6] = line_no
+        log.close()
+        logger.info("Indexed {0} blocks of {1}".format(len(self.blocks), self.log_path))
+
+    def load_or_build(self):
+        if not self.load():
+            self.build()
+            self.save()
+        return self
+
+    def ranges(self, block_names):
+        """
+        Sorted and merged byte ranges of the closed blocks with given names
+        """
+        block_names = set(block_names)
+        spans = sorted((record[3], record[4]) for record in self.blocks
+                       if record[1] in block_names and record[4] is not None)
+        ranges = []
+        for start, end in spans:
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return [tuple(r) for r in ranges]
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
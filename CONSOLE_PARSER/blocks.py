@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import re
+from collections import namedtuple
+
+# Intel MRC base blocks
+MRC_BBLOCK_START_RE = re.compile(r'START_([0-9A-Z_]+)')
+MRC_BBLOCK_END_RE = re.compile(r'STOP_([0-9A-Z_]+)')
+
+# Intel MRC iMC blocks functions
+MRC_iMC_BLOCK_START_RE = re.compile(r'(^[A-Z@].*) -- Started')
+MRC_iMC_BLOCK_END_RE = re.compile(r'(^[A-Z@].*) - ([0-9]+) ?ms\s*$')
+
+# Intel SMM handlers sample code
+MRC_SMM_BLOCK_START_RE = re.compile(r'(.*) Hander start!')
+MRC_SMM_BLOCK_END_RE = re.compile(r'(.*) Hander end!')
+
+# UEFI ACPI functions
+#MRC_ACPI_START_RE = re.compile(r'^(.*): Class ID:  [0-9][0-9]')
+MRC_ACPI_START_RE = re.compile(r'^(.*): Class ID:.*')
+MRC_ACPI_END_RE = re.compile(r'^(.*) Exiting...')
+
+# MRC Fatal Error
+MRC_FATAL_ERROR_RE = re.compile(r'Major Code = [0-9]+, Minor Code = [0-9]+')
+
+# Checkpoint regexp (POST codes):
+#Checkpoint Code: Socket 0, 0xBF, 0x00, 0x0000
+POST_CHECKPOINT_RE = re.compile(r'Checkpoint Code: Socket [01], (0x[0-9A-F]+), (0x[0-9A-F]+), (0x[0-9A-F]+)')
+
+SERVER_POWER_ON_RE = re.compile(r'Status Code Available')
+SERVER_POWER_OFF_RE = re.compile(r'SecSMI. S5 Trap')
+
+ANSI_ESCAPE_RE = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
+ANSI_ESCAPE_MARK = b'\x1b'
+
+# Line markers in order of precedence: when a line matches several start
+# patterns the first one wins (the same way the last successful check used to
+# overwrite the previous ones in the sequential matching).
+# Built in markers, the grammar files (grammar.py) may define their own.
+# (kind, start regexp, end regexp, literal part of the start marker, description)
+BLOCK_MARKERS = (
+    ('smm', MRC_SMM_BLOCK_START_RE, MRC_SMM_BLOCK_END_RE, ' Hander start!', 'AMI BIOS SMM block'),
+    ('imc', MRC_iMC_BLOCK_START_RE, MRC_iMC_BLOCK_END_RE, ' -- Started', 'MRC block'),
+    ('bblock', MRC_BBLOCK_START_RE, MRC_BBLOCK_END_RE, 'START_', 'AMI BIOS base block'),
+    ('acpi', MRC_ACPI_START_RE, MRC_ACPI_END_RE, ': Class ID:', 'ACPI BIOS block'),
+    ('power_on', SERVER_POWER_ON_RE, None, 'Status Code Available', 'server power on'),
+    ('power_off', SERVER_POWER_OFF_RE, None, ' S5 Trap', 'server power off'),
+)
+
+# Literal part of MRC_FATAL_ERROR_RE
+MRC_FATAL_ERROR_MARK = 'Major Code = '
+
+if bytes is str:
+    def decode_line(raw_line):
+        return raw_line
+else:
+    def decode_line(raw_line):
+        return raw_line.decode('utf-8', 'replace')
+
+
+def bytes_re(regexp):
+    """
+    Compile the same pattern for matching raw (undecoded) console lines
+    """
+    return re.compile(regexp.pattern.encode('ascii'), regexp.flags & ~re.UNICODE)
+
+ANSI_ESCAPE_BYTES_RE = bytes_re(ANSI_ESCAPE_RE)
+MRC_FATAL_ERROR_BYTES_RE = bytes_re(MRC_FATAL_ERROR_RE)
+
+BlockBoundary = namedtuple('BlockBoundary', ['kind', 'name', 'end_re', 'description'])
+
+
+class BlockMatcher:
+    """
+    Classify a raw console line against all block start and power state
+    markers with a single precompiled regexp
+    """
+    def __init__(self, markers=BLOCK_MARKERS):
+        self.markers = markers
+        alternatives = []
+        # outer group index -> (kind, name group index, end regexp, description)
+        self.groups = {}
+        group_index = 1
+        for kind, start_re, end_re, literal, description in markers:
+            alternatives.append('(?P<{0}>{1})'.format(kind, start_re.pattern))
+            name_group = group_index + 1 if start_re.groups else None
+            if end_re is not None:
+                end_re = bytes_re(end_re)
+            self.groups[group_index] = (kind, name_group, end_re, description)
+            group_index += 1 + start_re.groups
+        self.boundary_re = re.compile('|'.join(alternatives).encode('ascii'))
+
+    def classify(self, line):
+        """
+        Return BlockBoundary of the line or None if the line isn't a marker.
+        Only the block name is decoded, the end regexp matches raw lines.
+        """
+        match = self.boundary_re.match(line)
+        if match is None:
+            return None
+        kind, name_group, end_re, description = self.groups[match.lastindex]
+        name = decode_line(match.group(name_group)) if name_group else None
+        return BlockBoundary(kind, name, end_re, description)
+
+
+class LinePrefilter:
+    """
+    Substring test in front of the block regexps: rejects lines which can't be
+    a block boundary, an end of a processed block or a fatal error record
+    """
+    def __init__(self, block_names, markers=BLOCK_MARKERS):
+        # End markers of all kinds contain the name of the block they close
+        # and only the blocks with a processor are ever waited for, so the
+        # names from the processing rules cover the end markers.
+        literals = set(marker[3] for marker in markers)
+        literals.add(MRC_FATAL_ERROR_MARK)
+        literals.update(name for name in block_names if name)
+        self.literals = tuple(sorted(literal.encode('utf-8') for literal in literals))
+        self.lines_seen = 0
+        self.lines_rejected = 0
+
+    def is_candidate(self, line):
+        self.lines_seen += 1
+        for literal in self.literals:
+            if literal in line:
+                return True
+        self.lines_rejected += 1
+        return False
+
+    def rejected_ratio(self):
+        if not self.lines_seen:
+            return 0.0
+        return float(self.lines_rejected) / self.lines_seen
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
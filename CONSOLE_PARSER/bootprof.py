@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import bisect
+import logging
+from collections import defaultdict, namedtuple
+
+from blocks import ANSI_ESCAPE_MARK, ANSI_ESCAPE_BYTES_RE
+from logfile import MmapLogfile
+
+logger = logging.getLogger()
+
+# Grammar record set of the boot timeline: power_on, checkpoint (socket,
+# major, minor), step_start (name), step_end (name, ms), span_start and
+# span_end (name) records
+BOOT_PROFILE_RECORDS = 'boot_profile'
+
+FOLDED_SUFFIX = '.folded'
+TABLE_SUFFIX = '.tsv'
+TABLE_HEADER = ('boot', 'kind', 'socket', 'phase', 'start_ms', 'duration_ms')
+
+# kind is mrc (MRC step), block (START_/STOP_ span) or post (time from a
+# POST checkpoint code to the next one of the socket), path is the tuple of
+# the enclosing frames names ending with the phase own name
+Phase = namedtuple('Phase', ['boot', 'kind', 'socket', 'path', 'start', 'duration'])
+
+
+class Frame:
+    """
+    Open MRC step or START_ block of the timeline
+    """
+    def __init__(self, kind, name, path, start_pos, start_time=None):
+        self.kind = kind
+        self.name = name
+        self.path = path
+        self.start_pos = start_pos
+        self.start_time = start_time
+        self.closed = False
+
+
+class BootTimeline:
+    """
+    Timeline of a single boot. The console lines have no timestamps, the
+    clock is made of the durations the MRC reports for its steps and the
+    time inside a step is spread over its console output bytes (the serial
+    console is written at a steady rate while training).
+    """
+    def __init__(self, boot):
+        self.boot = boot
+        self.clock = 0.0
+        # (byte offset, ms) points of the clock, both ascending
+        self.anchor_positions = []
+        self.anchor_times = []
+        self.frames = []
+        # (kind, path, start pos, end pos, duration, start time, parent step)
+        self.spans = []
+        # socket -> [(pos, code)]
+        self.checkpoints = defaultdict(list)
+        self.end_pos = 0
+        self.events = 0
+
+    def time_at(self, pos):
+        positions = self.anchor_positions
+        if not positions:
+            return 0.0
+        index = bisect.bisect_right(positions, pos)
+        if index == 0:
+            return self.anchor_times[0]
+        if index == len(positions):
+            return self.anchor_times[-1]
+        start_pos, end_pos = positions[index - 1], positions[index]
+        start_time, end_time = self.anchor_times[index - 1], self.anchor_times[index]
+        if end_pos == start_pos:
+            return end_time
+        return start_time + (end_time - start_time) * (pos - start_pos) / float(end_pos - start_pos)
+
+    def path(self, name):
+        return tuple(frame.name for frame in self.frames) + (name,)
+
+    def step_frames(self):
+        return [frame for frame in self.frames if frame.kind == 'mrc']
+
+    def anchor(self, pos, time):
+        self.anchor_positions.append(pos)
+        self.anchor_times.append(time)
+        self.clock = time
+
+    def open(self, kind, name, pos):
+        start_time = None
+        if kind == 'mrc':
+            start_time = self.clock
+            self.anchor(pos, start_time)
+        self.frames.append(Frame(kind, name, self.path(name), pos, start_time))
+
+    def close(self, kind, name):
+        """
+        Pop the innermost open frame of the kind and name with the frames
+        left open inside it, return it or None if there is no such frame
+        """
+        for index in range(len(self.frames) - 1, -1, -1):
+            frame = self.frames[index]
+            if frame.kind == kind and frame.name == name:
+                del self.frames[index:]
+                frame.closed = True
+                return frame
+        return None
+
+    def step_ended(self, name, duration, start_pos, end_pos):
+        frame = self.close('mrc', name)
+        if frame is None:
+            # Sub step of the innermost step (e.g. per node durations),
+            # dropped if that step never ends
+            steps = self.step_frames()
+            if steps:
+                self.spans.append(('mrc', self.path(name), start_pos, end_pos, duration,
+                                   None, steps[-1]))
+            return
+        # The reported durations are rounded, the inner steps may add up to
+        # a bit more than the outer one
+        self.anchor(end_pos, max(self.clock, frame.start_time + duration))
+        self.spans.append(('mrc', frame.path, frame.start_pos, end_pos, duration,
+                           frame.start_time, None))
+
+    def span_ended(self, name, end_pos):
+        frame = self.close('block', name)
+        if frame is not None:
+            self.spans.append(('block', frame.path, frame.start_pos, end_pos, None, None, None))
+
+    def feed(self, record, start_pos, end_pos):
+        self.events += 1
+        self.end_pos = end_pos
+        if record.record == 'checkpoint':
+            self.checkpoints[record.socket].append(
+                (start_pos, '{0}.{1}'.format(record.major, record.minor)))
+        elif record.record == 'step_start':
+            self.open('mrc', record.name, start_pos)
+        elif record.record == 'step_end':
+            self.step_ended(record.name, float(record.ms), start_pos, end_pos)
+        elif record.record == 'span_start':
+            self.open('block', record.name, start_pos)
+        elif record.record == 'span_end':
+            self.span_ended(record.name, end_pos)
+
+    def phases(self):
+        phases = []
+        for kind, path, start_pos, end_pos, duration, start_time, parent in self.spans:
+            if parent is not None and not parent.closed:
+                continue
+            if duration is None:
+                start_time = self.time_at(start_pos)
+                duration = self.time_at(end_pos) - start_time
+            elif start_time is None:
+                # Sub step, only its end is known
+                start_time = max(self.time_at(end_pos) - duration, 0.0)
+            phases.append(Phase(self.boot, kind, None, path, start_time, duration))
+        for socket, checkpoints in sorted(self.checkpoints.items()):
+            ends = [pos for pos, code in checkpoints[1:]] + [self.end_pos]
+            for (pos, code), end_pos in zip(checkpoints, ends):
+                start_time = self.time_at(pos)
+                phases.append(Phase(self.boot, 'post', socket, (code,), start_time,
+                                    self.time_at(end_pos) - start_time))
+        return sorted(phases, key=lambda phase: (phase.start, len(phase.path)))
+
+
+class BootProfiler:
+    """
+    Per boot timelines of a console log: MRC step durations, time between
+    the POST checkpoint codes per socket and START_/STOP_ block spans.
+    Writes them as folded stacks (the flame graph tools input, values are
+    microseconds) and a tab separated table of the phases.
+    """
+    def __init__(self, record_set):
+        self.record_set = record_set
+        self.boot = 0
+        self.timeline = BootTimeline(self.boot)
+        self.boot_phases = []
+
+    def finish_boot(self):
+        if not self.timeline.events:
+            return
+        phases = self.timeline.phases()
+        logger.info("Boot {0}: {1} phases, {2:.0f} ms of MRC steps".format(
+            self.boot, len(phases), self.timeline.clock))
+        self.boot_phases.extend(phases)
+        self.boot += 1
+        self.timeline = BootTimeline(self.boot)
+
+    def feed(self, line, start_pos, end_pos):
+        if ANSI_ESCAPE_MARK in line:
+            line = ANSI_ESCAPE_BYTES_RE.sub(b'', line)
+        record = self.record_set.match(line.rstrip(b'\r\n'))
+        if record is None:
+            return
+        if record.record == 'power_on':
+            self.finish_boot()
+        else:
+            self.timeline.feed(record, start_pos, end_pos)
+
+    def profile(self, dbg_log_data):
+        """
+        Build the timelines of all the boots of the log
+        """
+        if isinstance(dbg_log_data, MmapLogfile):
+            for line in dbg_log_data.lines(self.record_set.prefilter, ()):
+                start_pos, end_pos = dbg_log_data.line_span
+                self.feed(line, start_pos, end_pos)
+        else:
+            pos = 0
+            for line in dbg_log_data:
+                self.feed(line, pos, pos + len(line))
+                pos += len(line)
+        self.finish_boot()
+        return self.boot_phases
+
+    def folded(self):
+        """
+        Return the folded stack -> self time in microseconds of the MRC steps
+        and the blocks summed over the boots
+        """
+        totals = defaultdict(float)
+        for phase in self.boot_phases:
+            if phase.kind != 'post':
+                totals[phase.path] += phase.duration
+        # Time of the phases is taken from the nearest enclosing phase, the
+        # frames which never ended aren't phases
+        children = defaultdict(float)
+        for path, total in totals.items():
+            parent = path[:-1]
+            while parent and parent not in totals:
+                parent = parent[:-1]
+            children[parent] += total
+        stacks = {}
+        for path, total in totals.items():
+            self_time = int(round(max(total - children[path], 0.0) * 1000))
+            if self_time:
+                stacks[';'.join(frame.replace(';', ':') for frame in path)] = self_time
+        return stacks
+
+    def write(self, prefix):
+        with open(prefix + FOLDED_SUFFIX, 'w') as folded:
+            for stack, value in sorted(self.folded().items()):
+                folded.write('{0} {1}\n'.format(stack, value))
+        with open(prefix + TABLE_SUFFIX, 'w') as table:
+            table.write('\t'.join(TABLE_HEADER) + '\n')
+            for phase in self.boot_phases:
+                table.write('{0}\t{1}\t{2}\t{3}\t{4:.3f}\t{5:.3f}\n'.format(
+                    phase.boot, phase.kind, '' if phase.socket is None else phase.socket,
+                    ';'.join(phase.path), phase.start, phase.duration))
+        logger.info("Boot profile of {0} boots written to {1}{2} and {1}{3}".format(
+            self.boot, prefix, FOLDED_SUFFIX, TABLE_SUFFIX))
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
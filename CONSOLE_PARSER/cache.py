@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger()
+
+HASH_CHUNK_SIZE = 1 << 20
+ENTRY_SUFFIX = '.json'
+DIGEST_SUFFIX = '.digest'
+# Config values naming these files are hashed by their contents
+YAML_SUFFIXES = ('.yaml', '.yml')
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sources_digest(paths):
+    digest = hashlib.sha256()
+    for path in sorted(set(paths)):
+        digest.update(file_digest(path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def conf_digest(conf, sections):
+    """
+    Digest of the option values of the conf sections, YAML files named by
+    the options are hashed by their contents
+    """
+    digest = hashlib.sha256()
+    for section in sorted(sections):
+        for option, value in sorted(conf[section].items()):
+            digest.update(json.dumps([section, option, value], default=str).encode('utf-8'))
+            if (isinstance(value, str) and value.endswith(YAML_SUFFIXES)
+                    and os.path.isfile(value)):
+                digest.update(file_digest(value).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Parse results on disk addressed by the digest of everything they depend
+    on. Entries are JSON files, hits refresh their mtime and the least
+    recently used ones are evicted over the size or entries limits.
+    """
+    def __init__(self, directory, max_bytes, max_entries=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @classmethod
+    def from_conf(cls, conf):
+        """
+        Cache configured in the base section, None if it's disabled
+        """
+        if not conf['base']['result_cache_dir']:
+            return None
+        return cls(conf['base']['result_cache_dir'], conf['base']['result_cache_mb'] << 20,
+                   conf['base']['result_cache_entries'])
+
+    def path(self, key, suffix=ENTRY_SUFFIX):
+        return os.path.join(self.directory, key + suffix)
+
+    def log_digest(self, path):
+        """
+        Digest of the log file contents, remembered by the file identity
+        (inode, size, mtime) so an unchanged log is hashed once
+        """
+        log_stat = os.stat(path)
+        identity = [os.path.abspath(path), log_stat.st_ino, log_stat.st_size, log_stat.st_mtime]
+        identity_key = hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+        digest_path = self.path(identity_key, DIGEST_SUFFIX)
+        try:
+            with open(digest_path) as digest_file:
+                digest = digest_file.read().strip()
+            os.utime(digest_path, None)
+            return digest
+        except (IOError, OSError):
+            pass
+        digest = file_digest(path)
+        self.write(digest_path, digest)
+        return digest
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path) as entry:
+                value = json.load(entry)
+        except IOError:
+            return None
+        except ValueError:
+            logger.warning("Dropping broken result cache entry " + path)
+            self.remove(path)
+            return None
+        os.utime(path, None)
+        return value
+
+    def put(self, key, value):
+        self.write(self.path(key), json.dumps(value, sort_keys=True, default=str))
+        self.evict()
+
+    def write(self, path, data):
+        # Concurrent readers see either no entry or the whole one
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as tmp_file:
+                tmp_file.write(data)
+            os.rename(tmp_path, path)
+        except Exception:
+            self.remove(tmp_path)
+            raise
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        Return (mtime, size, path) of the entries and the remembered log
+        digests, least recently used first
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith((ENTRY_SUFFIX, DIGEST_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entry_stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        results = sum(1 for mtime, size, path in entries if path.endswith(ENTRY_SUFFIX))
+        for mtime, size, path in entries:
+            over_size = total > self.max_bytes
+            if not over_size and not (self.max_entries and results > self.max_entries):
+                break
+            is_result = path.endswith(ENTRY_SUFFIX)
+            if not over_size and not is_result:
+                # The entries limit doesn't count the log digests
+                continue
+            self.remove(path)
+            total -= size
+            results -= is_result
+            logger.debug("Evicted result cache entry " + path)
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
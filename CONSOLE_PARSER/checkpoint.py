@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import time
+import logging
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+logger = logging.getLogger()
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as checkpoint:
+        return pickle.load(checkpoint)
+
+
+class Checkpointer:
+    """
+    Periodic parser state snapshots in the binary pickle format. A snapshot
+    is due when interval seconds passed since the previous one and the time
+    spent on the snapshots stays under max_overhead of the parsing time.
+    """
+    def __init__(self, path, interval=30, max_overhead=0.01):
+        self.path = path
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.started = time.time()
+        self.last = self.started
+        self.count = 0
+        self.seconds = 0.0
+        self.last_size = 0
+
+    def due(self):
+        now = time.time()
+        if now - self.last < self.interval:
+            return False
+        return self.seconds <= (now - self.started) * self.max_overhead
+
+    def save(self, state):
+        started = time.time()
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        # A crash while writing leaves the previous checkpoint intact
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as checkpoint:
+            checkpoint.write(data)
+        os.rename(tmp_path, self.path)
+        self.last = time.time()
+        elapsed = self.last - started
+        self.count += 1
+        self.seconds += elapsed
+        self.last_size = len(data)
+        logger.debug("Checkpoint {0}: {1} bytes in {2:.3f}s".format(
+            self.count, len(data), elapsed))
+
+    def overhead(self):
+        return self.seconds / max(time.time() - self.started, 1e-6)
+
+    def discard(self):
+        """
+        Parsing is finished, there is nothing to resume
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        logger.info("{0} checkpoints took {1:.3f}s ({2:.2%} of parsing time), "
+                    "last one {3} bytes".format(self.count, self.seconds,
+                                                self.overhead(), self.last_size))
+
+
+class RawArchive:
+    """
+    Append only copy of the live console lines. Checkpoints keep the offset
+    of the next line to parse, a resumed parser replays the lines after it
+    before reading the console again.
+    """
+    def __init__(self, path):
+        self.path = path
+        # Unbuffered, the lines received before a crash are on disk
+        self.archive = open(path, 'ab', 0)
+        self.archive.seek(0, os.SEEK_END)
+        # Offset of the line being parsed
+        self.line_start = self.archive.tell()
+
+    def tee(self, lines):
+        for line in lines:
+            if not line.endswith(b'\n'):
+                line += b'\n'
+            self.line_start = self.archive.tell()
+            self.archive.write(line)
+            yield line
+
+    def replay(self, offset):
+        start = offset
+        with open(self.path, 'rb') as archive:
+            archive.seek(offset)
+            for line in archive:
+                self.line_start = offset
+                offset += len(line)
+                yield line
+        logger.info("Replayed {0} bytes of the raw archive {1}".format(offset - start, self.path))
+
+    def close(self):
+        self.archive.close()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
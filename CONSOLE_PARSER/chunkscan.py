@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import logging
+import multiprocessing
+
+from blocks import BlockMatcher, BLOCK_MARKERS, bytes_re, decode_line
+from blocks import ANSI_ESCAPE_MARK, ANSI_ESCAPE_BYTES_RE
+from logfile import MmapLogfile
+
+logger = logging.getLogger()
+
+
+def block_end_res(markers):
+    """
+    (kind, end regexp) of the blocks kinds, the end of the innermost block
+    is checked with the regexp of its kind
+    """
+    return tuple((kind, bytes_re(end_re))
+                 for kind, start_re, end_re, literal, description in markers
+                 if end_re is not None)
+
+
+def chunk_ranges(log, chunks):
+    """
+    Split the log file into chunks (start, end) byte ranges at line boundaries
+    """
+    ranges = []
+    start = 0
+    for n in range(1, chunks + 1):
+        end = log.size * n // chunks
+        if end < log.size:
+            line_end = log.data.find(b'\n', end)
+            end = log.size if line_end < 0 else line_end + 1
+        if end > start:
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def scan_chunk(job):
+    """
+    Map: classify the candidate lines of a chunk. Returns the events
+    (start, end, kind, name, end_names) in the file order, kind and name are
+    set for the block start lines and power state changes, end_names maps
+    the block kinds whose end regexp matches the line to the matched name.
+    Lines without any of the literals aren't events.
+    """
+    path, ranges, literals, markers = job
+    block_matcher = BlockMatcher(markers)
+    end_res = block_end_res(markers)
+    log = MmapLogfile(path)
+    events = []
+    for line in log.lines(literals, (), ranges):
+        start, end = log.line_span
+        if ANSI_ESCAPE_MARK in line:
+            line = ANSI_ESCAPE_BYTES_RE.sub(b'', line)
+        line = line.rstrip(b'\r\n')
+        for literal in literals:
+            if literal in line:
+                break
+        else:
+            continue
+        boundary = block_matcher.classify(line)
+        if boundary and boundary.name:
+            events.append((start, end, boundary.kind, boundary.name, None))
+            continue
+        end_names = {}
+        for kind, end_re in end_res:
+            end_match = end_re.match(line)
+            if end_match:
+                end_names[kind] = decode_line(end_match.group(1))
+        events.append((start, end, boundary.kind if boundary else None, None, end_names))
+    log.close()
+    return events
+
+
+def scan_log(path, literals, workers, ranges=None, markers=BLOCK_MARKERS):
+    """
+    Scan the log file chunks in the worker processes, yield the events of
+    the whole file in order
+    """
+    log = MmapLogfile(path)
+    chunks = chunk_ranges(log, workers)
+    log.close()
+    jobs = []
+    for chunk_start, chunk_end in chunks:
+        if ranges is None:
+            chunk_ranges_list = [(chunk_start, chunk_end)]
+        else:
+            chunk_ranges_list = [(max(start, chunk_start), min(end, chunk_end))
+                                 for start, end in ranges
+                                 if start < chunk_end and end > chunk_start]
+        jobs.append((path, chunk_ranges_list, list(literals), markers))
+    logger.info("Scanning {0} chunks of {1} in {2} processes...".format(len(jobs), path, workers))
+    pool = multiprocessing.Pool(workers)
+    try:
+        for events in pool.imap(scan_chunk, jobs):
+            for event in events:
+                yield event
+    finally:
+        pool.close()
+        pool.join()
+
+
+def stitch_blocks(events, block_names):
+    """
+    Reduce: replay the parser state machine over the events and yield
+    ('block', name, ranges) for every ended block with the byte ranges of
+    its lines, and ('power_on', new_session) / ('power_off', None) for the
+    power state changes. Blocks crossing the chunk edges are joined here.
+    """
+    # [name, kind, ranges] of the open blocks, the innermost is the last one
+    open_blocks = []
+    first_power_on = True
+    pos = 0
+
+    def append(start, end):
+        ranges = open_blocks[-1][2]
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    for start, end, kind, name, end_names in events:
+        # Lines between the events are plain lines of the innermost block
+        if open_blocks and start > pos:
+            append(pos, start)
+        pos = end
+        if name:
+            if name in block_names:
+                open_blocks.append([name, kind, []])
+            continue
+        if kind == 'power_on':
+            yield 'power_on', not first_power_on
+            if not first_power_on:
+                # Blocks left open by the previous boot will never end
+                del open_blocks[:]
+            first_power_on = False
+        elif kind == 'power_off':
+            yield 'power_off', None
+        if not open_blocks:
+            continue
+        block_name, block_kind, ranges = open_blocks[-1]
+        if end_names.get(block_kind) == block_name:
+            open_blocks.pop()
+            yield 'block', block_name, ranges
+        else:
+            append(start, end)
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
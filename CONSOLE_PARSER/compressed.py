@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import zlib
+import mmap
+import struct
+import logging
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger()
+
+# Compressed data is read and decompressed by this many bytes at once
+READ_SIZE = 1 << 20
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+MAGICS = (
+    ('gzip', GZIP_MAGIC),
+    ('xz', XZ_MAGIC),
+    ('zstd', ZSTD_MAGIC)
+)
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# gzip header flags
+GZIP_FEXTRA = 0x04
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+# Window descriptor size of the zstd frame header by Single_Segment_flag and
+# Frame_Content_Size field size by Frame_Content_Size_flag (and the former)
+ZSTD_DICT_ID_SIZES = (0, 1, 2, 4)
+ZSTD_FCS_SIZES = (0, 2, 4, 8)
+ZSTD_RLE_BLOCK = 1
+
+# Decompressor modules by compression, imported by the first log needing them
+CODEC_CACHE = {}
+
+
+def load_codec(compression):
+    """
+    Return the lzma (xz) or zstandard (zstd) module
+    """
+    if compression not in CODEC_CACHE:
+        if compression == 'xz':
+            try:
+                import lzma
+            except ImportError:
+                try:
+                    from backports import lzma
+                except ImportError:
+                    raise RuntimeError("xz compressed logs require the lzma module "
+                                       "(backports.lzma on Python 2)")
+            CODEC_CACHE[compression] = lzma
+        else:
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("zstd compressed logs require the zstandard module")
+            CODEC_CACHE[compression] = zstandard
+    return CODEC_CACHE[compression]
+
+
+def detect_compression(path):
+    """
+    Return compression format of the file by its magic bytes or None
+    """
+    with open(path, 'rb') as log_file:
+        head = log_file.read(max(len(magic) for kind, magic in MAGICS))
+    for kind, magic in MAGICS:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def bgzf_members(data):
+    """
+    Return (start, end) of the gzip members if every member records its
+    size in the BGZF 'BC' extra subfield (bgzip, htslib), otherwise None:
+    members of plain multi-member gzip can't be found without inflating.
+    """
+    members = []
+    pos = 0
+    size = len(data)
+    while pos < size:
+        header = data[pos:pos + 12]
+        if len(header) < 12 or header[:2] != GZIP_MAGIC or not bytearray(header)[3] & GZIP_FEXTRA:
+            return None
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = data[pos + 12:pos + 12 + xlen]
+        member_size = None
+        field = 0
+        while field + 4 <= len(extra):
+            field_len = struct.unpack('<H', extra[field + 2:field + 4])[0]
+            if extra[field:field + 2] == b'BC' and field_len == 2:
+                member_size = struct.unpack('<H', extra[field + 4:field + 6])[0] + 1
+                break
+            field += 4 + field_len
+        if member_size is None:
+            return None
+        members.append((pos, min(pos + member_size, size)))
+        pos += member_size
+    return members
+
+
+def zstd_frames(data):
+    """
+    Return (start, end) of the zstd frames found by walking the frame and
+    block headers, skippable frames are left out
+    """
+    frames = []
+    pos = 0
+    size = len(data)
+    while pos + 4 <= size:
+        magic = struct.unpack('<I', data[pos:pos + 4])[0]
+        if magic & 0xFFFFFFF0 == ZSTD_SKIPPABLE_MAGIC:
+            pos += 8 + struct.unpack('<I', data[pos + 4:pos + 8])[0]
+            continue
+        if data[pos:pos + 4] != ZSTD_MAGIC:
+            raise ValueError("Not a zstd frame at offset {0}".format(pos))
+        descriptor = bytearray(data[pos + 4:pos + 5])[0]
+        single_segment = (descriptor >> 5) & 1
+        fcs_size = ZSTD_FCS_SIZES[descriptor >> 6]
+        if not fcs_size and single_segment:
+            fcs_size = 1
+        block = (pos + 5 + (not single_segment) + ZSTD_DICT_ID_SIZES[descriptor & 3] + fcs_size)
+        while True:
+            header = bytearray(data[block:block + 3])
+            if len(header) < 3:
+                raise ValueError("Truncated zstd frame at offset {0}".format(pos))
+            header = header[0] | header[1] << 8 | header[2] << 16
+            block_type = (header >> 1) & 3
+            block += 3 + (1 if block_type == ZSTD_RLE_BLOCK else header >> 3)
+            if header & 1:
+                break
+        if (descriptor >> 2) & 1:
+            # Content checksum
+            block += 4
+        frames.append((pos, block))
+        pos = block
+    return frames
+
+
+def inflate_member(member):
+    return zlib.decompress(member, GZIP_WBITS)
+
+
+def decompress_zstd_frame(frame):
+    # One-shot decompress() needs the content size in the frame header,
+    # the streaming decompressor doesn't
+    return load_codec('zstd').ZstdDecompressor().decompressobj().decompress(frame)
+
+
+def stream_chunks(log_file, new_decompressor):
+    """
+    Yield decompressed chunks of the concatenated streams (gzip members, xz
+    streams) of the file
+    """
+    decompressor = new_decompressor()
+    while True:
+        data = log_file.read(READ_SIZE)
+        if not data:
+            break
+        while data:
+            if getattr(decompressor, 'eof', False):
+                # The stream ended right at the end of the previous read,
+                # skip the padding before the next one
+                data = data.lstrip(b'\x00')
+                decompressor = new_decompressor()
+                continue
+            chunk = decompressor.decompress(data)
+            if chunk:
+                yield chunk
+            data = decompressor.unused_data
+            if data:
+                data = data.lstrip(b'\x00')
+                decompressor = new_decompressor()
+    if hasattr(decompressor, 'flush'):
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+
+
+class CompressedLogfile:
+    """
+    Compressed console log streamed through decompression, iterating yields
+    raw lines. Independent gzip members (BGZF) and zstd frames are
+    decompressed in parallel threads (workers, 0 for all cores) and
+    delivered in the file order.
+    """
+    def __init__(self, path, compression=None, workers=0):
+        self.path = path
+        self.compression = compression or detect_compression(path)
+        self.workers = workers or multiprocessing.cpu_count()
+        if self.compression not in ('gzip', 'xz', 'zstd'):
+            raise ValueError("Unsupported compression of " + path)
+        if self.compression != 'gzip':
+            load_codec(self.compression)
+        self.bytes_decompressed = 0
+
+    def parallel_chunks(self, data, pieces, decompress):
+        """
+        Decompress the (start, end) pieces of data in the threads, keep a
+        bounded number of them in flight
+        """
+        logger.info("Decompressing {0} {1} frames of {2} in {3} threads...".format(
+            len(pieces), self.compression, self.path, self.workers))
+        pool = ThreadPool(self.workers)
+        try:
+            in_flight = deque()
+            for start, end in pieces:
+                in_flight.append(pool.apply_async(decompress, (data[start:end],)))
+                if len(in_flight) > self.workers * 2:
+                    yield in_flight.popleft().get()
+            while in_flight:
+                yield in_flight.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def chunks(self):
+        """
+        Yield decompressed chunks of the file in order
+        """
+        with open(self.path, 'rb') as log_file:
+            if self.compression == 'xz':
+                for chunk in stream_chunks(log_file, load_codec('xz').LZMADecompressor):
+                    yield chunk
+                return
+            data = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if self.compression == 'gzip':
+                    pieces = bgzf_members(data) if self.workers > 1 else None
+                    decompress = inflate_member
+                else:
+                    pieces = zstd_frames(data)
+                    decompress = decompress_zstd_frame
+                if pieces and len(pieces) > 1 and self.workers > 1:
+                    for chunk in self.parallel_chunks(data, pieces, decompress):
+                        yield chunk
+                elif self.compression == 'gzip':
+                    for chunk in stream_chunks(log_file, lambda: zlib.decompressobj(GZIP_WBITS)):
+                        yield chunk
+                else:
+                    reader = load_codec('zstd').ZstdDecompressor().stream_reader(
+                        log_file, read_size=READ_SIZE, read_across_frames=True)
+                    while True:
+                        chunk = reader.read(READ_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+            finally:
+                data.close()
+
+    def __iter__(self):
+        tail = b''
+        for chunk in self.chunks():
+            self.bytes_decompressed += len(chunk)
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+        if tail:
+            yield tail
+
+    def close(self):
+        pass
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
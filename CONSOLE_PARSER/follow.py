@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import logging
+
+logger = logging.getLogger()
+
+READ_SIZE = 1 << 16
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_CLOEXEC = 0o2000000
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+# A new file appears under the followed name
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+# wd, mask, cookie, len of the name following the header
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """
+    Minimal inotify binding over ctypes
+    """
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask):
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding())
+        wd = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+        return wd
+
+    def rm_watch(self, wd):
+        # The watch is gone by itself if the file is deleted
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout=None):
+        """
+        Sleep until some events arrive (or the timeout) and drain them,
+        return the (wd, mask, name) of the events
+        """
+        try:
+            readable = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+        data = os.read(self.fd, 1 << 16)
+        events = []
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, name_len = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            events.append((wd, mask, data[pos:pos + name_len].rstrip(b'\x00')))
+            pos += name_len
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FollowLogfile:
+    """
+    Log file written by a console server, followed like tail -F: iterating
+    yields the raw lines as they are appended and sleeps in inotify in
+    between. A truncated file is read again from the start, a rotated one
+    is read up to its end before switching to the new file. Without
+    inotify the file is polled every poll_interval seconds.
+    """
+    def __init__(self, path, poll_interval=1.0, idle_timeout=60):
+        self.path = path
+        self.poll_interval = poll_interval
+        # Changes missed by inotify (network filesystems) are noticed after
+        # this many idle seconds
+        self.idle_timeout = idle_timeout
+        self.fd = None
+        self.inode = None
+        self.offset = 0
+        self.line_start = 0
+        self.start_position = None
+        self.file_wd = None
+        try:
+            self.inotify = Inotify()
+            self.inotify.add_watch(os.path.dirname(os.path.abspath(path)), DIR_EVENTS)
+        except (OSError, AttributeError) as e:
+            logger.warning("inotify is not available ({0}), polling {1}".format(e, path))
+            self.inotify = None
+
+    def start_at(self, inode, offset):
+        """
+        Start from the offset if the file is still the same one
+        """
+        self.start_position = (inode, offset)
+
+    def position(self):
+        """
+        (inode, offset) of the line being parsed
+        """
+        return self.inode, self.line_start
+
+    def open(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        self.fd = fd
+        self.inode = os.fstat(fd).st_ino
+        self.offset = 0
+        if self.start_position is not None:
+            inode, offset = self.start_position
+            self.start_position = None
+            if inode == self.inode and offset <= os.fstat(fd).st_size:
+                self.offset = os.lseek(fd, offset, os.SEEK_SET)
+        if self.inotify is not None:
+            self.file_wd = self.inotify.add_watch(self.path, FILE_EVENTS)
+        logger.info("Following {0} from offset {1}".format(self.path, self.offset))
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.file_wd is not None:
+            self.inotify.rm_watch(self.file_wd)
+            self.file_wd = None
+
+    def rotated(self):
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            # Moved away, the new file isn't created yet
+            return False
+
+    def wait(self):
+        if self.inotify is not None:
+            self.inotify.wait(self.idle_timeout)
+        else:
+            time.sleep(self.poll_interval)
+
+    def __iter__(self):
+        tail = b''
+        while True:
+            if self.fd is None and not self.open():
+                self.wait()
+                continue
+            data = os.read(self.fd, READ_SIZE)
+            if data:
+                line_start = self.offset - len(tail)
+                self.offset += len(data)
+                lines = (tail + data).split(b'\n')
+                tail = lines.pop()
+                for line in lines:
+                    self.line_start = line_start
+                    line_start += len(line) + 1
+                    yield line + b'\n'
+                continue
+            if os.fstat(self.fd).st_size < self.offset:
+                logger.warning("{0} is truncated, reading it from the start".format(self.path))
+                self.offset = os.lseek(self.fd, 0, os.SEEK_SET)
+                tail = b''
+                continue
+            if self.rotated():
+                logger.info("{0} is rotated".format(self.path))
+                if tail:
+                    # Unterminated last line of the old file
+                    self.line_start = self.offset - len(tail)
+                    yield tail + b'\n'
+                    tail = b''
+                self.close()
+                continue
+            self.wait()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
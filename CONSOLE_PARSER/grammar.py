@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import re
+import logging
+from collections import namedtuple
+
+import yaml
+
+from blocks import BlockMatcher, BLOCK_MARKERS, decode_line
+from blockindex import BLOCK_END_MARKS
+
+logger = logging.getLogger()
+
+# Grammars by file name, compiled once for all the sessions and logs
+GRAMMAR_CACHE = {}
+
+# Named groups of the record patterns, renamed to plain groups in the
+# combined regexp (the same name may appear in several records)
+NAMED_GROUP_RE = re.compile(r'(?<!\\)\(\?P<(\w+)>')
+
+# Field type name -> conversion of the matched raw bytes
+FIELD_TYPES = {
+    'str': decode_line,
+    'bytes': lambda value: value,
+    'int': int,
+    'hex': lambda value: int(value, 16),
+}
+
+
+def literal_parts(literal):
+    """
+    Raw substrings of a record or marker literal: a string or a list of the
+    strings a line contains all of
+    """
+    if isinstance(literal, (list, tuple)):
+        return tuple(part.encode('utf-8') for part in literal)
+    return (literal.encode('utf-8'),)
+
+
+def load_grammar(grammar_file):
+    if grammar_file not in GRAMMAR_CACHE:
+        with open(grammar_file) as grammar:
+            GRAMMAR_CACHE[grammar_file] = Grammar(yaml.safe_load(grammar), grammar_file)
+    return GRAMMAR_CACHE[grammar_file]
+
+
+class RecordSet:
+    """
+    Record extractors of a block compiled into a single regexp. Records are
+    tried in the grammar order, the first one matching the line wins. A
+    record spec is a mapping of:
+        record - record type name
+        pattern - regexp with the named groups of the record fields
+        search - find the pattern anywhere in the line (default is at the
+            line start)
+        literal - substring every line of the record contains, or the list
+            of such substrings
+        fields - field name -> type (str, bytes, int or hex), str by default
+    """
+    def __init__(self, name, specs):
+        self.name = name
+        alternatives = []
+        # outer group index -> (record type, [(group index, conversion)])
+        self.records = {}
+        self.literals = []
+        group_index = 1
+        for spec in specs:
+            if '(?P=' in spec['pattern']:
+                raise ValueError("Record {0}.{1}: named backreferences aren't supported".format(
+                    name, spec['record']))
+            record_re = re.compile(spec['pattern'])
+            field_names = sorted(record_re.groupindex, key=record_re.groupindex.get)
+            record_type = namedtuple(spec['record'], ['record'] + field_names)
+            field_types = spec.get('fields') or {}
+            fields = [(group_index + record_re.groupindex[field],
+                       FIELD_TYPES[field_types.get(field, 'str')])
+                      for field in field_names]
+            self.records[group_index] = (record_type, fields)
+            pattern = NAMED_GROUP_RE.sub('(', spec['pattern'])
+            if spec.get('search'):
+                pattern = '.*?(?:' + pattern + ')'
+            alternatives.append('(' + pattern + ')')
+            group_index += 1 + record_re.groups
+            self.literals.append(spec.get('literal'))
+        self.record_re = re.compile('|'.join(alternatives).encode('ascii'))
+        # Lines without any literal can't be a record, unless some record
+        # has no literal
+        if all(self.literals):
+            self.literals = tuple(literal_parts(literal) for literal in self.literals)
+            # First part of every literal, for the scans of the whole log
+            self.prefilter = tuple(sorted(set(parts[0] for parts in self.literals)))
+        else:
+            self.literals = None
+            self.prefilter = None
+
+    def match(self, line):
+        """
+        Return the record of the raw line or None
+        """
+        if self.literals is not None:
+            for parts in self.literals:
+                if all(part in line for part in parts):
+                    break
+            else:
+                return None
+        match = self.record_re.match(line)
+        if match is None:
+            return None
+        record_type, fields = self.records[match.lastindex]
+        values = []
+        for index, convert in fields:
+            value = match.group(index)
+            values.append(convert(value) if value is not None else None)
+        return record_type(record_type.__name__, *values)
+
+    def scan(self, dbg_log_block):
+        """
+        Yield the records of the block lines (the undecoded ones of the
+        block views)
+        """
+        if hasattr(dbg_log_block, 'raw_lines'):
+            lines = dbg_log_block.raw_lines()
+        else:
+            lines = (line if isinstance(line, bytes) else line.encode('utf-8')
+                     for line in dbg_log_block)
+        for line in lines:
+            record = self.match(line)
+            if record is not None:
+                yield record
+
+
+class Grammar:
+    """
+    Console dialect of a BIOS: the block start and end markers and the
+    records the block processors read from the blocks. The grammar file is
+    YAML with:
+        markers - list of block markers in the order of precedence, each
+            of kind, start and end regexps (the first group is the block
+            name), start_literal and end_literal (substrings of the marker
+            lines, the end_literal may be a list of substrings, the first
+            one is the prefilter of the block index scan) and description. The built in markers are used if the
+            grammar has none.
+        records - record set name -> list of the record specs (RecordSet)
+    """
+    def __init__(self, grammar, path=None):
+        self.path = path
+        markers = grammar.get('markers')
+        if markers:
+            self.markers = tuple(
+                (marker['kind'], re.compile(marker['start']),
+                 re.compile(marker['end']) if marker.get('end') else None,
+                 marker['start_literal'], marker.get('description', marker['kind']))
+                for marker in markers)
+            self.end_marks = dict((marker['kind'], literal_parts(marker['end_literal']))
+                                  for marker in markers if marker.get('end'))
+        else:
+            self.markers = BLOCK_MARKERS
+            self.end_marks = BLOCK_END_MARKS
+        self.matcher = BlockMatcher(self.markers)
+        self.record_sets = dict((name, RecordSet(name, specs))
+                                for name, specs in (grammar.get('records') or {}).items())
+        logger.debug("Compiled grammar {0}: {1} markers, record sets {2}".format(
+            path, len(self.markers), ', '.join(sorted(self.record_sets))))
+
+    def marker_literal(self, kind):
+        return [marker[3] for marker in self.markers if marker[0] == kind][0]
+
+    def records(self, record_set, dbg_log_block):
+        return self.record_sets[record_set].scan(dbg_log_block)
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
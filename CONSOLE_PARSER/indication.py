@@ -3,7 +3,8 @@ global LED_EXISTENCE
 # Led highlighting is turned off by default
 LED_EXISTENCE = False
 
-init_leds():
+def init_leds():
+    global LED_EXISTENCE, LED_DIMM_MATCH_TABLE, PCA9685_I2C_BUS, PCA9685_I2C_ADDRESS, pca9685pw
     # For LED highlighting using PCA9685
     import smbus
     import pca9685pw
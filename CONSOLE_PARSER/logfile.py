@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import mmap
+
+from blocks import ANSI_ESCAPE_MARK
+
+COUNT_CHUNK_SIZE = 1 << 20
+
+
+class MmapLogfile:
+    """
+    Memory mapped console log file: lines outside of the processed blocks are
+    skipped with bytes level searches and never even sliced
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as log_file:
+            self.data = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data)
+        self.line_span = None
+        self.lines_skipped = 0
+        self.bytes_skipped = 0
+
+    def next_candidate(self, literals, next_positions, pos, limit):
+        """
+        Return offset of the line start of the nearest literal occurrence
+        after pos (or limit if there is none before it). next_positions
+        caches the next occurrence of every literal, so each literal is
+        searched through the file only once.
+        """
+        candidate = limit
+        for index, literal in enumerate(literals):
+            found = next_positions[index]
+            if found is not None and found < pos:
+                found = self.data.find(literal, pos)
+                if found < 0:
+                    found = None
+                next_positions[index] = found
+            if found is not None and found < candidate:
+                candidate = found
+        if candidate == limit:
+            return candidate
+        line_start = self.data.rfind(b'\n', pos, candidate)
+        return pos if line_start < 0 else line_start + 1
+
+    def count_lines(self, start, end):
+        # mmap has no count(), slice it by chunks to keep copies small
+        lines = 0
+        while start < end:
+            chunk_end = min(start + COUNT_CHUNK_SIZE, end)
+            lines += self.data[start:chunk_end].count(b'\n')
+            start = chunk_end
+        return lines
+
+    def lines(self, literals, open_blocks, ranges=None):
+        """
+        Yield raw lines. While open_blocks (the parser block stack) is
+        empty only the lines containing one of the literals are yielded.
+        ranges limits reading to the sorted (start, end) byte ranges.
+        """
+        data = self.data
+        # Escape sequences can split a marker literal, so such lines are
+        # always handed to the line level prefilter
+        literals = list(literals)
+        literals.append(ANSI_ESCAPE_MARK)
+        # -1 forces the first search for every literal
+        next_positions = [-1] * len(literals)
+        if ranges is None:
+            ranges = [(0, self.size)]
+        pos = 0
+        for range_start, range_end in ranges:
+            if range_start > pos:
+                self.bytes_skipped += range_start - pos
+                pos = range_start
+            while pos < range_end:
+                if not open_blocks:
+                    line_start = self.next_candidate(literals, next_positions, pos, range_end)
+                    if line_start > pos:
+                        self.lines_skipped += self.count_lines(pos, line_start)
+                        self.bytes_skipped += line_start - pos
+                        pos = line_start
+                        if pos >= range_end:
+                            break
+                line_end = data.find(b'\n', pos, range_end)
+                if line_end < 0:
+                    line_end = range_end
+                else:
+                    line_end += 1
+                # Offsets of the yielded line, so the caller can keep the line
+                # without copying it
+                self.line_span = (pos, line_end)
+                yield data[pos:line_end]
+                pos = line_end
+        if self.size > pos:
+            self.bytes_skipped += self.size - pos
+
+    def close(self):
+        self.data.close()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import json
+import hashlib
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+
+def block_digest(block, *salt):
+    """
+    Digest of the block lines (undecoded ones of the block views) and salt
+    """
+    digest = hashlib.sha1(json.dumps(salt, default=str).encode('utf-8'))
+    lines = block.raw_lines() if hasattr(block, 'raw_lines') else block
+    for line in lines:
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        digest.update(line)
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class BlockMemo:
+    """
+    Bounded LRU of the data parsed from the blocks keyed by the digest of
+    the block contents, backed by an optional on-disk store (ResultCache)
+    so the data outlives the process. Values are plain JSON data shared
+    between the callers, they must not be modified.
+    """
+    def __init__(self, max_entries=256, store=None, salt=''):
+        self.max_entries = max_entries
+        self.store = store
+        self.salt = salt
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, func_name, block, socket_id):
+        return block_digest(block, self.salt, func_name, socket_id)
+
+    def get(self, key):
+        """
+        Return (found, value) of the key
+        """
+        with self.lock:
+            if key in self.entries:
+                value = self.entries.pop(key)
+                self.entries[key] = value
+                self.hits += 1
+                return True, value
+        if self.store is not None:
+            stored = self.store.get(key)
+            if stored is not None:
+                self.remember(key, stored['value'])
+                with self.lock:
+                    self.hits += 1
+                return True, stored['value']
+        with self.lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        # Same data whether it comes from the memory or from the store
+        value = json.loads(json.dumps(value))
+        self.remember(key, value)
+        if self.store is not None:
+            self.store.put(key, {'value': value})
+        return value
+
+    def remember(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def memoized_block(parse):
+    """
+    Memoize the block parser method parse(self, dbg_log_block, socket_id)
+    in self.block_memo (if the object has one): an unchanged block costs a
+    digest instead of parsing. parse has to return plain JSON data and its
+    only effect has to be the returned value.
+    """
+    @wraps(parse)
+    def memoized(self, dbg_log_block, socket_id=None):
+        memo = getattr(self, 'block_memo', None)
+        if memo is None:
+            return parse(self, dbg_log_block, socket_id)
+        key = memo.key(parse.__name__, dbg_log_block, socket_id)
+        found, value = memo.get(key)
+        if not found:
+            value = memo.put(key, parse(self, dbg_log_block, socket_id))
+        return value
+    return memoized
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
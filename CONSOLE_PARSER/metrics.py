@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import time
+import errno
+import numbers
+import logging
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+logger = logging.getLogger()
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_PATHS = ('/', '/metrics')
+# Min seconds between the samples the line and byte rates are computed from
+RATE_INTERVAL = 5.0
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, numbers.Integral):
+        return str(value)
+    return repr(float(value))
+
+
+class MetricsText:
+    """
+    Samples of the metrics in the Prometheus text format, the HELP and TYPE
+    lines are written before the first sample of every metric
+    """
+    def __init__(self):
+        self.lines = []
+        self.declared = set()
+
+    def add(self, name, metric_type, help_text, value, labels=None, suffix=''):
+        if name not in self.declared:
+            self.declared.add(name)
+            self.lines.append('# HELP {0} {1}'.format(name, help_text))
+            self.lines.append('# TYPE {0} {1}'.format(name, metric_type))
+        label_text = ''
+        if labels:
+            label_text = '{' + ','.join('{0}="{1}"'.format(key, escape_label(value))
+                                        for key, value in sorted(labels.items())) + '}'
+        self.lines.append('{0}{1}{2} {3}'.format(name, suffix, label_text, format_value(value)))
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+class SourceMeter:
+    """
+    Lines and bytes read from a console source
+    """
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.last_line = None
+        # (time, lines, bytes) the rates are computed from
+        self.sample = (time.time(), 0, 0)
+        self.rates = (0.0, 0.0)
+
+    def rate(self, now):
+        sample_time, lines, nbytes = self.sample
+        elapsed = now - sample_time
+        if elapsed >= RATE_INTERVAL:
+            self.rates = ((self.lines - lines) / elapsed, (self.bytes - nbytes) / elapsed)
+            self.sample = (now, self.lines, self.bytes)
+        return self.rates
+
+
+class ParserMetrics:
+    """
+    Progress of a parser: the sources are metered while the parsing thread
+    reads them, the state of the blocks, the processors and the SOL session
+    is read from the parser when the metrics are rendered
+    """
+    def __init__(self, parser):
+        self.parser = parser
+        self.sources = {}
+        self.lock = threading.Lock()
+
+    def meter(self, lines, source):
+        """
+        Iterate the lines of the source counting them
+        """
+        meter = self.sources.setdefault(source, SourceMeter())
+        for line in lines:
+            meter.lines += 1
+            meter.bytes += len(line)
+            meter.last_line = time.time()
+            yield line
+
+    def render(self):
+        with self.lock:
+            return self.collect().render()
+
+    def collect(self):
+        now = time.time()
+        text = MetricsText()
+        for source, meter in sorted(list(self.sources.items())):
+            labels = {'source': source}
+            lines_rate, bytes_rate = meter.rate(now)
+            text.add('bdsm_lines_total', 'counter', 'Console lines read', meter.lines, labels)
+            text.add('bdsm_bytes_total', 'counter', 'Console bytes read', meter.bytes, labels)
+            text.add('bdsm_lines_per_second', 'gauge', 'Console lines read per second',
+                     lines_rate, labels)
+            text.add('bdsm_bytes_per_second', 'gauge', 'Console bytes read per second',
+                     bytes_rate, labels)
+            if meter.last_line is not None:
+                text.add('bdsm_last_line_age_seconds', 'gauge',
+                         'Seconds since the last line of the source', now - meter.last_line, labels)
+
+        parser = self.parser
+        text.add('bdsm_boot_session', 'gauge', 'Boot session being parsed', parser.session_id)
+        text.add('bdsm_open_blocks', 'gauge', 'Depth of the open debug log blocks stack',
+                 len(parser.open_blocks))
+        block_buffer = parser.block_buffer
+        if block_buffer is not None:
+            for block_name, lines, nbytes in block_buffer.snapshot():
+                labels = {'block': block_name}
+                text.add('bdsm_block_buffer_lines', 'gauge', 'Lines buffered for the open block',
+                         lines, labels)
+                text.add('bdsm_block_buffer_bytes', 'gauge', 'Bytes buffered for the open block',
+                         nbytes, labels)
+            text.add('bdsm_block_buffers_spilled_total', 'counter',
+                     'Block buffers spilled to disk', block_buffer.spilled_blocks)
+
+        pipeline = parser.block_pipeline
+        if pipeline is not None:
+            text.add('bdsm_processor_queue_depth', 'gauge',
+                     'Blocks submitted to the processors and not delivered yet', len(pipeline))
+            text.add('bdsm_processor_latency_seconds', 'summary',
+                     'Seconds from the block end to the delivery of its processor result',
+                     pipeline.latency_total, suffix='_sum')
+            text.add('bdsm_processor_latency_seconds', 'summary', '',
+                     pipeline.delivered, suffix='_count')
+            text.add('bdsm_processor_last_latency_seconds', 'gauge',
+                     'Latency of the last delivered block', pipeline.last_latency)
+            text.add('bdsm_processor_failures_total', 'counter',
+                     'Blocks whose processor raised an exception', pipeline.failures)
+
+        sol_session = parser.sol_session
+        if sol_session is not None:
+            text.add('bdsm_sol_dropped_bytes_total', 'counter',
+                     'SOL console bytes dropped on the receive buffer overflow',
+                     sol_session.dropped_bytes)
+            text.add('bdsm_sol_session_errors_total', 'counter',
+                     'SOL session errors, the console output is lost until it recovers',
+                     sol_session.session_errors)
+            text.add('bdsm_sol_pending_bytes', 'gauge',
+                     'SOL console bytes received and not split into lines yet',
+                     len(sol_session.sol_data))
+        return text
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in METRICS_PATHS:
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # The unix socket clients have no address to log
+        logger.debug("Metrics request: " + format % args)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixMetricsServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsExporter:
+    """
+    Serve the parser metrics over HTTP on the local port and/or the unix
+    socket, and rewrite the textfile (node_exporter textfile collector, a
+    .prom file) every interval seconds. Everything runs in daemon threads.
+    """
+    def __init__(self, metrics, port=0, socket_path='', textfile='', interval=15,
+                 host='127.0.0.1'):
+        self.metrics = metrics
+        self.socket_path = socket_path
+        self.textfile = textfile
+        self.interval = interval
+        self.servers = []
+        self.stopped = threading.Event()
+        if port:
+            self.serve(MetricsServer((host, port), MetricsHandler))
+            logger.info("Metrics are served on http://{0}:{1}/metrics".format(host, port))
+        if socket_path:
+            try:
+                os.unlink(socket_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            self.serve(UnixMetricsServer(socket_path, MetricsHandler))
+            logger.info("Metrics are served on the unix socket " + socket_path)
+        if textfile:
+            self.start(self.refresh_textfile)
+            logger.info("Metrics are written to {0} every {1} s".format(textfile, interval))
+
+    def start(self, target):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self, server):
+        server.metrics = self.metrics
+        self.servers.append(server)
+        self.start(server.serve_forever)
+
+    def write_textfile(self):
+        # Renamed in place, the collector never reads a partial file
+        tmp_file = self.textfile + '.tmp'
+        with open(tmp_file, 'w') as textfile:
+            textfile.write(self.metrics.render())
+        os.rename(tmp_file, self.textfile)
+
+    def refresh_textfile(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write_textfile()
+            except (IOError, OSError) as e:
+                logger.warning("Can't write metrics to {0}: {1}".format(self.textfile, e))
+
+    def close(self):
+        """
+        Stop serving, the textfile is left with the final metrics
+        """
+        self.stopped.set()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self.textfile:
+            self.write_textfile()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -4,7 +4,22 @@ from __future__ import print_function
 
 import time
 import yaml
-import rethinkdb
+from collections import defaultdict
+
+
+def tree():
+    return defaultdict(tree)
+
+
+def as_tree(mapping):
+    """
+    Autovivifying tree of the plain (e.g. JSON loaded) mapping
+    """
+    node = tree()
+    for key, value in mapping.items():
+        node[key] = as_tree(value) if isinstance(value, dict) else value
+    return node
+
 
 class MemorySubsytemEventsLogger():
     def __init__(self, baseboard):
@@ -46,6 +61,27 @@ class MemorySubsytemEventsLogger():
                 'dimm_hppr_events': []
             }
         }
+        # Values of the DIMM info table: socket (or System) -> key or
+        # channel -> parameter, the logger is indexed like the table
+        self.dimm_info = tree()
+
+    def __getitem__(self, key):
+        return self.dimm_info[key]
+
+    def __setitem__(self, key, value):
+        self.dimm_info[key] = value
+
+    def items(self):
+        return self.dimm_info.items()
+
+    def restore(self, values):
+        """
+        Set the attributes saved as plain data (e.g. in the result cache)
+        """
+        for name, value in values.items():
+            if name == 'dimm_info':
+                value = as_tree(value)
+            setattr(self, name, value)
 
     def format_dimm_spec(self):
         dimm_spec_struct = {
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+
+PARSER_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSER_SCRIPT = os.path.join(PARSER_DIR, 'bdsm.py')
+BENCH_SCRIPT = os.path.abspath(__file__)
+BENCH_CONFIG = 'STEP.ini'
+BENCH_BASEBOARD = 'MY81-EX0-Y3N'
+# Synthetic logs of the throughput benchmark: lines, sockets, error rate,
+# ANSI rate
+SYNTH_LOG = 'synth-{0}-s{1}-e{2}-a{3}-r{4}.log'
+SYNTH_DIR = os.path.join(tempfile.gettempdir(), 'bdsm-synth')
+SYNTH_LINES = (10000, 100000, 1000000)
+
+# Median wall time of the parser start (interpreter, imports and the
+# command line parsing) on file mode, in ms
+STARTUP_BUDGET_MS = 250
+
+CLIENT_DESCRIPTION = """Performance benchmarks of the console parser"""
+HELPS = {
+    'startup': 'time the parser start and break it down by the imported modules',
+    'script': 'parser script (default bdsm.py)',
+    'python': 'interpreter running the parser (default this one)',
+    'runs': 'number of timed runs',
+    'budget': 'fail if the median run is slower, in ms (default {0}, 0 disables)'.format(
+        STARTUP_BUDGET_MS),
+    'top': 'number of the slowest imports to show',
+    'record': 'append the result to the JSON lines history file',
+    'throughput': 'time BDSM.parse_debug_log and every processor on the logs',
+    'logs': 'console logs (default synthetic ones)',
+    'lines': 'sizes of the synthetic logs in lines (default {0})'.format(
+        ','.join(str(lines) for lines in SYNTH_LINES)),
+    'sockets': 'CPU sockets of the synthetic logs',
+    'error_rate': 'error rate of the synthetic logs',
+    'ansi_rate': 'ANSI colored share of the synthetic log lines',
+    'seed': 'random seed of the synthetic logs',
+    'synth_dir': 'directory of the generated logs, reused by the next runs',
+    'mode': 'read the log mmapped (file) or line by line from a stream (stream)',
+    'config': 'parser config file (default {0})'.format(BENCH_CONFIG),
+    'baseboard': 'baseboard model of the parsed server',
+    'parse': 'single timed parse of the log, the throughput benchmark runs it',
+    'log': 'console log',
+    'result': 'write the result as JSON to the file',
+    'compare': 'compare the last two results of every benchmark in the history file',
+    'history': 'JSON lines history file',
+}
+
+IMPORT_TIME_HEADER = 'import time:'
+
+# Import timer for the interpreters without -X importtime (python < 3.7),
+# writes the same report: self and cumulative microseconds of the first
+# import of every module, nested imports are indented and come first
+IMPORT_TIMER = r'''
+import os, sys, time, runpy
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+real_import = builtins.__import__
+children = []
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return real_import(name, *args, **kwargs)
+    children.append(0.0)
+    start = time.time()
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        cumulative = time.time() - start
+        self_time = cumulative - children.pop()
+        if children:
+            children[-1] += cumulative
+        sys.stderr.write('import time: {0:>9} | {1:>10} | {2}{3}\n'.format(
+            int(self_time * 1e6), int(cumulative * 1e6), '  ' * len(children), name))
+builtins.__import__ = timed_import
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+
+
+def argument_parsing():
+    """
+    Parse and return command line arguments
+    """
+    parser = argparse.ArgumentParser(description=CLIENT_DESCRIPTION)
+    subparsers = parser.add_subparsers(dest='command')
+    startup = subparsers.add_parser('startup', help=HELPS['startup'])
+    startup.add_argument('--script', help=HELPS['script'], default=PARSER_SCRIPT)
+    startup.add_argument('--python', help=HELPS['python'], default=sys.executable)
+    startup.add_argument('-n', '--runs', help=HELPS['runs'], type=int, default=10)
+    startup.add_argument('--budget-ms', help=HELPS['budget'], type=float,
+                         default=STARTUP_BUDGET_MS)
+    startup.add_argument('--top', help=HELPS['top'], type=int, default=15)
+    startup.add_argument('--record', help=HELPS['record'], metavar='FILE')
+
+    throughput = subparsers.add_parser('throughput', help=HELPS['throughput'])
+    throughput.add_argument('logs', help=HELPS['logs'], nargs='*')
+    throughput.add_argument('--lines', help=HELPS['lines'],
+                            type=lambda value: [int(lines) for lines in value.split(',')],
+                            default=list(SYNTH_LINES))
+    throughput.add_argument('--sockets', help=HELPS['sockets'], type=int, default=2)
+    throughput.add_argument('--error-rate', help=HELPS['error_rate'], type=float, default=0.01)
+    throughput.add_argument('--ansi-rate', help=HELPS['ansi_rate'], type=float, default=0.01)
+    throughput.add_argument('--seed', help=HELPS['seed'], type=int, default=0)
+    throughput.add_argument('--synth-dir', help=HELPS['synth_dir'], default=SYNTH_DIR)
+    throughput.add_argument('--mode', help=HELPS['mode'], choices=('file', 'stream'),
+                            default='file')
+    throughput.add_argument('-c', '--config', help=HELPS['config'], default=BENCH_CONFIG)
+    throughput.add_argument('--baseboard', help=HELPS['baseboard'], default=BENCH_BASEBOARD)
+    throughput.add_argument('--python', help=HELPS['python'], default=sys.executable)
+    throughput.add_argument('--record', help=HELPS['record'], metavar='FILE')
+
+    parse = subparsers.add_parser('parse', help=HELPS['parse'])
+    parse.add_argument('log', help=HELPS['log'])
+    parse.add_argument('--mode', help=HELPS['mode'], choices=('file', 'stream'),
+                       default='file')
+    parse.add_argument('-c', '--config', help=HELPS['config'], default=BENCH_CONFIG)
+    parse.add_argument('--baseboard', help=HELPS['baseboard'], default=BENCH_BASEBOARD)
+    parse.add_argument('--result', help=HELPS['result'], metavar='FILE')
+
+    compare = subparsers.add_parser('compare', help=HELPS['compare'])
+    compare.add_argument('history', help=HELPS['history'])
+    return parser.parse_args()
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def run_quiet(command):
+    """
+    Run the command with its output dropped, return its stderr
+    """
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(command, cwd=PARSER_DIR, stdout=devnull,
+                                   stderr=subprocess.PIPE)
+        stderr = process.communicate()[1]
+    return stderr.decode('utf-8', 'replace')
+
+
+def git_commit():
+    """
+    Short hash of the checked out commit of the parser, None out of git
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                             cwd=PARSER_DIR, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode('ascii').strip()
+
+
+def record(result, history_file):
+    if history_file:
+        with open(history_file, 'a') as history:
+            history.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+def startup_time(python, script, runs):
+    """
+    Wall times (ms) of the parser runs exiting right after the command
+    line is parsed, every module of the parser is imported by then
+    """
+    times = []
+    for run in range(runs):
+        start = time.time()
+        run_quiet([python, script, '--help'])
+        times.append((time.time() - start) * 1000)
+    return times
+
+
+def has_importtime(python):
+    return IMPORT_TIME_HEADER in run_quiet([python, '-X', 'importtime', '-c', 'pass'])
+
+
+def import_times(python, script):
+    """
+    Return the (self us, cumulative us, depth, module) of the modules the
+    parser imports
+    """
+    if has_importtime(python):
+        stderr = run_quiet([python, '-X', 'importtime', script, '--help'])
+    else:
+        stderr = run_quiet([python, '-c', IMPORT_TIMER, script, '--help'])
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_HEADER):
+            continue
+        fields = line[len(IMPORT_TIME_HEADER):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(fields[0]), int(fields[1]), depth, name.strip()))
+    return imports
+
+
+def startup(args):
+    times = startup_time(args.python, args.script, args.runs)
+    imports = import_times(args.python, args.script)
+    top_level = [(cumulative, name) for self_time, cumulative, depth, name in imports
+                 if depth == 0]
+    result = {
+        'benchmark': 'startup',
+        'time': int(time.time()),
+        'commit': git_commit(),
+        'python': args.python,
+        'script': os.path.basename(args.script),
+        'runs': args.runs,
+        'median_ms': round(median(times), 1),
+        'min_ms': round(min(times), 1),
+        'imports_ms': round(sum(cumulative for cumulative, name in top_level) / 1000.0, 1),
+        'modules': len(imports),
+        'budget_ms': args.budget_ms,
+    }
+    print("Startup of {0}: median {1} ms, min {2} ms over {3} runs".format(
+        result['script'], result['median_ms'], result['min_ms'], args.runs))
+    print("{0} modules imported in {1} ms, the slowest ones:".format(
+        result['modules'], result['imports_ms']))
+    print('{0:>10} {1:>10}  {2}'.format('self ms', 'cumul. ms', 'module'))
+    for self_time, cumulative, depth, name in sorted(imports, reverse=True)[:args.top]:
+        print('{0:>10.1f} {1:>10.1f}  {2}'.format(self_time / 1000.0, cumulative / 1000.0, name))
+    print("Top level imports:")
+    for cumulative, name in sorted(top_level, reverse=True)[:args.top]:
+        print('{0:>21.1f}  {1}'.format(cumulative / 1000.0, name))
+    record(result, args.record)
+    if args.budget_ms and result['median_ms'] > args.budget_ms:
+        print("Over the startup budget of {0} ms".format(args.budget_ms))
+        return 1
+    return 0
+
+
+def synthetic_logs(args):
+    """
+    Generate the missing synthetic logs of the requested sizes, return
+    their paths
+    """
+    from synthlog import write_log
+
+    if not os.path.isdir(args.synth_dir):
+        os.makedirs(args.synth_dir)
+    logs = []
+    for lines in args.lines:
+        log = os.path.join(args.synth_dir, SYNTH_LOG.format(
+            lines, args.sockets, args.error_rate, args.ansi_rate, args.seed))
+        if not os.path.exists(log):
+            print("Generating {0}".format(log))
+            tmp_log = log + '.tmp'
+            with open(tmp_log, 'wb') as log_file:
+                write_log(log_file, lines, sockets=args.sockets, error_rate=args.error_rate,
+                          ansi_rate=args.ansi_rate, seed=args.seed)
+            os.rename(tmp_log, log)
+        logs.append(log)
+    return logs
+
+
+def parse(args):
+    """
+    Parse the log in this process the way bdsm.py does, with the processors
+    run inline and profiled, and write the throughput, the peak RSS and the
+    processors stats as JSON
+    """
+    import resource
+    from bdsm import BDSM, OPTIONS, Conf, MemorySubsytemEventsLogger
+    from bdsm import load_mission_plugins, mission_options
+    from procprof import ProcessorProfiler, PROFILE_OPTIONS
+
+    load_mission_plugins()
+    conf = Conf(mission_options(OPTIONS), args.config, log=False)
+    conf['base'].update(PROFILE_OPTIONS)
+    parser = BDSM(os.path.abspath(args.log), conf, MemorySubsytemEventsLogger(args.baseboard))
+    if args.mode == 'stream':
+        parser.dbg_log_data = open(args.log, 'rb')
+    # Processor failures are counted, a broken processor doesn't stop the
+    # benchmark; tracemalloc would slow everything down
+    parser.profiler = ProcessorProfiler(keep_going=True, trace_malloc=False)
+    parser.profiler.run(None, parser.parse_debug_log)
+    seconds = parser.profiler.wall
+    nbytes = os.path.getsize(args.log)
+    processors = {}
+    for func_name, stats in parser.profiler.stats.items():
+        processors[func_name] = {
+            'calls': stats.calls,
+            'lines': stats.lines,
+            'wall_s': round(stats.wall, 6),
+            'cpu_s': round(stats.cpu, 6),
+            'lines_per_s': int(stats.lines / stats.wall) if stats.wall else None,
+            'errors': stats.errors,
+        }
+    result = {
+        'lines': parser.lines_scanned,
+        'bytes': nbytes,
+        'seconds': round(seconds, 4),
+        'cpu_seconds': round(parser.profiler.cpu, 4),
+        'lines_per_s': int(parser.lines_scanned / seconds) if seconds else None,
+        'mb_per_s': round(nbytes / seconds / 2**20, 2) if seconds else None,
+        # KiB on Linux, bytes on macOS
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'processors': processors,
+    }
+    if args.result:
+        with open(args.result, 'w') as result_file:
+            json.dump(result, result_file, sort_keys=True)
+    else:
+        print(json.dumps(result, indent=2, sort_keys=True))
+    return 0
+
+
+def throughput(args):
+    """
+    Parse every log in a fresh interpreter (the peak RSS is the one of the
+    log) and report the lines/s, MB/s and peak RSS of the parser and the
+    processors
+    """
+    logs = args.logs or synthetic_logs(args)
+    commit = git_commit()
+    failed = 0
+    for log in logs:
+        result_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        result_file.close()
+        try:
+            command = [args.python, BENCH_SCRIPT, 'parse', os.path.abspath(log),
+                       '--mode', args.mode, '--config', args.config,
+                       '--baseboard', args.baseboard, '--result', result_file.name]
+            stderr = run_quiet(command)
+            with open(result_file.name) as result_json:
+                content = result_json.read()
+        finally:
+            os.unlink(result_file.name)
+        if not content:
+            print("Parsing of {0} failed:\n{1}".format(log, stderr))
+            failed += 1
+            continue
+        result = json.loads(content)
+        result.update({
+            'benchmark': 'throughput',
+            'time': int(time.time()),
+            'commit': commit,
+            'python': args.python,
+            'log': os.path.basename(log),
+            'mode': args.mode,
+            'config': args.config,
+        })
+        print("{0}: {1} lines, {2:.1f} MB in {3} s: {4} lines/s, {5} MB/s, "
+              "peak RSS {6} KiB".format(result['log'], result['lines'], result['bytes'] / 2.0**20,
+                                        result['seconds'], result['lines_per_s'],
+                                        result['mb_per_s'], result['peak_rss_kb']))
+        print('{0:>40} {1:>7} {2:>10} {3:>10} {4:>12} {5:>6}'.format(
+            'processor', 'calls', 'lines', 'wall s', 'lines/s', 'errors'))
+        for func_name, stats in sorted(result['processors'].items(),
+                                       key=lambda item: -item[1]['wall_s']):
+            print('{0:>40} {1:>7} {2:>10} {3:>10.4f} {4:>12} {5:>6}'.format(
+                func_name, stats['calls'], stats['lines'], stats['wall_s'],
+                stats['lines_per_s'] if stats['lines_per_s'] is not None else '-',
+                stats['errors']))
+        record(result, args.record)
+    return 1 if failed else 0
+
+
+def compare(args):
+    """
+    Print the change of the last result of every benchmark against the
+    previous one in the history
+    """
+    runs = {}
+    with open(args.history) as history:
+        for line in history:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            key = (result['benchmark'], result.get('log', result.get('script')),
+                   result.get('mode', ''), result.get('python'))
+            runs.setdefault(key, []).append(result)
+    metrics = {
+        'startup': ('median_ms', 'modules'),
+        'throughput': ('lines_per_s', 'mb_per_s', 'peak_rss_kb'),
+    }
+    for key in sorted(runs, key=lambda key: tuple(str(part) for part in key)):
+        if len(runs[key]) < 2:
+            continue
+        previous, last = runs[key][-2:]
+        print("{0} {1} {2}: {3} -> {4}".format(key[0], key[1], key[2],
+                                               previous.get('commit'), last.get('commit')))
+        for metric in metrics.get(key[0], ()):
+            before, after = previous.get(metric), last.get(metric)
+            if not before or after is None:
+                continue
+            print('{0:>20} {1:>12} {2:>12} {3:>+8.1f}%'.format(
+                metric, before, after, (after - before) * 100.0 / before))
+    return 0
+
+
+if __name__ == '__main__':
+    args = argument_parsing()
+    if args.command == 'startup':
+        sys.exit(startup(args))
+    elif args.command == 'throughput':
+        sys.exit(throughput(args))
+    elif args.command == 'parse':
+        sys.exit(parse(args))
+    elif args.command == 'compare':
+        sys.exit(compare(args))
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import time
+import logging
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger()
+
+
+class BlockPipeline:
+    """
+    Run block processors in a pool of worker threads while the console is
+    being read. Results are handed back in the order the blocks were
+    submitted, whatever order the workers finish them in.
+
+    Every block may come with a completion function (e.g. the testplan
+    update and the functions it unlocks) called once its processor
+    succeeded. With a single worker the processors and the completions run
+    in that worker in the block order, so everything touching the parser
+    state runs in one thread while the console is read. With no workers
+    they run inline on submit. More workers let the processors overlap,
+    the completions then run on delivery in the block order (the
+    processors share the parser state, so only do it for processors which
+    don't depend on each other).
+    """
+    def __init__(self, workers=1, depth=16):
+        self.workers = workers
+        # Completions run with the processors, in the one thread running
+        # them all in order
+        self.serial = workers <= 1
+        # Max number of not delivered blocks, reading waits for the oldest one
+        # when it's reached, so a slow processor can't make buffered blocks
+        # pile up
+        self.depth = max(depth, 1)
+        self.pool = ThreadPool(workers) if workers > 0 else None
+        self.pending = deque()
+        # Seconds from submit to delivery of the delivered blocks
+        self.delivered = 0
+        self.latency_total = 0.0
+        self.last_latency = 0.0
+        # Blocks whose processor raised, the exception is logged
+        self.failures = 0
+
+    def submit(self, func, block, block_name, socket_id, func_name=None, completion=None):
+        """
+        Process the block with func, completion(func_name, result) is
+        called after the processor succeeded
+        """
+        args = (func, func_name, block, block_name, socket_id,
+                completion if self.serial else None)
+        submitted = time.time()
+        if self.pool is None:
+            result = _InlineResult(_run_processor, args)
+        else:
+            result = self.pool.apply_async(_run_processor, args)
+        self.pending.append((result, func_name, block, block_name, submitted,
+                             None if self.serial else completion))
+
+    def completed(self, wait=False):
+        """
+        Yield (func_name, block, block_name, result, failed) of the processed
+        and completed blocks in submit order. Stops at the first unfinished
+        block unless wait is set or too many blocks are pending. Processor
+        exceptions are logged and counted, the block is yielded as failed
+        with no result and isn't completed.
+        """
+        while self.pending:
+            result, func_name, block, block_name, submitted, completion = self.pending[0]
+            if not (wait or result.ready() or len(self.pending) > self.depth):
+                break
+            self.pending.popleft()
+            self.last_latency = time.time() - submitted
+            self.latency_total += self.last_latency
+            self.delivered += 1
+            try:
+                value = result.get()
+            except Exception:
+                # Logged with the traceback by the processor run
+                self.failures += 1
+                yield func_name, block, block_name, None, True
+            else:
+                if completion is not None:
+                    completion(func_name, value)
+                yield func_name, block, block_name, value, False
+
+    def __len__(self):
+        return len(self.pending)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def _run_processor(func, func_name, block, block_name, socket_id, completion=None):
+    try:
+        value = func(block, block_name, socket_id)
+    except Exception:
+        # The pool passes only the exception itself to the caller
+        logger.exception("Processor {0} failed on block {1}".format(func_name, block_name))
+        raise
+    if completion is not None:
+        completion(func_name, value)
+    return value
+
+
+class _InlineResult:
+    """
+    AsyncResult look alike for the processors run without the pool
+    """
+    def __init__(self, func, args):
+        self.value = None
+        self.error = None
+        try:
+            self.value = func(*args)
+        except Exception as e:
+            self.error = e
+
+    def ready(self):
+        return True
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import time
+import logging
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import cProfile as profile
+except ImportError:
+    import profile
+
+logger = logging.getLogger()
+
+# Process CPU time, the profiled processors run in the parsing thread
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+# Processors and parse options keeping everything in the main thread, so
+# time and allocations are attributable to the processors
+PROFILE_OPTIONS = {
+    'processor_workers': 0,
+    'session_workers': 1,
+    'scan_workers': 1,
+    'result_cache_dir': '',
+}
+
+def max_rss():
+    """
+    High-water mark of the process resident memory in bytes (ru_maxrss is
+    in KiB on Linux)
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+TABLE_ROW = '{0:<40} {1:>7} {2:>10} {3:>10} {4:>10} {5:>10}'
+
+
+class ProcessorStats:
+    def __init__(self):
+        self.calls = 0
+        self.lines = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        # Max bytes allocated on top of the memory in use before the call,
+        # or max growth of the process memory high-water mark without
+        # tracemalloc
+        self.peak = None
+        self.errors = 0
+
+
+class ProcessorProfiler:
+    """
+    Call count, lines of the blocks, wall and CPU time and allocation peak
+    of every block processor and testplan function, and the totals of the line scanning loop around them. With
+    keep_going the processor exceptions are logged and counted, the
+    processor is taken as failed and parsing goes on.
+
+    The allocation peak needs tracemalloc.reset_peak (python 3.9+). Before
+    that (python 2.7 included) it falls back to the growth of the process
+    RSS high-water mark during the call: a call below the previous mark
+    shows 0, it's a rough hint of the processors raising the mark.
+    """
+    def __init__(self, keep_going=False, trace_malloc=True):
+        self.stats = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.keep_going = keep_going
+        self.trace_malloc = (trace_malloc and tracemalloc is not None
+                             and hasattr(tracemalloc, 'reset_peak'))
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.max_rss = trace_malloc and not self.trace_malloc and resource is not None
+
+    def call(self, func_name, func, block, block_name, socket_id):
+        stats = self.stats.setdefault(func_name, ProcessorStats())
+        stats.calls += 1
+        if block is not None:
+            stats.lines += len(block)
+        if self.trace_malloc:
+            memory_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        elif self.max_rss:
+            memory_before = max_rss()
+        wall, cpu = time.time(), cpu_time()
+        try:
+            return func(block, block_name, socket_id)
+        except Exception:
+            if not self.keep_going:
+                raise
+            stats.errors += 1
+            logger.exception("Processor {0} failed on block {1}".format(func_name, block_name))
+            return False
+        finally:
+            stats.wall += time.time() - wall
+            stats.cpu += cpu_time() - cpu
+            if self.trace_malloc:
+                peak = tracemalloc.get_traced_memory()[1] - memory_before
+                stats.peak = max(stats.peak or 0, peak)
+            elif self.max_rss:
+                stats.peak = max(stats.peak or 0, max_rss() - memory_before)
+
+    def run(self, dump_file, parse, *args):
+        """
+        Run parse(*args) measuring the totals, with cProfile if dump_file
+        is given (pstats format)
+        """
+        profiler = profile.Profile() if dump_file else None
+        wall, cpu = time.time(), cpu_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            return parse(*args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self.wall += time.time() - wall
+            self.cpu += cpu_time() - cpu
+            if profiler is not None:
+                profiler.dump_stats(dump_file)
+                logger.info("cProfile stats written to " + dump_file)
+
+    def report(self, lines_scanned):
+        """
+        Log the table of the processors by wall time, the line scanning
+        loop gets the time spent out of the processors
+        """
+        def kib(peak):
+            return '-' if peak is None else '{0:.1f}'.format(peak / 1024.0)
+
+        logger.info(TABLE_ROW.format('processor', 'calls', 'lines', 'wall s', 'cpu s',
+                                     'rss+ KiB' if self.max_rss else 'peak KiB'))
+        for func_name, stats in sorted(self.stats.items(), key=lambda item: -item[1].wall):
+            logger.info(TABLE_ROW.format(func_name, stats.calls, stats.lines,
+                                         '{0:.4f}'.format(stats.wall), '{0:.4f}'.format(stats.cpu),
+                                         kib(stats.peak)))
+        processors_wall = sum(stats.wall for stats in self.stats.values())
+        processors_cpu = sum(stats.cpu for stats in self.stats.values())
+        logger.info(TABLE_ROW.format('line scanning', '-', lines_scanned,
+                                     '{0:.4f}'.format(self.wall - processors_wall),
+                                     '{0:.4f}'.format(self.cpu - processors_cpu), '-'))
+        logger.info(TABLE_ROW.format('total', sum(stats.calls for stats in self.stats.values()),
+                                     lines_scanned, '{0:.4f}'.format(self.wall),
+                                     '{0:.4f}'.format(self.cpu), '-'))
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import types
+import logging
+
+logger = logging.getLogger()
+
+# Code flag of the functions with *args (inspect.CO_VARARGS, inspect itself
+# is slow to import)
+CO_VARARGS = 0x04
+
+# Entry points group of the third party missions
+ENTRY_POINT_GROUP = 'bdsm.missions'
+
+# Mission conf section name (e.g. RMT) -> mission class
+MISSIONS = {}
+
+
+def register_mission(section):
+    """
+    Class decorator registering a mission. The mission is enabled by the
+    `section` key of the [mission] conf section, its own options live in the
+    [section] one. A mission class provides:
+        from_conf(conf, ram_info) - classmethod returning the instance
+        dbg_block_processing_rules - block name -> processor name
+        testplan - function name -> names of the functions it depends on
+        result_completeness() - optional completeness check, run once the
+            DIMM info is known
+    Own function names may be given without the mission prefix.
+    """
+    def register(klass):
+        MISSIONS[section] = klass
+        return klass
+    return register
+
+
+def load_mission_plugins():
+    """
+    Register the missions of the installed plugins (the 'bdsm.missions'
+    entry points, entry point name is the mission conf section)
+    """
+    try:
+        from importlib.metadata import entry_points
+        try:
+            plugins = entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:
+            plugins = entry_points().get(ENTRY_POINT_GROUP, [])
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+        plugins = pkg_resources.iter_entry_points(ENTRY_POINT_GROUP)
+    for plugin in plugins:
+        if plugin.name in MISSIONS:
+            continue
+        try:
+            MISSIONS[plugin.name] = plugin.load()
+        except Exception as e:
+            logger.warning("Can't load mission plugin " + plugin.name + ": " + str(e))
+
+
+def mission_options(options):
+    """
+    Add the enable switches and the options of the registered missions to
+    the conf options
+    """
+    for section, klass in MISSIONS.items():
+        options['mission'].setdefault(section, (bool, False))
+        options.setdefault(section, dict(getattr(klass, 'options', {})))
+    return options
+
+
+def block_processor(func):
+    """
+    Adapt the function to the block processor call convention
+    func(dbg_log_block, dbg_block_name, socket_id), the testplan steps
+    without arguments ignore them
+    """
+    code = getattr(func, '__func__', func).__code__
+    positional = code.co_argcount - (1 if isinstance(func, types.MethodType) else 0)
+    if code.co_flags & CO_VARARGS or positional >= 3:
+        return func
+    return lambda dbg_log_block, dbg_block_name, socket_id: func()
+
+
+class ProcessorRegistry:
+    """
+    Block processors and testplan functions of the parser and the enabled
+    missions resolved to bound callables. Names are qualified with the
+    mission prefix (e.g. rmt.process_rmt_results), the parser own ones have
+    no prefix.
+    """
+    def __init__(self):
+        # prefix -> object owning the functions
+        self.owners = {}
+        # qualified name -> callable(dbg_log_block, dbg_block_name, socket_id)
+        self.processors = {}
+        # block name -> qualified processor name
+        self.dbg_block_processing_rules = {}
+        # qualified name -> qualified names of the dependencies
+        self.testplan = {}
+
+    def qualify(self, prefix, func_name):
+        if not prefix or '.' in func_name or not hasattr(self.owners[prefix], func_name):
+            return func_name
+        return prefix + '.' + func_name
+
+    def add(self, owner, dbg_block_processing_rules, testplan, prefix=''):
+        self.owners[prefix] = owner
+        for block_name, func_name in dbg_block_processing_rules.items():
+            self.dbg_block_processing_rules[block_name] = self.qualify(prefix, func_name)
+        for func_name, deps in testplan.items():
+            self.testplan[self.qualify(prefix, func_name)] = [self.qualify(prefix, dep) for dep in deps]
+
+    def add_mission(self, section, mission, completeness_deps):
+        prefix = section.lower()
+        testplan = dict(mission.testplan)
+        if hasattr(mission, 'result_completeness'):
+            testplan.setdefault('result_completeness', completeness_deps)
+        self.add(mission, mission.dbg_block_processing_rules, testplan, prefix)
+
+    def resolve(self):
+        """
+        Bind all referenced names once, so dispatching is a dict lookup
+        """
+        names = set(self.dbg_block_processing_rules.values())
+        for func_name, deps in self.testplan.items():
+            names.add(func_name)
+            names.update(deps)
+        for name in names:
+            prefix, _, attr = name.rpartition('.')
+            func = getattr(self.owners.get(prefix), attr, None)
+            if func is None:
+                logger.warning("Unknown processor " + name)
+                continue
+            self.processors[name] = block_processor(func)
+        return self
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
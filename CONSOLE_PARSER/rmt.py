@@ -11,6 +11,9 @@ import logging
 import itertools
 from collections import defaultdict
 
+from blocks import decode_line
+from registry import register_mission
+
 logging.basicConfig(
     level=logging.DEBUG,
     format='[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s',
@@ -19,10 +22,24 @@ logging.basicConfig(
 
 logger = logging.getLogger()
 
+RMT_RANK_RE = re.compile(br'N([0-1])\.C([0-5])\.D([01])\.R([0-3])')
+
+# Guidelines by file name, loaded once for all the sessions and logs
+GUIDELINES_CACHE = {}
+
+@register_mission('RMT')
 class RMT:
     """
     Gather Intel Rank Margin Tool, parse and return the output
     """
+    @classmethod
+    def from_conf(cls, conf, ram_info):
+        guidelines_file = conf['RMT']['guidelines']
+        if guidelines_file not in GUIDELINES_CACHE:
+            with open(guidelines_file) as guidelines:
+                GUIDELINES_CACHE[guidelines_file] = yaml.load(guidelines, Loader=yaml.SafeLoader)
+        return cls(ram_info, GUIDELINES_CACHE[guidelines_file])
+
     def __init__(self, ram_info, rmt_guidelines):
         self.margin_params = ['RxDqs-', 'RxDqs+', 'RxV-', 'RxV+', 'TxDq-', 'TxDq+', 'TxV-', 'TxV+', 'Cmd-', 'Cmd+', 'CmdV-', 'CmdV+', 'Ctl-', 'Ctl+']
 
@@ -72,27 +89,47 @@ class RMT:
         logger.info("Processing RMT results...")
 
         rmt_rank_margin = {}
-        for line in rmt_block:
-            rmt_rank_match = re.match(r'N([0-1])\.C([0-5])\.D([01])\.R([0-3])', line)
+        # Raw lines: only the rank location of the accepted records is decoded
+        for line in rmt_block.raw_lines():
+            rmt_rank_match = RMT_RANK_RE.match(line)
             split_line = line.split()
             if not line or not rmt_rank_match or len(split_line) != 15:
                 continue
-            if not split_line[1].lstrip('-').isdigit():
+            if not split_line[1].lstrip(b'-').isdigit():
                 continue
             if rmt_rank_match:
                 try:
                     margins_list = map(int,split_line[1:])
-                    rmt_dimm = '.'.join(rmt_rank_match.group(1,2,3))
+                    rmt_dimm = decode_line(b'.'.join(rmt_rank_match.group(1,2,3)))
                     rmt_dimm_label = str(self.dimm_labels[rmt_dimm])
-                    rmt_rank = 'R' + rmt_rank_match.group(4)
+                    rmt_rank = 'R' + decode_line(rmt_rank_match.group(4))
                     #rmt_rank_margin[rmt_rank] = dict(zip(self.margin_params, margins_list))
                     self.rmt_results[rmt_dimm_label][rmt_rank] = dict(zip(self.margin_params, margins_list))
                 except:
                     logger.debug("The RMT result is rejected. Format violated:")
-                    logger.debug(line)
+                    logger.debug(decode_line(line))
                     return False
         return True
 
+    def session_result(self):
+        return {
+            'rmt_results': self.rmt_results,
+            'worst_case': self.rmt_worst_case_result
+        }
+
+    def checkpoint_state(self):
+        # The results tree factory is local, keep plain dicts
+        return {
+            'rmt_results': json.loads(json.dumps(self.rmt_results)),
+            'worst_case': self.rmt_worst_case_result
+        }
+
+    def restore_state(self, state):
+        for rmt_dimm_label, ranks in state['rmt_results'].items():
+            for rmt_rank, margins in ranks.items():
+                self.rmt_results[rmt_dimm_label][rmt_rank] = margins
+        self.rmt_worst_case_result = state['worst_case']
+
     def result_completeness(self):
         logger.info("Check RMT results completeness...")
         guidelines = self.guidelines()
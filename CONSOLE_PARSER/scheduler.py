@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import logging
+from collections import defaultdict, deque
+
+logger = logging.getLogger()
+
+
+class TestplanScheduler:
+    """
+    Testplan (function -> functions it depends on) compiled once into a DAG
+    with in-degree counters: completing a function decrements its dependents
+    and queues the ones left without pending dependencies.
+
+    Block processors are completed by the blocks of the console log only,
+    they are never run as supplementary functions. A failed function is
+    queued again each time one of its dependencies completes again.
+    """
+    def __init__(self, testplan, block_processors=()):
+        self.block_processors = set(block_processors)
+        self.deps = {}
+        self.dependents = defaultdict(list)
+        nodes = set(testplan)
+        for deps in testplan.values():
+            nodes.update(deps)
+        for name in nodes:
+            # Keep the declared order, drop the duplicates
+            deps = []
+            for dep in testplan.get(name, ()):
+                if dep not in deps:
+                    deps.append(dep)
+            self.deps[name] = tuple(deps)
+            for dep in deps:
+                self.dependents[dep].append(name)
+        # name -> number of not completed dependencies
+        self.waiting = dict((name, len(deps)) for name, deps in self.deps.items())
+        self.completed = set()
+        self.failed = set()
+        self.order = self.topological_order()
+        self.ready = deque(name for name in self.order
+                           if not self.waiting[name] and name not in self.block_processors)
+
+    def topological_order(self):
+        waiting = dict(self.waiting)
+        queue = deque(sorted(name for name, count in waiting.items() if not count))
+        order = []
+        while queue:
+            name = queue.popleft()
+            order.append(name)
+            for dependent in self.dependents.get(name, ()):
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    queue.append(dependent)
+        if len(order) != len(self.deps):
+            cycle = sorted(set(self.deps) - set(order))
+            logger.error("Testplan dependencies cycle between: " + ', '.join(cycle))
+        return order
+
+    def complete(self, name):
+        if name in self.completed:
+            # New data for the dependents: the failed ones get another run
+            for dependent in self.dependents.get(name, ()):
+                if dependent in self.failed and not self.waiting[dependent]:
+                    self.failed.discard(dependent)
+                    self.ready.append(dependent)
+            return
+        self.completed.add(name)
+        self.failed.discard(name)
+        for dependent in self.dependents.get(name, ()):
+            self.waiting[dependent] -= 1
+            if not self.waiting[dependent] and dependent not in self.block_processors:
+                self.ready.append(dependent)
+
+    def run_ready(self, execute):
+        """
+        Run the functions whose dependencies are completed, execute(name)
+        returns True when the function succeeded
+        """
+        while self.ready:
+            name = self.ready.popleft()
+            if name in self.completed:
+                continue
+            if execute(name):
+                self.complete(name)
+            else:
+                self.failed.add(name)
+
+    def finish(self, execute):
+        """
+        Last chance at the end of the log: the failed functions are retried
+        once more in the topological order, now that all the data is read
+        """
+        self.ready.extend(name for name in self.order
+                          if name in self.failed and not self.waiting[name])
+        self.failed = set()
+        self.run_ready(execute)
+
+    def unfinished(self):
+        return [name for name in self.order if name not in self.completed]
+
+    def missing_inputs(self):
+        """
+        Return goal -> inputs it misses for the not completed goals (the
+        functions nothing depends on). Inputs are the not completed block
+        processors, the failed functions and the functions without
+        dependencies.
+        """
+        missing = {}
+        for goal in self.unfinished():
+            if self.dependents.get(goal):
+                continue
+            inputs = set()
+            seen = set()
+            stack = [goal]
+            while stack:
+                name = stack.pop()
+                if name in seen or name in self.completed:
+                    continue
+                seen.add(name)
+                if name in self.block_processors or name in self.failed or not self.deps[name]:
+                    inputs.add(name)
+                else:
+                    stack.extend(self.deps[name])
+            missing[goal] = sorted(inputs)
+        return missing
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
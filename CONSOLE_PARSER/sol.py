@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
 import sys
+import time
 import signal
+import logging
 import io
 
 from contextlib import contextmanager
@@ -9,6 +11,8 @@ from select import select
 
 from pyghmi.ipmi import console
 
+logger = logging.getLogger()
+
 #from hwlib.common import ignored
 @contextmanager
 def ignored(*exceptions):
@@ -19,6 +23,12 @@ def ignored(*exceptions):
         pass
 
 #from hwlib.strtools import isplitlines, only_ascii
+def only_ascii(data):
+    """Drop all non ascii characters from str/bytes/bytearray"""
+    if isinstance(data, (bytearray, bytes)):
+        return bytes(bytearray(c for c in bytearray(data) if c < 128)).decode('ascii')
+    return ''.join(c for c in data if ord(c) < 128)
+
 def isplitlines(lines, keepends=False):
     """Iterator implementation of str/bytes/bytearray splitlines method"""
     if isinstance(lines, (bytearray, bytes)):
@@ -40,10 +50,22 @@ def isplitlines(lines, keepends=False):
         line = lines[prev_pos:]
         yield line if keepends else line.rstrip(delim + extra_delim)
 
+# Max bytes of the received console output waiting to be split into lines,
+# the oldest lines are dropped over it (the base sol_buffer_limit_mb option)
+SOL_BUFFER_LIMIT = 16 << 20
+# Min seconds between the warnings about the dropped console output
+SOL_DROP_WARNING_INTERVAL = 60
+
 class SOL:
-    def __init__(self, bmc):
+    def __init__(self, bmc, buffer_limit=SOL_BUFFER_LIMIT):
         self.bmc = bmc 
         self.sol_data = bytearray()
+        self.buffer_limit = buffer_limit
+        # Lost console output: bytes dropped from the buffer and errors of
+        # the session (nothing is received until it recovers)
+        self.dropped_bytes = 0
+        self.session_errors = 0
+        self.drop_warned = None
         # Timeout for SOL session
         self.sol_timeout = 600
         # Timeout for data stream
@@ -68,9 +90,27 @@ class SOL:
 
     def put_data(self, data):
         #self.sol_data += self.read_stream(data)
+        if isinstance(data, dict):
+            # pyghmi reports the session errors to the io handler
+            self.session_errors += 1
+            logger.warning('SOL session error: ' + str(data.get('error', data)))
+            return
         self.sol_data += data
+        if len(self.sol_data) > self.buffer_limit:
+            # Drop up to the line end, so no partial line is left
+            overflow = len(self.sol_data) - self.buffer_limit
+            line_end = self.sol_data.find(b'\n', overflow)
+            drop = line_end + 1 if line_end >= 0 else len(self.sol_data)
+            del self.sol_data[:drop]
+            self.dropped_bytes += drop
+            now = time.time()
+            if self.drop_warned is None or now - self.drop_warned >= SOL_DROP_WARNING_INTERVAL:
+                self.drop_warned = now
+                logger.warning("SOL buffer of {0} bytes overflowed, {1} bytes of console output "
+                               "dropped so far".format(self.buffer_limit, self.dropped_bytes))
  
     def get_data(self):
+        """Yield raw (bytes) lines, decoding is up to the consumer"""
         line = ''
         while True:
             if self.waitdata():
@@ -82,7 +122,7 @@ class SOL:
                         if line_index >= n_full_lines:
                             self.sol_data = line
                             break
-                        yield self.try_to_decode(line)
+                        yield bytes(line)
                     else:
                         # hack to clear existing bytearray
                         self.sol_data[:] = b''
@@ -108,7 +148,7 @@ def main():
 
              for line in bios_dbg_data:
                  #print("You can parse this line now: " + str(line))
-                 print(line)
+                 print(sol.try_to_decode(line))
                  #process(line)
                  #...
          except Exception as e:
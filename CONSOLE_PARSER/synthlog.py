@@ -0,0 +1,551 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import random
+import argparse
+import logging
+
+from grammar import load_grammar
+from bootprof import BOOT_PROFILE_RECORDS
+from blocks import ANSI_ESCAPE_MARK, ANSI_ESCAPE_BYTES_RE
+
+logger = logging.getLogger()
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SAMPLE_DATA')
+BOOT_SAMPLE = os.path.join(SAMPLE_DIR, '4_RDIMMs_HEDetected_Device_Tagging_20181106-11:38-28.log')
+SMM_SAMPLE = os.path.join(SAMPLE_DIR, 'single_ce_handler_shot.log')
+MEMTEST_SAMPLE = os.path.join(SAMPLE_DIR, 'mbist_error.log')
+GRAMMAR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Purley_BIOS_grammar.yaml')
+
+# Templates by the sample files, extracted once per process
+TEMPLATES_CACHE = {}
+
+EOL = b'\r\n'
+POWER_ON_LINE = b'Status Code Available'
+POWER_OFF_LINE = b'SecSMI. S5 Trap'
+MRC_RUN = 'MRC_RUN'
+ANSI_COLORS = (b'\x1b[00m\x1b[31m\x1b[40m', b'\x1b[00m\x1b[37m\x1b[40m', b'\x1b[00m\x1b[33m\x1b[40m')
+ANSI_RESET = b'\x1b[00m\x1b[37m\x1b[40m'
+
+# Socket 0 references of the sample lines, rewritten for the other sockets
+SOCKET_REF_RE = re.compile(br'(?<![0-9A-Za-z])N0(?=[.:])|Socket 0(?![0-9])')
+# Errors of the sample boot and its broken MemTest step, the synthetic
+# errors replace them
+SAMPLE_ERROR_RE = re.compile(br': MemTest Failure!|: B[0-9]:B[0-9] = |: ECC = |: FPT strobe = '
+                             br'|A warning has been logged!|^S[0-9] Ch[0-9] DIMM[0-9] Rank[0-9]$'
+                             br'|Failed RdDqDqs|MemTes[tX] -- Started|MemTest - [0-9]+ms')
+SMM_ERROR_RE = re.compile(br'Node=[0-9]+ ddrch=[0-9]+ dimm=[0-9]+ rank=[0-9]+')
+SMM_RANK_RE = re.compile(br'logical rank:[0-9]+ -->physical rank:[0-9]+')
+MEMTEST_RANK_RE = re.compile(br'N[0-9]\.C[0-9]\.D[0-9]\.R[0-9]')
+MEMTEST_SLOT_RE = re.compile(br'^S[0-9] Ch[0-9] DIMM[0-9] Rank[0-9]$')
+
+# Steps made up by the generator and the sample step they follow
+MEMTEST_STEP = ('MemTest', 'Initialize Throttling')
+STEP_TEST_STEP = ('@SEC Run CPGC Test', 'MemInit')
+DIMM_INFO_STEP = 'DIMM Information'
+RMT_STEP = 'Rank Margin Tool'
+TRAINING_STEP = 'Rx Dq/Dqs Basic'
+
+# DIMM vendor, DRAM vendor, RCD vendor, part number
+DIMM_MODELS = (
+    ('Samsung', 'Samsung', 'IDT', 'M393A4K40CB2-CTD'),
+    ('Micron', 'Micron', 'IDT', '36ASF4G72PZ-2G6E1'),
+    ('Hynix', 'Hynix', 'Montage', 'HMA84GR7CJR4N-VK'),
+    ('Kingston', 'Micron', 'Montage', '9965640-006.A01G'),
+)
+MARGIN_PARAMS = 14
+CELL = '{0:^20}'
+TABLE_RULE = b'=' * 86
+ROW_RULE = b'-' * 86
+
+CLIENT_DESCRIPTION = """Synthetic BIOS debug console logs made of the sample log templates"""
+HELPS = {
+    'output': 'log file to write, - for stdout',
+    'lines': 'number of lines (the last boot is cut)',
+    'sockets': 'CPU sockets',
+    'channels': 'memory channels per socket',
+    'dimms_per_channel': 'DIMM slots per channel',
+    'ranks': 'ranks per DIMM',
+    'population': 'share of the populated DIMM slots',
+    'error_rate': 'probability of every error (training, MemTest, STEP, corrected) per rank',
+    'ansi_rate': 'share of the lines wrapped in ANSI color codes',
+    'power_off_rate': 'share of the boots ending with the power off (the rest are resets)',
+    'detail': 'share of the sample MRC output kept (whole blocks are kept or dropped)',
+    'seed': 'random seed, the same seed gives the same log (on the same python version)',
+    'sample': 'sample console log the boot templates are taken from',
+    'no_step': 'no STEP (CPGC test) output',
+    'no_rmt': 'no Rank Margin Tool output',
+}
+
+
+def read_lines(path):
+    lines = []
+    with open(path, 'rb') as sample:
+        for line in sample:
+            if ANSI_ESCAPE_MARK in line:
+                line = ANSI_ESCAPE_BYTES_RE.sub(b'', line)
+            lines.append(line.rstrip(b'\r\n'))
+    return lines
+
+
+def for_socket(line, socket):
+    if not socket:
+        return line
+    socket_id = str(socket).encode('ascii')
+    return SOCKET_REF_RE.sub(lambda match: match.group(0)[:-1] + socket_id, line)
+
+
+class SampleStep:
+    """
+    MRC step of the sample boot: lines before its start, its body split
+    into chunks (single lines and whole START_/STOP_ blocks) and duration
+    """
+    def __init__(self, name, gap, body, duration):
+        self.name = name
+        self.gap = gap
+        self.chunks = body
+        self.duration = duration
+
+
+class SampleTemplates:
+    """
+    Console output of the sample logs: the most complete boot split into
+    the lines before the MRC, the MRC steps and the lines after it, the SMM
+    corrected error handler and the MemTest failure report
+    """
+    def __init__(self, boot_sample, smm_sample, memtest_sample, record_set):
+        self.record_set = record_set
+        lines = read_lines(boot_sample)
+        boot = self.longest_boot([line for line in lines if not SAMPLE_ERROR_RE.search(line)])
+        self.pre_mrc, mrc, self.post_mrc = self.split_mrc(boot)
+        self.steps, self.mrc_tail = self.split_steps(mrc)
+        self.smm_handler = self.smm_template(read_lines(smm_sample))
+        self.memtest_failure = self.memtest_template(read_lines(memtest_sample))
+
+    def records(self, lines):
+        for index, line in enumerate(lines):
+            record = self.record_set.match(line)
+            if record is not None:
+                yield index, record
+
+    def longest_boot(self, lines):
+        starts = [index for index, record in self.records(lines) if record.record == 'power_on']
+        bounds = list(zip([0] + starts, starts + [len(lines)]))
+        start, end = max(bounds, key=lambda bound: sum(
+            1 for index, record in self.records(lines[bound[0]:bound[1]])
+            if record.record == 'step_end'))
+        boot = lines[start:end]
+        if boot and boot[0].startswith(POWER_ON_LINE):
+            boot = boot[1:]
+        return boot
+
+    def split_mrc(self, boot):
+        start = end = None
+        for index, record in self.records(boot):
+            if record.record == 'span_start' and record.name == MRC_RUN and start is None:
+                start = index
+            elif record.record == 'span_end' and record.name == MRC_RUN and start is not None:
+                end = index
+                break
+        if start is None or end is None:
+            raise ValueError("The sample boot has no complete MRC run")
+        return boot[:start], boot[start + 1:end], boot[end + 1:]
+
+    def split_steps(self, mrc):
+        """
+        Return the closed steps in the order of the MRC and the lines after
+        the last one
+        """
+        steps = []
+        gap_start = 0
+        open_step = None
+        for index, record in self.records(mrc):
+            if record.record == 'step_start':
+                open_step = (record.name, index)
+            elif record.record == 'step_end' and open_step and open_step[0] == record.name:
+                name, start = open_step
+                steps.append(SampleStep(name, mrc[gap_start:start],
+                                        self.chunks(mrc[start + 1:index]), int(record.ms)))
+                gap_start = index + 1
+                open_step = None
+        return steps, mrc[gap_start:]
+
+    def chunks(self, body):
+        """
+        Split the step body into the lines and the balanced START_/STOP_
+        blocks, so dropping some of them keeps the blocks whole
+        """
+        ends = {}
+        for index, record in self.records(body):
+            if record.record == 'span_start':
+                ends.setdefault(record.name, [])
+                ends[record.name].append([index, None])
+            elif record.record == 'span_end' and ends.get(record.name):
+                if ends[record.name][-1][1] is None:
+                    ends[record.name][-1][1] = index
+        block_end = dict((start, end) for spans in ends.values() for start, end in spans
+                         if end is not None)
+        chunks = []
+        index = 0
+        while index < len(body):
+            end = block_end.get(index, index)
+            chunks.append(body[index:end + 1])
+            index = end + 1
+        return chunks
+
+    def smm_template(self, lines):
+        start = [index for index, line in enumerate(lines) if line.startswith(b'SMM Error Handler Entry')]
+        end = [index for index, line in enumerate(lines) if line.rstrip().endswith(b'Hander end!')]
+        if not start or not end:
+            raise ValueError("The SMM sample has no corrected error handler")
+        return lines[start[0]:end[0] + 1]
+
+    def memtest_template(self, lines):
+        return [line for line in lines
+                if MEMTEST_RANK_RE.search(line) or MEMTEST_SLOT_RE.match(line)
+                or line.startswith(b'A warning has been logged!')]
+
+
+def load_templates(sample=BOOT_SAMPLE, smm_sample=SMM_SAMPLE, memtest_sample=MEMTEST_SAMPLE):
+    key = (sample, smm_sample, memtest_sample)
+    if key not in TEMPLATES_CACHE:
+        grammar = load_grammar(GRAMMAR_FILE)
+        TEMPLATES_CACHE[key] = SampleTemplates(sample, smm_sample, memtest_sample,
+                                               grammar.record_sets[BOOT_PROFILE_RECORDS])
+    return TEMPLATES_CACHE[key]
+
+
+class Dimm:
+    def __init__(self, socket, channel, slot, model, serial, prod_week):
+        self.socket = socket
+        self.channel = channel
+        self.slot = slot
+        self.model = model
+        self.serial = serial
+        self.prod_week = prod_week
+
+    def location(self):
+        return 'N{0}.C{1}.D{2}'.format(self.socket, self.channel, self.slot)
+
+
+class ConsoleSynthesizer:
+    """
+    Boots of a server made of the sample templates: the MRC output of the
+    sample for every socket with the DIMM tables, training, MemTest, STEP
+    and RMT output of the synthetic DIMM population and errors, then the
+    corrected errors handled by SMM at runtime. Yields the raw lines.
+    """
+    def __init__(self, templates, sockets=2, channels=6, dimms_per_channel=2, ranks=2,
+                 population=1.0, error_rate=0.01, ansi_rate=0.0, power_off_rate=0.5,
+                 detail=1.0, seed=0, step=True, rmt=True):
+        self.templates = templates
+        self.sockets = sockets
+        self.channels = channels
+        self.dimms_per_channel = dimms_per_channel
+        self.ranks = ranks
+        self.population = population
+        self.error_rate = error_rate
+        self.ansi_rate = ansi_rate
+        self.power_off_rate = power_off_rate
+        self.detail = detail
+        self.step = step
+        self.rmt = rmt
+        self.random = random.Random(seed)
+        # The same server reboots, the DIMMs stay
+        self.dimms = self.populate()
+        self.socket_lines = {}
+
+    def populate(self):
+        dimms = []
+        for socket in range(self.sockets):
+            for channel in range(self.channels):
+                for slot in range(self.dimms_per_channel):
+                    if self.random.random() >= self.population:
+                        continue
+                    dimms.append(Dimm(socket, channel, slot, self.random.choice(DIMM_MODELS),
+                                      '{0:08X}'.format(self.random.getrandbits(32)),
+                                      '{0:02d}{1:02d}'.format(self.random.randint(17, 20),
+                                                              self.random.randint(1, 52))))
+        return dimms
+
+    def failed_ranks(self):
+        return [(dimm, rank) for dimm in self.dimms for rank in range(self.ranks)
+                if self.random.random() < self.error_rate]
+
+    def lines_of(self, lines, socket):
+        """
+        Sample lines rewritten for the socket, cached
+        """
+        key = (id(lines), socket)
+        if key not in self.socket_lines:
+            self.socket_lines[key] = [for_socket(line, socket) for line in lines]
+        return self.socket_lines[key]
+
+    def kept(self, chunks):
+        if self.detail >= 1:
+            return chunks
+        return [chunk for chunk in chunks if self.random.random() < self.detail]
+
+    def duration(self, duration):
+        return int(duration * self.random.uniform(0.8, 1.2))
+
+    def __iter__(self):
+        random_value = self.random.random
+        ansi_rate = self.ansi_rate
+        while True:
+            for line in self.boot():
+                if ansi_rate and random_value() < ansi_rate:
+                    line = self.random.choice(ANSI_COLORS) + line + ANSI_RESET
+                yield line
+
+    def boot(self):
+        templates = self.templates
+        yield POWER_ON_LINE
+        for chunk in self.kept([[line] for line in templates.pre_mrc]):
+            for line in chunk:
+                yield line
+        yield ('START_' + MRC_RUN).encode('ascii')
+        for step in templates.steps:
+            for line in step.gap:
+                yield line
+            yield (step.name + ' -- Started').encode('ascii')
+            if step.name == DIMM_INFO_STEP:
+                for line in self.dimm_info():
+                    yield line
+            elif step.name == RMT_STEP and self.rmt:
+                for line in self.rmt_results():
+                    yield line
+            else:
+                for socket in range(self.sockets):
+                    for chunk in self.kept(step.chunks):
+                        for line in self.lines_of(chunk, socket):
+                            yield line
+                if step.name == TRAINING_STEP:
+                    for line in self.training_failures():
+                        yield line
+            yield '{0} - {1}ms'.format(step.name, self.duration(step.duration)).encode('ascii')
+            if step.name == MEMTEST_STEP[1]:
+                for line in self.memtest():
+                    yield line
+            elif step.name == STEP_TEST_STEP[1] and self.step:
+                for line in self.step_test():
+                    yield line
+        for line in templates.mrc_tail:
+            yield line
+        yield ('STOP_' + MRC_RUN).encode('ascii')
+        for line in templates.post_mrc:
+            yield line
+        for line in self.fru_strings():
+            yield line
+        for dimm, rank in self.failed_ranks():
+            for repeat in range(self.random.randint(1, 3)):
+                for line in self.smm_handler(dimm, rank):
+                    yield line
+        if self.random.random() < self.power_off_rate:
+            yield POWER_OFF_LINE
+
+    def training_failures(self):
+        for dimm, rank in self.failed_ranks():
+            yield '{0}.R{1}.S{2:02d}: Failed RdDqDqs'.format(
+                dimm.location(), rank, self.random.randint(0, 17)).encode('ascii')
+
+    def memtest(self):
+        yield (MEMTEST_STEP[0] + ' -- Started').encode('ascii')
+        for socket in range(self.sockets):
+            yield 'Checkpoint Code: Socket {0}, 0xB9, 0x00, 0x0000'.format(socket).encode('ascii')
+        for dimm, rank in self.failed_ranks():
+            rank_location = '{0}.R{1}'.format(dimm.location(), rank).encode('ascii')
+            slot = 'S{0} Ch{1} DIMM{2} Rank{3}'.format(dimm.socket, dimm.channel, dimm.slot,
+                                                       rank).encode('ascii')
+            for line in self.templates.memtest_failure:
+                line = MEMTEST_RANK_RE.sub(rank_location, line)
+                yield MEMTEST_SLOT_RE.sub(slot, line)
+        yield '{0} - {1}ms'.format(MEMTEST_STEP[0], self.duration(7000)).encode('ascii')
+
+    def step_test(self):
+        yield (STEP_TEST_STEP[0] + ' -- Started').encode('ascii')
+        yield b'Test Mode : Enhanced PPR.'
+        failed = set()
+        for dimm, rank in self.failed_ranks():
+            failed.add(dimm)
+            yield ('[FailedPatternBitMask 0x{0:X}] {1}. FAIL: R{2}.CID0.BG{3}.BA{4}.'
+                   'ROW:0x{5:05x}.COL:0x{6:03x}.DQ{7:02d}.PPR:Done(PASS)').format(
+                       1 << self.random.randint(0, 3), dimm.location(), rank,
+                       self.random.randint(0, 3), self.random.randint(0, 3),
+                       self.random.getrandbits(17), self.random.getrandbits(10) & 0x3f8,
+                       self.random.randint(0, 71)).encode('ascii')
+        for dimm in self.dimms:
+            status = 'Fail(PPR Done)' if dimm in failed else 'Pass'
+            yield '{0}:  [S/N: {1}_{2}] {3}'.format(dimm.location(), dimm.prod_week,
+                                                    dimm.serial, status).encode('ascii')
+        yield '{0} - {1}ms'.format(STEP_TEST_STEP[0], self.duration(60000)).encode('ascii')
+
+    def rmt_results(self):
+        failed = set((dimm, rank) for dimm, rank in self.failed_ranks())
+        for socket in range(self.sockets):
+            yield 'START_RMT_N{0}'.format(socket).encode('ascii')
+            yield b'Rank Margin Tool results: ' + ' '.join(
+                ['RxDqs-', 'RxDqs+', 'RxV-', 'RxV+', 'TxDq-', 'TxDq+', 'TxV-', 'TxV+',
+                 'Cmd-', 'Cmd+', 'CmdV-', 'CmdV+', 'Ctl-', 'Ctl+']).encode('ascii')
+            for dimm in self.dimms:
+                if dimm.socket != socket:
+                    continue
+                for rank in range(self.ranks):
+                    worst = 4 if (dimm, rank) in failed else 12
+                    margins = [self.random.randint(worst, worst + 20) * (-1 if index % 2 == 0 else 1)
+                               for index in range(MARGIN_PARAMS)]
+                    yield '{0}.R{1} {2}'.format(dimm.location(), rank, ' '.join(
+                        '{0:4d}'.format(margin) for margin in margins)).encode('ascii')
+            yield 'STOP_RMT_N{0}'.format(socket).encode('ascii')
+
+    def dimm_info(self):
+        yield b'START_DIMMINFO_TABLE'
+        yield TABLE_RULE
+        populated = dict(((dimm.socket, dimm.channel, dimm.slot), dimm) for dimm in self.dimms)
+        for socket in range(self.sockets):
+            yield 'START_SOCKET_{0}_TABLE'.format(socket).encode('ascii')
+            yield b'CLX B1 - EP'
+            yield TABLE_RULE
+            yield ('S|' + '|'.join(CELL.format('Channel {0}'.format(channel))
+                                   for channel in range(self.channels)) + '|').encode('ascii')
+            yield TABLE_RULE
+            for slot in range(self.dimms_per_channel):
+                dimms = [populated.get((socket, channel, slot)) for channel in range(self.channels)]
+                rows = [
+                    lambda dimm: 'DIMM: ' + dimm.model[0],
+                    lambda dimm: 'DRAM: ' + dimm.model[1],
+                    lambda dimm: ' RCD: ' + dimm.model[2],
+                    lambda dimm: '32GB(8Gbx4 2H DR)',
+                    lambda dimm: 'DDR4 RDIMM  R/C-B',
+                    lambda dimm: '2666 19-19-19',
+                    lambda dimm: 'ww{0} 20{1}'.format(dimm.prod_week[2:], dimm.prod_week[:2]),
+                    lambda dimm: dimm.model[3],
+                    lambda dimm: '0x' + dimm.serial,
+                    lambda dimm: '',
+                ]
+                if not any(dimms):
+                    yield ('{0}|'.format(slot) + '|'.join(
+                        CELL.format('Not installed') for dimm in dimms) + '|').encode('ascii')
+                else:
+                    for index, row in enumerate(rows):
+                        prefix = '{0}|'.format(slot) if index == 0 else ' |'
+                        yield (prefix + '|'.join(CELL.format(row(dimm) if dimm else '')
+                                                 for dimm in dimms) + '|').encode('ascii')
+                yield ROW_RULE
+            yield 'STOP_SOCKET_{0}_TABLE'.format(socket).encode('ascii')
+            yield TABLE_RULE
+        yield TABLE_RULE
+        sockets = range(self.sockets)
+        yield (' ' * 20 + '|' + '|'.join('  Socket {0}  '.format(socket) for socket in sockets)
+               + '|   System   |').encode('ascii')
+        yield TABLE_RULE
+
+        def row(name, socket_value, system_value):
+            return ('{0:<20}|'.format(name) + '|'.join('{0:^12}'.format(socket_value(socket))
+                                                       for socket in sockets)
+                    + '|{0:^12}|'.format(system_value)).encode('ascii')
+
+        size = dict((socket, 32 * sum(1 for dimm in self.dimms if dimm.socket == socket))
+                    for socket in sockets)
+        yield row('Active Memory', lambda socket: '{0}GB'.format(size[socket]),
+                  '{0}GB'.format(sum(size.values())))
+        yield row('DDR Freq', lambda socket: '', 'DDR4-2666')
+        for channel in range(self.channels):
+            yield row('Ch{0} CL-RCD-RP-CMD'.format(channel), lambda socket: '19-19-19-1n', '')
+        yield row('DDR Vdd', lambda socket: '', '1.20V')
+        yield row('ECC Checking', lambda socket: '', 'On')
+        yield row('Patrol/Demand Scrub', lambda socket: '', 'On/On')
+        yield row('RAS Mode', lambda socket: '', 'Indep')
+        yield TABLE_RULE
+        yield b''
+        yield b'STOP_DIMMINFO_TABLE'
+
+    def fru_strings(self):
+        serial = '{0:022X}'.format(self.random.getrandbits(88))
+        yield b'InitFruStrings: Class ID:  14'
+        for field, value in (('SystemManufacturer', 'YANDEX'), ('SystemProductName', 'MY81-EX0-Y3N'),
+                             ('SystemVersion', '0100'), ('SystemSerialNumber', serial),
+                             ('BaseBoardManufacturer', 'GIGABYTE'),
+                             ('BaseBoardProductName', 'MY81-EX0-Y3N'),
+                             ('BaseBoardSerialNumber', serial)):
+            yield '{0}: UpdateStr: {1}'.format(field, value).encode('ascii')
+        yield b'InitFruStrings Exiting.....'
+
+    def smm_handler(self, dimm, rank):
+        error = 'Node={0} ddrch={1} dimm={2} rank={3}'.format(
+            dimm.socket, dimm.channel, dimm.slot, rank).encode('ascii')
+        rank_id = 'logical rank:{0} -->physical rank:{0}'.format(rank).encode('ascii')
+        for line in self.templates.smm_handler:
+            line = SMM_ERROR_RE.sub(error, line)
+            yield SMM_RANK_RE.sub(rank_id, line)
+
+
+def write_log(log_file, lines, **options):
+    """
+    Write the lines of the synthetic log to the binary file object, return
+    the number of bytes written
+    """
+    sample = options.pop('sample', BOOT_SAMPLE)
+    synthesizer = ConsoleSynthesizer(load_templates(sample), **options)
+    written = 0
+    chunk = []
+    for index, line in enumerate(synthesizer):
+        if index == lines:
+            break
+        chunk.append(line)
+        if len(chunk) == 4096:
+            data = EOL.join(chunk) + EOL
+            log_file.write(data)
+            written += len(data)
+            chunk = []
+    if chunk:
+        data = EOL.join(chunk) + EOL
+        log_file.write(data)
+        written += len(data)
+    return written
+
+
+def argument_parsing():
+    """
+    Parse and return command line arguments
+    """
+    parser = argparse.ArgumentParser(description=CLIENT_DESCRIPTION)
+    parser.add_argument('output', help=HELPS['output'])
+    parser.add_argument('-n', '--lines', help=HELPS['lines'], type=int, default=100000)
+    parser.add_argument('--sockets', help=HELPS['sockets'], type=int, default=2)
+    parser.add_argument('--channels', help=HELPS['channels'], type=int, default=6)
+    parser.add_argument('--dimms-per-channel', help=HELPS['dimms_per_channel'], type=int,
+                        default=2)
+    parser.add_argument('--ranks', help=HELPS['ranks'], type=int, default=2)
+    parser.add_argument('--population', help=HELPS['population'], type=float, default=1.0)
+    parser.add_argument('--error-rate', help=HELPS['error_rate'], type=float, default=0.01)
+    parser.add_argument('--ansi-rate', help=HELPS['ansi_rate'], type=float, default=0.0)
+    parser.add_argument('--power-off-rate', help=HELPS['power_off_rate'], type=float,
+                        default=0.5)
+    parser.add_argument('--detail', help=HELPS['detail'], type=float, default=1.0)
+    parser.add_argument('--seed', help=HELPS['seed'], type=int, default=0)
+    parser.add_argument('--sample', help=HELPS['sample'], default=BOOT_SAMPLE)
+    parser.add_argument('--no-step', help=HELPS['no_step'], action='store_true')
+    parser.add_argument('--no-rmt', help=HELPS['no_rmt'], action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = argument_parsing()
+    options = dict(lines=args.lines, sockets=args.sockets, channels=args.channels,
+                   dimms_per_channel=args.dimms_per_channel, ranks=args.ranks,
+                   population=args.population, error_rate=args.error_rate,
+                   ansi_rate=args.ansi_rate, power_off_rate=args.power_off_rate,
+                   detail=args.detail, seed=args.seed, sample=args.sample,
+                   step=not args.no_step, rmt=not args.no_rmt)
+    if args.output == '-':
+        write_log(getattr(sys.stdout, 'buffer', sys.stdout), **options)
+    else:
+        with open(args.output, 'wb') as log_file:
+            write_log(log_file, **options)
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
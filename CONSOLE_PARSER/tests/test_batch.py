@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+PARSER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PARSER_DIR)
+
+from batch import find_logs, run_batch
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        # Specs, grammar and configs are looked up in the parser directory
+        self.cwd = os.getcwd()
+        os.chdir(PARSER_DIR)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_sample_logs(self):
+        logs = find_logs('SAMPLE_DATA', '*.log')
+        self.assertTrue(logs)
+        with tempfile.TemporaryFile('w+') as output:
+            summary = run_batch(logs, 'STEP.ini', workers=2, output=output)
+            output.seek(0)
+            results = [json.loads(line) for line in output]
+        errors = dict((result['log'], result['error']) for result in results
+                      if result.get('status') == 'error')
+        self.assertEqual(errors, {})
+        self.assertEqual(summary['status'], {'ok': len(logs)})
+        self.assertEqual(summary['failed_logs'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
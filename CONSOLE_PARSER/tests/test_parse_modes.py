@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import copy
+import json
+import shutil
+import tempfile
+import unittest
+
+PARSER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PARSER_DIR)
+
+import bdsm
+from bdsm import BDSM, OPTIONS
+from msel import MemorySubsytemEventsLogger
+from registry import load_mission_plugins, mission_options
+
+from benchmark.conf import Conf
+
+# Two boot sessions, the node info is printed by the second one
+SAMPLE_LOG = os.path.join('SAMPLE_DATA', '4_RDIMMs_HEDetected_Device_Tagging_20181106-11:38-28.log')
+
+
+def plain(data):
+    return json.loads(json.dumps(data, default=str, sort_keys=True))
+
+
+class ParseModesTest(unittest.TestCase):
+    def setUp(self):
+        # Specs, grammar and configs are looked up in the parser directory
+        self.cwd = os.getcwd()
+        os.chdir(PARSER_DIR)
+        load_mission_plugins()
+        self.conf = Conf(mission_options(OPTIONS), 'STEP.ini', log=False)
+        self.conf['base']['result_cache_dir'] = ''
+        self.conf['base']['processor_workers'] = 0
+        self.ram_info = MemorySubsytemEventsLogger('MY81-EX0-Y3N')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        bdsm.environment.clear()
+
+    def parse(self, parse_name, *args):
+        """
+        Return the session results and the node state left by the parse
+        """
+        bdsm.environment.clear()
+        parser = BDSM(SAMPLE_LOG, self.conf, copy.deepcopy(self.ram_info))
+        session_results = getattr(parser, parse_name)(*args)
+        parser.dbg_log_data.close()
+        missions = dict((prefix, mission.checkpoint_state())
+                        for prefix, mission in parser.missions.items())
+        return plain({
+            'session_results': session_results,
+            'ram_info': vars(parser.ram_info),
+            'environment': bdsm.environment,
+            'missions': missions,
+            'completed': sorted(parser.scheduler.completed),
+        })
+
+    def test_result_cache(self):
+        serial = self.parse('parse_sessions', 1)
+        cache_dir = tempfile.mkdtemp()
+        try:
+            self.conf['base']['result_cache_dir'] = cache_dir
+            # Filled by the parallel parse, read by the serial one
+            for workers in (2, 1):
+                bdsm.environment.clear()
+                parser = BDSM(SAMPLE_LOG, self.conf, copy.deepcopy(self.ram_info))
+                session_results = parser.parse_cached(parser.parse_sessions, workers)
+                parser.dbg_log_data.close()
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertTrue(parser.results_cached)
+        self.assertEqual(plain(session_results), serial['session_results'])
+        self.assertEqual(plain(vars(parser.ram_info)), serial['ram_info'])
+        self.assertEqual(plain(bdsm.environment), serial['environment'])
+        # The restored DIMM info is a tree again
+        parser.ram_info['Socket 1']['0']['CL-RCD-RP-CMD'] = '15-15-15-1n'
+
+    def test_same_state(self):
+        serial = self.parse('parse_sessions', 1)
+        self.assertEqual(len(serial['session_results']), 2)
+        self.assertTrue(serial['ram_info']['dimm_info']['System'])
+        self.assertTrue(serial['environment'])
+        self.assertEqual(self.parse('parse_sessions', 2), serial)
+        self.assertEqual(self.parse('parse_debug_log_chunked', 2), serial)
+
+    def test_processor_worker(self):
+        serial = self.parse('parse_sessions', 1)
+        # The processors and the functions they unlock run in the worker
+        self.conf['base']['processor_workers'] = 1
+        self.assertEqual(self.parse('parse_sessions', 1), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import unittest
+
+PARSER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PARSER_DIR)
+
+from bdsm import BDSM, OPTIONS
+from logfile import MmapLogfile
+from msel import MemorySubsytemEventsLogger
+from registry import load_mission_plugins, mission_options
+
+from benchmark.conf import Conf
+
+SAMPLE_LOG = os.path.join('SAMPLE_DATA', '4_RDIMMs_HEDetected_Device_Tagging_20181106-11:38-28.log')
+
+
+class ParserCrash(Exception):
+    pass
+
+
+def crash_after(lines):
+    """
+    Live console feeding the lines, the parser dies on the next one
+    """
+    for line in lines:
+        yield line
+    # Buffered after the last checkpoint, it's lost with the crash
+    yield b'\r\n'
+    raise ParserCrash()
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        # Specs, grammar and configs are looked up in the parser directory
+        self.cwd = os.getcwd()
+        os.chdir(PARSER_DIR)
+        self.tmp_dir = tempfile.mkdtemp()
+        load_mission_plugins()
+        self.conf = Conf(mission_options(OPTIONS), 'STEP.ini', log=False)
+        self.conf['base'].update({
+            'checkpoint_file': os.path.join(self.tmp_dir, 'bdsm.ckpt'),
+            'checkpoint_interval': 0,
+            'checkpoint_overhead': float('inf'),
+            'result_cache_dir': '',
+        })
+        self.ram_info = MemorySubsytemEventsLogger('MY81-EX0-Y3N')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_resume_open_block_from_mmap(self):
+        with open(SAMPLE_LOG, 'rb') as sample:
+            lines = sample.readlines()
+        start = [i for i, line in enumerate(lines) if line.startswith(b'START_DIMMINFO_TABLE')][0]
+        # The checkpoint is taken in the middle of the DIMM info table
+        split = start + 20
+        log_path = os.path.join(self.tmp_dir, 'console.log')
+        with open(log_path, 'wb') as log:
+            log.writelines(lines[:split])
+
+        crashed = BDSM(log_path, self.conf, copy.deepcopy(self.ram_info))
+        crashed.data_source = 'das'
+        # Fed from the block start, the lines before have no checkpoint to wait for
+        crashed.dbg_log_data = crash_after(lines[start:split])
+        self.assertRaises(ParserCrash, crashed.parse_debug_log)
+        self.assertTrue(os.path.exists(self.conf['base']['checkpoint_file']))
+
+        # The console server saved the rest of the session
+        with open(log_path, 'wb') as log:
+            log.writelines(lines[split:])
+        parser = BDSM(log_path, self.conf, copy.deepcopy(self.ram_info))
+        self.assertTrue(isinstance(parser.dbg_log_data, MmapLogfile))
+        self.assertTrue(parser.resume(self.conf['base']['checkpoint_file']))
+        parser.parse_debug_log()
+        parser.dbg_log_data.close()
+
+        self.assertIn('process_dimm_info', parser.session_results[-1]['completed'])
+        self.assertTrue(parser.ram_info['System']['DDR Freq'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab
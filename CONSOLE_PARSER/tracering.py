@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger()
+
+# Trace levels: events are always kept in the ring, the ones of the level
+# and below are logged as they happen too
+TRACE_OFF = 0
+TRACE_EVENTS = 1
+TRACE_BLOCKS = 2
+TRACE_LINES = 3
+TRACE_LEVELS = {
+    'off': TRACE_OFF,
+    # block starts and ends, processors and supplementary functions
+    'events': TRACE_EVENTS,
+    # the lines of every ended block
+    'blocks': TRACE_BLOCKS,
+    # the block of every buffered line, slow
+    'lines': TRACE_LINES,
+}
+
+# Events kept in the ring, old ones are overwritten
+TRACE_RING_SIZE = 4096
+
+# Event -> (trace level logging it, message format of its arguments)
+TRACE_EVENTS_FORMATS = {
+    'session': (TRACE_EVENTS, "Boot session {0} is started"),
+    'block_start': (TRACE_EVENTS, "Block {0} is started"),
+    'block_end': (TRACE_EVENTS, "Block {0} is ended, {1} lines"),
+    'processor': (TRACE_EVENTS, "Block {1} is submitted to {0}"),
+    'supplementary': (TRACE_EVENTS, "Supplementary function {0}"),
+    'failed': (TRACE_EVENTS, "Function {0} failed: {1!r}"),
+    'fatal_error': (TRACE_EVENTS, "MRC fatal error in block {0}"),
+}
+
+
+def trace_level(name):
+    """
+    Trace level by its name, for the config option
+    """
+    try:
+        return TRACE_LEVELS[name.strip().lower()]
+    except KeyError:
+        raise ValueError("Unknown trace level {0}, one of: {1}".format(
+            name, ', '.join(sorted(TRACE_LEVELS, key=TRACE_LEVELS.get))))
+
+
+class TraceRing:
+    """
+    Last events of the parser kept in memory. Recording an event appends
+    the raw arguments, messages are formatted only for the enabled trace
+    level and when the ring is dumped (on a failure, a crash or SIGUSR1).
+    """
+    def __init__(self, size=TRACE_RING_SIZE, level=TRACE_OFF):
+        self.ring = deque(maxlen=size)
+        self.level = level
+        self.started = time.time()
+        # Events recorded, the ones out of the ring are lost
+        self.recorded = 0
+        self.lock = threading.RLock()
+
+    def __call__(self, event, *args):
+        self.ring.append((time.time(), event, args))
+        self.recorded += 1
+        if self.level >= TRACE_EVENTS_FORMATS[event][0]:
+            logger.debug("TRACE " + TRACE_EVENTS_FORMATS[event][1].format(*args))
+
+    def __len__(self):
+        return len(self.ring)
+
+    def block(self, block_name, block):
+        """
+        Log the lines of the ended block on the blocks trace level
+        """
+        if self.level >= TRACE_BLOCKS:
+            logger.debug("TRACE Block {0} buffer:\n{1}".format(block_name, block))
+
+    def messages(self):
+        """
+        Formatted events of the ring, the oldest first
+        """
+        for timestamp, event, args in list(self.ring):
+            yield "{0:10.3f} {1}".format(timestamp - self.started,
+                                         TRACE_EVENTS_FORMATS[event][1].format(*args))
+
+    def dump(self, reason, stream=None):
+        """
+        Write out the events of the ring to the stream or the log and clear
+        it, the next dump has only the newer events
+        """
+        with self.lock:
+            messages = list(self.messages())
+            self.ring.clear()
+        if not messages:
+            return
+        header = "Trace of the last {0} of {1} parser events ({2}):".format(
+            len(messages), self.recorded, reason)
+        if stream is not None:
+            stream.write(header + '\n' + ''.join(message + '\n' for message in messages))
+            stream.flush()
+        else:
+            logger.error(header + ''.join('\n    ' + message for message in messages))
+
+
+def install_dump_handlers(trace, dump_signal=getattr(signal, 'SIGUSR1', None)):
+    """
+    Dump the trace ring on the uncaught exceptions and on the signal (ring
+    of a running parser, it goes on parsing). Main thread only.
+    """
+    excepthook = sys.excepthook
+
+    def dump_on_crash(exc_type, value, tb):
+        if not issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+            trace.dump("crash: {0}".format(exc_type.__name__), sys.stderr)
+        excepthook(exc_type, value, tb)
+
+    def dump_on_signal(sig, frame):
+        trace.dump("signal {0}".format(sig), sys.stderr)
+
+    sys.excepthook = dump_on_crash
+    if dump_signal is not None:
+        signal.signal(dump_signal, dump_on_signal)
+        logger.debug("Send signal {0} to process {1} to dump the trace".format(
+            dump_signal, os.getpid()))
+
+# vim: tabstop=8 softtabstop=0 expandtab shiftwidth=4 smarttab